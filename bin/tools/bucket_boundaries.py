@@ -0,0 +1,124 @@
+#! /usr/bin/env python
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#pylint: disable=invalid-name
+"""
+Chooses bucket boundaries for parallel text files that minimize padding,
+and reports the expected padding ratio of the chosen and of given buckets.
+
+The printed boundaries can be passed to the --buckets flag of train.py.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import io
+
+import numpy as np
+import tensorflow as tf
+
+from seq2seq.data import length_index
+
+parser = argparse.ArgumentParser(
+    description="Choose bucket boundaries for parallel text files.")
+parser.add_argument(
+    "--source_files",
+    required=True,
+    help="Comma-separated source files or glob patterns.")
+parser.add_argument(
+    "--target_files",
+    default="",
+    help="Comma-separated target files or glob patterns, aligned with "
+    "source_files.")
+parser.add_argument(
+    "--source_delimiter", default=" ", help="Delimiter of the source tokens.")
+parser.add_argument(
+    "--target_delimiter", default=" ", help="Delimiter of the target tokens.")
+parser.add_argument(
+    "--num_buckets", type=int, default=5, help="Maximum number of buckets.")
+parser.add_argument(
+    "--by",
+    choices=["source", "max"],
+    default="source",
+    help="Bucket by the source length, or by the longer of source and target "
+    "as train.py does with --max_tokens_per_batch.")
+parser.add_argument(
+    "--compare",
+    default=None,
+    help="Comma-separated bucket boundaries to compare with, e.g. 10,20,30.")
+parser.add_argument(
+    "--histogram_file",
+    default=None,
+    help="Write the (source_len, target_len, count) histogram to this file.")
+parser.add_argument(
+    "--no_cache",
+    action="store_true",
+    help="Do not read or write the cached length index of the files.")
+
+
+def _expand(patterns):
+  files = []
+  for pattern in patterns.split(","):
+    if pattern.strip():
+      files.extend(sorted(tf.gfile.Glob(pattern.strip())))
+  return files
+
+
+def _format_boundaries(boundaries):
+  return ",".join(str(_) for _ in boundaries)
+
+
+def main():
+  args = parser.parse_args()
+  source_files = _expand(args.source_files)
+  target_files = _expand(args.target_files)
+
+  histogram = length_index.load_length_index(
+      source_files=source_files,
+      target_files=target_files,
+      source_delimiter=args.source_delimiter,
+      target_delimiter=args.target_delimiter,
+      use_cache=not args.no_cache)
+
+  if args.histogram_file:
+    with io.open(args.histogram_file, "w", encoding="utf-8") as file:
+      for source_len, target_len in np.argwhere(histogram):
+        file.write("{}\t{}\t{}\n".format(
+            source_len, target_len, histogram[source_len, target_len]))
+
+  counts = length_index.bucket_length_counts(histogram, args.by)
+  lengths = np.repeat(np.arange(len(counts)), counts)
+  print("examples: {}".format(len(lengths)))
+  print("{} length percentiles (50/90/99/max): {}".format(
+      args.by, [int(np.percentile(lengths, _)) for _ in [50, 90, 99, 100]]))
+
+  boundaries = length_index.choose_bucket_boundaries(counts, args.num_buckets)
+  print("no buckets: expected padding ratio {:.4f}".format(
+      length_index.expected_padding_ratio(histogram, [], args.by)))
+  if args.compare:
+    compare = [int(_) for _ in args.compare.split(",")]
+    print("buckets {}: expected padding ratio {:.4f}".format(
+        args.compare,
+        length_index.expected_padding_ratio(histogram, compare, args.by)))
+  print("buckets {}: expected padding ratio {:.4f}".format(
+      _format_boundaries(boundaries),
+      length_index.expected_padding_ratio(histogram, boundaries, args.by)))
+
+
+if __name__ == "__main__":
+  main()
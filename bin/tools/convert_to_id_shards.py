@@ -0,0 +1,75 @@
+#! /usr/bin/env python
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#pylint: disable=invalid-name
+"""
+Converts parallel text into pre-tokenized id shards that can be read by
+IdShardInputPipeline.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+
+import tensorflow as tf
+
+from seq2seq.data import id_shards
+from seq2seq.data.vocab import Vocab
+
+parser = argparse.ArgumentParser(
+    description="Convert parallel text into id shards.")
+parser.add_argument(
+    "--source_file", required=True, help="Source text, one example per line.")
+parser.add_argument(
+    "--target_file", default=None, help="Target text aligned with the source.")
+parser.add_argument(
+    "--vocab", required=True, help="Vocabulary file shared by source and target.")
+parser.add_argument(
+    "--output_prefix", required=True, help="Path prefix of the written shards.")
+parser.add_argument(
+    "--examples_per_shard",
+    type=int,
+    default=1000000,
+    help="Maximum number of examples per shard.")
+parser.add_argument(
+    "--sort_by_length",
+    action="store_true",
+    help="Sort the examples of every shard by length.")
+parser.add_argument(
+    "--source_delimiter", default=" ", help="Delimiter of the source tokens.")
+parser.add_argument(
+    "--target_delimiter", default=" ", help="Delimiter of the target tokens.")
+
+
+def main():
+  args = parser.parse_args()
+  tf.logging.set_verbosity(tf.logging.INFO)
+  prefixes = id_shards.convert_parallel_text(
+      source_file=args.source_file,
+      vocab_instance=Vocab(args.vocab),
+      output_prefix=args.output_prefix,
+      target_file=args.target_file,
+      examples_per_shard=args.examples_per_shard,
+      sort_by_length=args.sort_by_length,
+      source_delimiter=args.source_delimiter,
+      target_delimiter=args.target_delimiter)
+  print("Wrote {} shards: {}-*".format(len(prefixes), args.output_prefix))
+
+
+if __name__ == "__main__":
+  main()
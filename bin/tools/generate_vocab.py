@@ -18,10 +18,19 @@
 Generate vocabulary for a tokenized text file.
 """
 
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
 import sys
 import argparse
 import collections
-import logging
+
+import tensorflow as tf
+
+from seq2seq.data import vocab_builder
 
 parser = argparse.ArgumentParser(
     description="Generate vocabulary for a tokenized text file.")
@@ -44,10 +53,8 @@ parser.add_argument(
     default=False)
 parser.add_argument(
     "infile",
-    nargs="?",
-    type=argparse.FileType("r"),
-    default=sys.stdin,
-    help="Input tokenized text file to be processed.")
+    nargs="*",
+    help="Input tokenized text files to be processed, stdin if none is given.")
 parser.add_argument(
     "--delimiter",
     dest="delimiter",
@@ -55,40 +62,62 @@ parser.add_argument(
     default=" ",
     help="Delimiter character for tokenizing. Use \" \" and \"\" for word and char level respectively."
 )
+parser.add_argument(
+    "--num_workers",
+    type=int,
+    default=None,
+    help="Number of processes counting input files, defaults to the number of CPUs.")
+parser.add_argument(
+    "--sketch_width",
+    type=int,
+    default=None,
+    help="Count with a count-min sketch of this width to bound the memory. "
+    "Counts are then upper bounds.")
+parser.add_argument(
+    "--sketch_depth",
+    type=int,
+    default=4,
+    help="Number of hash functions of the count-min sketch.")
+parser.add_argument(
+    "--filter_alphabet",
+    action="store_true",
+    help="Drop tokens that contain an ASCII letter.")
+parser.add_argument(
+    "--filter_number",
+    action="store_true",
+    help="Drop tokens that contain an ASCII digit.")
 args = parser.parse_args()
+tf.logging.set_verbosity(tf.logging.INFO)
 
-# Counter for all tokens in the vocabulary
-cnt = collections.Counter()
-
-for line in args.infile:
-  if args.downcase:
-    line = line.lower()
-  if args.delimiter == "":
-    tokens = list(line.strip())
-  else:
-    tokens = line.strip().split(args.delimiter)
-  tokens = [_ for _ in tokens if len(_) > 0]
-  cnt.update(tokens)
-
-logging.info("Found %d unique tokens in the vocabulary.", len(cnt))
+filter_pattern = vocab_builder.char_filter_pattern(args.filter_alphabet,
+                                                   args.filter_number)
 
-# Filter tokens below the frequency threshold
-if args.min_frequency > 0:
-  filtered_tokens = [(w, c) for w, c in cnt.most_common()
-                     if c > args.min_frequency]
-  cnt = collections.Counter(dict(filtered_tokens))
+if args.infile:
+  counts = vocab_builder.count_tokens(
+      args.infile,
+      delimiter=args.delimiter,
+      downcase=args.downcase,
+      filter_pattern=filter_pattern,
+      num_workers=args.num_workers,
+      sketch_width=args.sketch_width,
+      sketch_depth=args.sketch_depth,
+      max_candidates=max(args.max_vocab_size or 0, 1000000))
+else:
+  # Counter for all tokens in the vocabulary
+  cnt = collections.Counter()
+  stdin = io.open(sys.stdin.fileno(), "r", encoding="utf-8", closefd=False)
+  for line in stdin:
+    vocab_builder.count_text(line, args.delimiter, args.downcase, cnt)
+  counts = dict(vocab_builder.drop_filtered(cnt, filter_pattern))
 
-logging.info("Found %d unique tokens with frequency > %d.",
-             len(cnt), args.min_frequency)
+tf.logging.info("Found %d unique tokens in the vocabulary.", len(counts))
 
-# Sort tokens by 1. frequency 2. lexically to break ties
-word_with_counts = cnt.most_common()
-word_with_counts = sorted(
-    word_with_counts, key=lambda x: (x[1], x[0]), reverse=True)
+# Sort tokens by 1. frequency 2. lexically to break ties, take only max-vocab
+word_with_counts = vocab_builder.select_words(counts, args.min_frequency,
+                                              args.max_vocab_size)
 
-# Take only max-vocab
-if args.max_vocab_size is not None:
-  word_with_counts = word_with_counts[:args.max_vocab_size]
+tf.logging.info("Found %d unique tokens with frequency > %d.",
+                len(word_with_counts), args.min_frequency)
 
 for word, count in word_with_counts:
   print("{}\t{}".format(word, count))
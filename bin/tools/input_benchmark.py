@@ -0,0 +1,169 @@
+#! /usr/bin/env python
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#pylint: disable=invalid-name
+"""
+Measures the examples/sec, tokens/sec, padding ratio and time per example of
+the read, decode, vocabulary lookup and batching stages of an input pipeline,
+without a model. Comma-separated values of the sweep arguments are all
+combined, e.g. to compare thread counts or bucket boundaries.
+
+If the batch stage is not much slower than training steps of the model,
+training is bound by the input.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import itertools
+import os
+
+import tensorflow as tf
+import yaml
+
+from seq2seq.data import input_pipeline
+from seq2seq.training import input_benchmark
+
+parser = argparse.ArgumentParser(
+    description="Measure the throughput of an input pipeline.")
+parser.add_argument(
+    "--input_pipeline",
+    required=True,
+    help="YAML definition of the input pipeline, as in the "
+    "--input_pipeline_train flag of train.py, or a YAML file containing it.")
+parser.add_argument(
+    "--mode",
+    choices=["train", "eval", "infer"],
+    default="train",
+    help="The mode the pipeline is created for.")
+parser.add_argument(
+    "--stages",
+    default=",".join(input_benchmark.STAGES),
+    help="Comma-separated stages to run.")
+parser.add_argument(
+    "--num_examples",
+    type=int,
+    default=20000,
+    help="Number of examples read by every stage.")
+parser.add_argument(
+    "--batch_size", type=int, default=32, help="Batch size of the batch stage.")
+parser.add_argument(
+    "--max_tokens_per_batch",
+    type=int,
+    default=None,
+    help="Token budget of the batches, requires --buckets.")
+parser.add_argument(
+    "--max_length",
+    type=int,
+    default=None,
+    help="Length the model truncates sequences to, which sizes the last "
+    "bucket of a token budget.")
+parser.add_argument(
+    "--vocab_source",
+    default=None,
+    help="Source vocabulary of the lookup stage and of the batch stage.")
+parser.add_argument(
+    "--vocab_target",
+    default=None,
+    help="Target vocabulary of the lookup stage and of the batch stage.")
+parser.add_argument(
+    "--input_engine",
+    default="",
+    help="Sweep: comma-separated input_pipeline params, queue or dataset.")
+parser.add_argument(
+    "--num_parallel_calls",
+    default="",
+    help="Sweep: comma-separated num_parallel_calls params.")
+parser.add_argument(
+    "--num_readers",
+    default="",
+    help="Sweep: comma-separated num_readers params.")
+parser.add_argument(
+    "--buckets",
+    default="",
+    help="Sweep: semicolon-separated bucket boundaries, e.g. "
+    "\"none;10,20,30\". \"none\" disables bucketing.")
+
+
+def _load_pipeline_def(value):
+  if os.path.exists(value):
+    with tf.gfile.GFile(value) as file:
+      value = file.read()
+  return yaml.load(value)
+
+
+def _sweep(value, cast):
+  if not value:
+    return [None]
+  return [cast(_.strip()) for _ in value.split(",") if _.strip()]
+
+
+def _buckets(value):
+  if value.strip().lower() in ["", "none"]:
+    return None
+  return [int(_) for _ in value.split(",")]
+
+
+def main():
+  args = parser.parse_args()
+  tf.logging.set_verbosity(tf.logging.WARN)
+  pipeline_def = _load_pipeline_def(args.input_pipeline)
+  mode = {
+      "train": tf.contrib.learn.ModeKeys.TRAIN,
+      "eval": tf.contrib.learn.ModeKeys.EVAL,
+      "infer": tf.contrib.learn.ModeKeys.INFER
+  }[args.mode]
+  stages = [_.strip() for _ in args.stages.split(",") if _.strip()]
+  bucket_sweep = [None]
+  if args.buckets:
+    bucket_sweep = [_buckets(_) for _ in args.buckets.split(";")]
+
+  for engine, num_parallel_calls, num_readers, buckets in itertools.product(
+      _sweep(args.input_engine, str), _sweep(args.num_parallel_calls, int),
+      _sweep(args.num_readers, int), bucket_sweep):
+    overrides = {}
+    for key, value in [("input_pipeline", engine),
+                       ("num_parallel_calls", num_parallel_calls),
+                       ("num_readers", num_readers)]:
+      if value is not None:
+        overrides[key] = value
+    pipeline = input_pipeline.make_input_pipeline_from_def(
+        pipeline_def, mode, **overrides)
+
+    print("{} input_pipeline={} num_parallel_calls={} num_readers={} "
+          "buckets={}".format(
+              pipeline.__class__.__name__, pipeline.params["input_pipeline"],
+              pipeline.params["num_parallel_calls"],
+              pipeline.params["num_readers"],
+              ",".join(str(_) for _ in buckets) if buckets else "none"))
+    results = input_benchmark.benchmark(
+        pipeline,
+        args.num_examples,
+        stages=stages,
+        batch_size=args.batch_size,
+        bucket_boundaries=buckets,
+        max_tokens_per_batch=args.max_tokens_per_batch,
+        max_length=args.max_length,
+        vocab_source=args.vocab_source,
+        vocab_target=args.vocab_target)
+    print(input_benchmark.format_results(results))
+    print()
+
+
+if __name__ == "__main__":
+  main()
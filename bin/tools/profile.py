@@ -41,6 +41,8 @@ from seq2seq.decoders.attention import att_sum_bahdanau, att_sum_dot
 
 
 tf.flags.DEFINE_string("model_dir", None, "path to model directory")
+tf.flags.DEFINE_integer("graph_def_top_nodes", 10,
+                        "number of largest GraphDef nodes to report")
 
 FLAGS = tf.flags.FLAGS
 CUSTOM_OP_FUNCTIONS = [att_sum_bahdanau, att_sum_dot]
@@ -80,6 +82,8 @@ def load_metadata(model_dir):
         text_format.Parse(file.read(), graph_def)
       tf.import_graph_def(graph_def, name="")
       print("Loaded Graph from {}".format(graph_def_path))
+    graph_def_size_report(graph_def, gfile.Stat(graph_def_path).length,
+                          FLAGS.graph_def_top_nodes)
   else:
     print("Graph does not exist a {}. Skipping.".format(graph_def_path))
 
@@ -96,6 +100,17 @@ def load_metadata(model_dir):
   return run_meta, graph, op_log
 
 
+def graph_def_size_report(graph_def, text_size, top_nodes=10):
+  """Prints the size of a GraphDef and its largest nodes, e.g. constants
+  that embed a vocabulary.
+  """
+  print("GraphDef: {} nodes, {} bytes serialized, {} bytes as text".format(
+      len(graph_def.node), graph_def.ByteSize(), text_size))
+  nodes = sorted(graph_def.node, key=lambda node: node.ByteSize(), reverse=True)
+  for node in nodes[:top_nodes]:
+    print("  {:>12} bytes  {:<24} {}".format(node.ByteSize(), node.op, node.name))
+
+
 def merge_default_with_oplog(graph, op_log=None, run_meta=None):
   """Monkeypatch. There currently is a bug in tfprof_logger that
     prevents it from being used with Python 3. So we override the method
@@ -27,6 +27,7 @@ import tempfile
 import json
 import yaml
 import glob
+from pydoc import locate
 
 import seq2seq.contrib
 from seq2seq.contrib import estimator as Estimator
@@ -43,6 +44,7 @@ from seq2seq.contrib.experiment import Experiment as PatchedExperiment
 from seq2seq.configurable import _maybe_load_yaml, _create_from_dict
 from seq2seq.configurable import _deep_merge_dict
 from seq2seq.data import input_pipeline
+from seq2seq.data import length_index
 from seq2seq.metrics import metric_specs
 from seq2seq.training import hooks
 from seq2seq.training import utils as training_utils
@@ -87,8 +89,21 @@ tf.flags.DEFINE_string("buckets", None,
                        A comma-separated list of sequence length buckets, e.g.
                        "10,20,30" would result in 4 buckets:
                        <10, 10-20, 20-30, >30. None disabled bucketing. """)
+tf.flags.DEFINE_integer("auto_buckets", None,
+                        """If set, chooses at most this many buckets that
+                        minimize the padding of the training files, from their
+                        cached length index. Overrides buckets.""")
 tf.flags.DEFINE_integer("batch_size", 16,
                         """Batch size used for training and evaluation.""")
+tf.flags.DEFINE_integer("max_tokens_per_batch", None,
+                        """If set, training batches are built from a budget of
+                        padded source and target tokens instead of batch_size.
+                        Each bucket gets its own batch size, requires
+                        buckets.""")
+tf.flags.DEFINE_boolean("save_input_position", True,
+                        """Save the position of the training input with the
+                        checkpoints and resume from it after a restart. Only
+                        used with the dataset input_pipeline.""")
 tf.flags.DEFINE_string("output_dir", None,
                        """The directory to write model checkpoints and summaries
                        to. If None, a local temporary directory is created.""")
@@ -259,12 +274,47 @@ def create_experiment(output_dir):
   train_input_pipeline = input_pipeline.make_input_pipeline_from_def(
       def_dict=FLAGS.input_pipeline_train,
       mode=tf.contrib.learn.ModeKeys.TRAIN)
+  save_input_position = (FLAGS.save_input_position and
+                         train_input_pipeline.saves_position)
+  # A saved position can only be resumed if the shuffling is the same after
+  # the restart, so shuffle reproducibly and differently on every worker
+  # unless the pipeline has a seed
+  if save_input_position and train_input_pipeline.params["seed"] is None:
+    train_input_pipeline = input_pipeline.make_input_pipeline_from_def(
+        def_dict=FLAGS.input_pipeline_train,
+        mode=tf.contrib.learn.ModeKeys.TRAIN,
+        seed=(FLAGS.tf_random_seed or 0) + (config.task_id or 0))
+
+  if FLAGS.auto_buckets:
+    bucket_boundaries, padding_ratio = length_index.auto_bucket_boundaries(
+        train_input_pipeline.params,
+        num_buckets=FLAGS.auto_buckets,
+        by="max" if FLAGS.max_tokens_per_batch else "source")
+    tf.logging.info("Automatic buckets %s, expected padding ratio %.4f",
+                    bucket_boundaries, padding_ratio)
+
+  # The model truncates longer sequences, which bounds the last bucket of a
+  # token budget
+  max_length = None
+  if FLAGS.max_tokens_per_batch:
+    model_class = locate(train_options.model_class) or \
+      getattr(models, train_options.model_class)
+    model_params = _deep_merge_dict(
+        model_class.default_params(), train_options.model_params or {})
+    seq_lens = [model_params.get(_) for _ in
+                ["source.max_seq_len", "target.max_seq_len"]]
+    seq_lens = [_ for _ in seq_lens if _ is not None]
+    if seq_lens:
+      max_length = max(seq_lens)
 
   # Create training input function
   train_input_fn = training_utils.create_input_fn(
       pipeline=train_input_pipeline,
       batch_size=FLAGS.batch_size,
       bucket_boundaries=bucket_boundaries,
+      max_tokens_per_batch=FLAGS.max_tokens_per_batch,
+      max_length=max_length,
+      save_position=save_input_position,
       scope="train_input_fn")
 
   # Development data input pipeline
@@ -318,6 +368,19 @@ def create_experiment(output_dir):
         model_dir=estimator.model_dir,
         run_config=config)
     train_hooks.append(hook)
+  if save_input_position:
+    position_hook = hooks.InputPositionHook(
+        params={}, model_dir=estimator.model_dir, run_config=config)
+    train_hooks.append(position_hook)
+    # The chief saves the input position with every model checkpoint, this
+    # hook replaces the checkpoint hook of the estimator
+    if config.is_chief and (config.save_checkpoints_secs or
+                            config.save_checkpoints_steps):
+      train_hooks.append(tf.train.CheckpointSaverHook(
+          estimator.model_dir,
+          save_secs=config.save_checkpoints_secs,
+          save_steps=config.save_checkpoints_steps,
+          listeners=[position_hook.saver_listener()]))
   if FLAGS.debug:
     train_hooks.append(debug_hook)
 
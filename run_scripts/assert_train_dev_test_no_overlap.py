@@ -3,9 +3,13 @@
 import os
 import click
 import codecs
+import multiprocessing
+import numpy as np
 import utils
 from collections import OrderedDict
 
+from seq2seq.data import fingerprint
+
 def get_q2q_dict(path):
   q2q_dict = OrderedDict()
   all_paths = utils.get_dir_or_file_path(path)
@@ -37,40 +41,76 @@ def No_key_Overlap(d1, d2):
     return False
   return True
 
+def _split_paths(paths):
+  if type(paths) not in (tuple, list):
+    paths = [paths]
+  all_paths = []
+  for path in paths:
+    all_paths.extend(sorted(utils.get_dir_or_file_path(path)))
+  return all_paths
+
 @click.command()
 @click.argument("train_paths", nargs=-1)
 @click.argument("dev_paths", nargs=1)
 @click.argument("test_paths", nargs=1)
-def check_no_overlap(train_paths, dev_paths, test_paths):
-  def ques_set(paths):
-    keys = set()
-    if type(paths) not in (tuple, list):
-      paths = [paths]
-    for path in paths:
-      for line in codecs.open(path, "r", "utf_8"):
-        keys.add(line.strip())
-    return keys
-  train_keys = ques_set(train_paths)
-  dev_keys = ques_set(dev_paths)
-  test_keys = ques_set(test_paths)
-  x = train_keys.intersection(dev_keys)
-  if len(x) > 0:
-    print("train overlap with dev:")
-    print("\n".join(list(x)))
-  else:
-    print("train No dev")
-  y = train_keys.intersection(test_keys)
-  if len(y) > 0:
-    print("train overlap with test:")
-    print("\n".join(list[y]))
-  else:
-    print("train No test")
-  z = dev_keys.intersection(test_keys)
-  if len(z) > 0:
-    print("dev with test:")
-    print("\n".join(list(z)))
-  else:
-    print("dev No test")
+@click.option("--split_fields", is_flag=True, help="compare every tab separated field instead of whole lines")
+@click.option("--remove", is_flag=True, help="write <path>.new of train/dev without lines overlapping dev/test")
+@click.option("--dedup", is_flag=True, help="with --remove, also drop repeated lines inside every split")
+@click.option("--show", type=int, default=10, help="overlapping lines to print per split pair")
+@click.option("--num_workers", type=int, default=multiprocessing.cpu_count(), help="worker processes")
+def check_no_overlap(train_paths, dev_paths, test_paths, split_fields=False, remove=False, dedup=False, show=10,
+                     num_workers=None):
+  """compare normalized line fingerprints (SEQUENCE_END and whitespace removed) of train, dev and test"""
+  split_paths = OrderedDict([("train", _split_paths(train_paths)), ("dev", _split_paths(dev_paths)),
+                             ("test", _split_paths(test_paths))])
+  all_paths = [path for paths in split_paths.values() for path in paths]
+  all_files = dict(zip(all_paths, fingerprint.fingerprint_files(all_paths, num_workers=num_workers)))
+  split_files = OrderedDict((name, [all_files[path] for path in paths]) for name, paths in split_paths.items())
+  split_keys = OrderedDict((name, fingerprint.unique_fingerprints(files, split_fields))
+                           for name, files in split_files.items())
+  split_duplicated = OrderedDict((name, fingerprint.duplicated_lines(files)) for name, files in split_files.items())
+
+  for name, files in split_files.items():
+    num_lines = sum(int(f.non_empty.sum()) for f in files)
+    num_duplicated = sum(int((d & f.non_empty).sum()) for f, d in zip(files, split_duplicated[name]))
+    print("{}: {} lines, {} unique keys, {} repeated lines".format(name, num_lines, len(split_keys[name]),
+                                                                   num_duplicated))
+
+  names = list(split_files.keys())
+  for i, name in enumerate(names):
+    for other in names[i + 1:]:
+      common = np.intersect1d(split_keys[name], split_keys[other], assume_unique=True)
+      if len(common) == 0:
+        print("{} No {}".format(name, other))
+        continue
+      print("{} overlap with {}: {} keys".format(name, other, len(common)))
+      shown = []
+      for f in split_files[other]:
+        if len(shown) >= show:
+          break
+        mask = fingerprint.overlapping_lines(f, common, split_fields)
+        shown.extend(fingerprint.read_lines(f.path, mask, show - len(shown)))
+      if shown:
+        print("\n".join(shown))
+
+  if not remove:
+    return
+  for i, name in enumerate(names):
+    files = split_files[name]
+    keeps = [f.non_empty.copy() for f in files]
+    later_keys = [split_keys[other] for other in names[i + 1:]]
+    if later_keys:
+      exclude = np.unique(np.concatenate(later_keys))
+      keeps = [k & ~fingerprint.overlapping_lines(f, exclude, split_fields) for k, f in zip(keeps, files)]
+    elif not dedup:
+      continue
+    if dedup:
+      keeps = [k & ~d for k, d in zip(keeps, split_duplicated[name])]
+    paths = [f.path for f in files]
+    save_paths = [path + ".new" for path in paths]
+    num_written = fingerprint.write_lines(paths, save_paths, keeps, num_workers=num_workers)
+    for path, save_path, keep, written in zip(paths, save_paths, keeps, num_written):
+      print("save {} of {} lines to {}".format(written, len(keep), save_path))
 
 if __name__ == "__main__":
-  check_no_overlap()
\ No newline at end of file
+  check_no_overlap()
@@ -10,8 +10,11 @@ import os
 import codecs
 import json
 import click
+import numpy as np
 import utils
 
+from seq2seq.data import fingerprint
+
 """
 1. 过滤问题： filter_questions
 2. 给定了相似度的json文件，过滤相似度低的预测对，filter_low_sim_from_json
@@ -70,14 +73,9 @@ def filter_questions(path,save_path, least_token_num=3, max_token_num=15):
 @click.option("--res_ques_path",type=str, default=None, help="remain ques not done")
 def merge_and_unique_pred_result(pred_dirs, save_path, all_ques_path_or_dir, unk_path=None, res_ques_path=None):
   all_ques_paths = utils.get_dir_or_file_path(all_ques_path_or_dir)
-  print("getting ques set")
-  ques_set = set()
-  for ques_path in all_ques_paths:
-    print("reading from {}".format(ques_path))
-    lines = codecs.open(ques_path, "r", "utf-8").readlines()
-    for line in lines:
-      ques_set.add(line.strip())
-  print("all ques num: {}".format(len(ques_set)))
+  print("getting ques fingerprints")
+  ques_files = fingerprint.fingerprint_files(all_ques_paths)
+  print("all ques num: {}".format(len(fingerprint.unique_fingerprints(ques_files))))
   all_pred_path = []
   for pred_dir in pred_dirs:
     all_pred_path.extend(utils.get_dir_or_file_path(pred_dir))
@@ -92,12 +90,13 @@ def merge_and_unique_pred_result(pred_dirs, save_path, all_ques_path_or_dir, unk
   with click.progressbar(all_pred_path,label="reading pred path") as bar:
     for pred_path in bar:
       source_list, pred_list = utils.read_pred_result(pred_path)
-      for source, pred in zip(source_list, pred_list):
+      source_keys = fingerprint.fingerprint_lines(source_list).line_fingerprints.tolist()
+      for source, pred, source_key in zip(source_list, pred_list, source_keys):
         if source == pred:
           pred_same_with_source_cnt += 1
           continue
-        if source not in done_ques:
-          done_ques.add(source)
+        if source_key not in done_ques:
+          done_ques.add(source_key)
           done_cnt += 1
           wst = "\n".join([source, pred]) + "\n\n"
           if unk_path is not None:
@@ -113,12 +112,15 @@ def merge_and_unique_pred_result(pred_dirs, save_path, all_ques_path_or_dir, unk
   print("rewrite same ques num: {}".format(pred_same_with_source_cnt))
   print("rewrite ques num: {}".format(done_cnt))
 
-  res_ques = ques_set - done_ques
-  print("remain ques num: {}".format(len(res_ques)))
+  done_keys = np.unique(np.array(list(done_ques), dtype=np.uint64))
+  res_masks = [f.non_empty & ~d & ~fingerprint.overlapping_lines(f, done_keys)
+               for f, d in zip(ques_files, fingerprint.duplicated_lines(ques_files))]
+  print("remain ques num: {}".format(sum(int(m.sum()) for m in res_masks)))
   if res_ques_path is not None:
     with codecs.open(res_ques_path, "w", "utf-8") as f:
-      for res_que in res_ques:
-        f.write(res_que + "\n")
+      for ques_file, res_mask in zip(ques_files, res_masks):
+        for res_que in fingerprint.read_lines(ques_file.path, res_mask):
+          f.write(res_que.strip() + "\n")
     print("save res ques to {}".format(res_ques_path))
 
 @click.command()
@@ -155,37 +157,17 @@ def filter_low_sim_from_json(json_path, save_path=None, sim_threshold=0.95):
 @click.argument("dev_path")
 @click.argument("test_path")
 def unique_train_dev_test(source_path_or_dir, dev_path, test_path):
+  """drop train pairs with a question(normalized by split_join) in dev or test, save to <path>.new"""
   source_paths = utils.get_dir_or_file_path(source_path_or_dir)
+  dev_test_keys = fingerprint.unique_fingerprints(fingerprint.fingerprint_files([test_path, dev_path]), fields=True)
 
-  def flat_to_set(path):
-    lines = codecs.open(path, "r", "utf-8").readlines()
-    x = set()
-    for line in lines:
-      t = line.strip().split("\t")
-      for s in t:
-        x.add(s.strip())
-    return x
-  test_ques_set = flat_to_set(test_path)
-  dev_ques_set = flat_to_set(dev_path)
-
-  for source_path in source_paths:
-    cnt = 0
-    source_fin = codecs.open(source_path, "r", "utf-8")
-    new_path = source_path + ".new"
-    fout = codecs.open(new_path, "w", "utf-8")
-    for line in source_fin:
-      st = line.strip().split("\t")
-      s , t = st[0].strip(), st[1].strip()
-      if s in test_ques_set or s in dev_ques_set:
-        cnt += 1
-        continue
-      if t in test_ques_set or t in dev_ques_set:
-        cnt += 1
-        continue
-      fout.write("\t".join([s, t]) + "\n")
-    fout.close()
+  source_files = fingerprint.fingerprint_files(source_paths)
+  keeps = [f.non_empty & ~fingerprint.overlapping_lines(f, dev_test_keys, fields=True) for f in source_files]
+  new_paths = [source_path + ".new" for source_path in source_paths]
+  fingerprint.write_lines(source_paths, new_paths, keeps)
+  for source_path, new_path, source_file, keep in zip(source_paths, new_paths, source_files, keeps):
     print("save to {}".format(new_path))
-    print("filter {} pairs in {}".format(cnt, source_path))
+    print("filter {} pairs in {}".format(int((source_file.non_empty & ~keep).sum()), source_path))
 
 cli.add_command(filter_questions)
 cli.add_command(filter_low_sim_from_json)
@@ -1,53 +1,43 @@
 # -*- coding: utf-8 -*-
 
-import os
-import sys
-import codecs
+import json
 import click
+import multiprocessing
+import numpy as np
 import utils
-import pandas as pd
+
+from seq2seq.data import corpus_stats
+from seq2seq.data import length_index
 
 
 @click.command()
 @click.argument("path_or_dir")
-@click.option("--result_path", default=None, help="save_result path")
-def stat_parallel_dataset(path_or_dir, result_path=None):
+@click.option("--result_path", default=None, help="save_result path, json")
+@click.option("--vocab_path", default=None, help="compute source/target oov rate against this vocab")
+@click.option("--vocab_size", type=int, default=None, help="max vocab size including special words")
+@click.option("--delimiter", default=" ", help="token delimiter")
+@click.option("--max_length", type=int, default=1024, help="largest length with its own histogram bin")
+@click.option("--num_buckets", type=int, default=0, help="if > 1, choose this many buckets by source length")
+@click.option("--num_workers", type=int, default=multiprocessing.cpu_count(), help="worker processes")
+def stat_parallel_dataset(path_or_dir, result_path=None, vocab_path=None, vocab_size=None, delimiter=" ",
+                          max_length=1024, num_buckets=0, num_workers=None):
   paths = utils.get_dir_or_file_path(path_or_dir)
-  vocab_dict = set()
-  s_len = []
-  t_len = []
-  overlap = []
-  for i, path in enumerate(paths):
-    print("reading from {}".format(path))
-    f = codecs.open(path, "r", "utf-8")
-    for line in f:
-      if not line:
-        break
-      try:
-        s, t = line.strip().split("\t")
-      except Exception:
-        continue
-      s_token = s.strip().split(" ")
-      t_token = t.strip().split(" ")
-      s_len.append(len(s_token))
-      t_len.append(len(t_token))
-      ov = 0
-      for x in s_token:
-        if x in t_token:
-          ov += 1
-      overlap.append(ov)
-      for x in s_token:
-        vocab_dict.add(x)
-      for x in t_token:
-        vocab_dict.add(x)
-  vocab_size = len(vocab_dict)
-  result = {
-    "vocab_size": vocab_size,
-    "s_ave_len": sum(s_len) / float(len(s_len)),
-    "t_ave_len": sum(t_len) / float(len(t_len)),
-    "ave_overlap": sum(overlap) / float(len(overlap))
-  }
-  print(result)
+  print("reading from {}".format(" ".join(paths)))
+  stats = corpus_stats.compute_corpus_stats(paths, delimiter=delimiter, vocab_path=vocab_path,
+                                            vocab_size=vocab_size, num_workers=num_workers,
+                                            max_length=max_length)
+  result = stats.to_dict(with_oov=vocab_path is not None)
+  if num_buckets > 1:
+    # the source pipeline appends SEQUENCE_END, so pipeline lengths are shifted by one
+    length_counts = np.concatenate([[0], stats.source_length.counts[:-1]])
+    result["source_bucket_boundaries"] = length_index.choose_bucket_boundaries(length_counts, num_buckets)
+  print(json.dumps({k: v for k, v in result.items() if not isinstance(v, dict)}, indent=2, sort_keys=True))
+  for key in ["source_length", "target_length", "overlap"]:
+    print("{}: mean {:.2f}, max {}, percentiles {}".format(
+      key, result[key]["mean"], result[key]["max"], result[key]["percentiles"]))
+  if result_path is not None:
+    utils.jsonWrite(result, result_path)
+    print("write stats to {}".format(result_path))
 
   return result
 
@@ -17,72 +17,30 @@ import charset
 
 
 def generate_vocab(source_paths, save_path, delimiter=" ", max_vocab_size=150000, min_freq=10,
-                   filter_en=True, filter_num=True, verb=True):
+                   filter_en=True, filter_num=True, verb=True, num_workers=None, sketch_width=None):
+  """count tokens of source_paths with a process pool, drop words with english letters/numbers and
+  multi-char words with chinese punctuations(solve 。榜样), keep words with count > min_freq"""
+  from seq2seq.data import vocab_builder
 
-  # Counter for all tokens in the vocabulary
-  vocab_cnt = collections.Counter()
+  punctuations = charset.chinese_punctuations if filter_en or filter_num else None
+  filter_pattern = vocab_builder.char_filter_pattern(filter_en, filter_num, punctuations)
+  counts = vocab_builder.count_tokens(source_paths, delimiter=delimiter, filter_pattern=filter_pattern,
+                                      num_workers=num_workers, sketch_width=sketch_width,
+                                      max_candidates=max(max_vocab_size or 0, 1000000))
+  logging.info("Found %d unique tokens in the vocabulary.", len(counts))
 
-  for i, path in enumerate(source_paths):
-    f = codecs.open(path, "r", "utf-8")
-    while True:
-      line = f.readline()
-      if not line:
-        break
-      if delimiter == "":
-        tokens = list(line.strip())
-      else:
-        tokens = line.strip().split(delimiter)
-      tokens = [_ for _ in tokens if len(_) > 0]
-      vocab_cnt.update(tokens)
-
-  ##filter vocab
-  if filter_en is True or filter_num is True:
-    new_vocab_cnt = collections.Counter()
-    for word in vocab_cnt:
-      skip = False
-      for index, char in enumerate(word):
-        if filter_en and charset.is_alphabet(char):
-          skip = True
-        elif filter_num and charset.is_number(char):
-          skip = True
-        elif charset.is_chinese_punctuation(char):  ##solve 。榜样
-          if len(word) > 1:
-            print("{} is not right".format(word))
-            skip = True
-        if skip is True:
-          break
-      if skip is False:
-        new_vocab_cnt[word] = vocab_cnt[word]
-    vocab_cnt = new_vocab_cnt
-
-  logging.info("Found %d unique tokens in the vocabulary.", len(vocab_cnt))
-
-  # Filter tokens below the frequency threshold
-  if min_freq > 0:
-    filtered_tokens = [(w, c) for w, c in vocab_cnt.most_common()
-                       if c > min_freq]
-    cnt = collections.Counter(dict(filtered_tokens))
+  # Filter tokens below the frequency threshold, sort tokens by 1. frequency 2. lexically to break ties
+  # and take only max-vocab
+  word_with_counts = vocab_builder.select_words(counts, min_freq, max_vocab_size)
 
   logging.info("Found %d unique tokens with frequency > %d.",
-               len(vocab_cnt), min_freq)
-
-  # Sort tokens by 1. frequency 2. lexically to break ties
-  word_with_counts = vocab_cnt.most_common()
-  word_with_counts = sorted(
-      word_with_counts, key=lambda x: (x[1], x[0]), reverse=True)
-
-  # Take only max-vocab
-  if max_vocab_size is not None:
-    word_with_counts = word_with_counts[:max_vocab_size]
+               len(word_with_counts), min_freq)
 
   if save_path is not None:
     save_path = os.path.abspath(save_path)
     if os.path.exists(os.path.dirname(save_path)) == False:
         os.makedirs(os.path.dirname(save_path))
-    with codecs.open(save_path, "w", "utf-8") as f:
-      for word, count in word_with_counts:
-        # print("{}\t{}".format(word, count))
-        f.write("{}\t{}\n".format(word, count))
+    vocab_builder.write_vocab(word_with_counts, save_path)
     print("generate vocab path {}".format(save_path))
   return word_with_counts
 
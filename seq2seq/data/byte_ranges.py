@@ -0,0 +1,64 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Splits text files into byte ranges that worker processes read
+independently.
+
+A line belongs to the range it starts in, so the lines of all ranges of a
+file are the lines of the file, each exactly once and in order.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import os
+
+
+def split_into_ranges(paths, range_bytes):
+  """Splits files into byte ranges of at most range_bytes, as a list of
+  (path, start, end) tuples, sorted by path."""
+  ranges = []
+  for path in sorted(paths):
+    size = os.path.getsize(path)
+    for start in range(0, size, range_bytes):
+      ranges.append((path, start, min(start + range_bytes, size)))
+  return ranges
+
+
+def read_range(path, start, end):
+  """Returns the text of the lines of a file that start in [start, end)."""
+  with io.open(path, "rb") as file:
+    if start > 0:
+      # The line that started in the previous range belongs to it
+      file.seek(start - 1)
+      file.readline()
+    position = file.tell()
+    if position >= end:
+      return ""
+    data = file.read(end - position)
+    if not data.endswith(b"\n"):
+      data += file.readline()
+  return data.decode("utf-8")
+
+
+def iter_range_lines(path, start, end):
+  """Yields the lines of a file that start in [start, end), with their
+  newline."""
+  lines = read_range(path, start, end).split("\n")
+  for line in lines[:-1]:
+    yield line + "\n"
+  if lines[-1]:
+    yield lines[-1]
@@ -0,0 +1,322 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Streaming statistics of a parallel corpus of `source<TAB>target` lines.
+
+The files are split into byte ranges that are summarized by a pool of worker
+processes. A summary has a fixed size: lengths are counted in fixed-bin
+histograms and unique tokens with HyperLogLog sketches, so the memory does
+not depend on the size of the corpus. Summaries are merged and converted to
+a JSON-serializable dictionary with `CorpusStats.to_dict`.
+
+Lengths are numbers of tokens, without the SEQUENCE_START and SEQUENCE_END
+tokens the input pipelines add.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import hashlib
+import math
+import multiprocessing
+
+import numpy as np
+import tensorflow as tf
+
+from seq2seq.data import vocab
+from seq2seq.data.byte_ranges import read_range, split_into_ranges
+
+PERCENTILES = [50, 90, 95, 99, 99.9]
+
+
+def hash64(strings):
+  """Returns 64 bit hashes of unicode strings as an uint64 array."""
+  digests = b"".join(
+      hashlib.md5(_.encode("utf-8")).digest()[:8] for _ in strings)
+  return np.frombuffer(digests, dtype="<u8").astype(np.uint64)
+
+
+class Histogram(object):
+  """Counts of the integers `0..max_value`, larger values are counted in an
+  overflow bin. The mean and the maximum are exact."""
+
+  def __init__(self, max_value):
+    self.max_value = max_value
+    self.counts = np.zeros([max_value + 2], dtype=np.int64)
+    self.sum = 0
+    self.max = 0
+
+  def add(self, values):
+    values = np.asarray(values, dtype=np.int64)
+    if values.size == 0:
+      return
+    self.counts += np.bincount(
+        np.minimum(values, self.max_value + 1), minlength=len(self.counts))
+    self.sum += int(values.sum())
+    self.max = max(self.max, int(values.max()))
+
+  def merge(self, other):
+    if other.max_value != self.max_value:
+      raise ValueError("Can not merge histograms with different bins")
+    self.counts += other.counts
+    self.sum += other.sum
+    self.max = max(self.max, other.max)
+
+  @property
+  def num(self):
+    return int(self.counts.sum())
+
+  def mean(self):
+    return self.sum / max(self.num, 1)
+
+  def percentile(self, q):
+    """The nearest-rank percentile, values in the overflow bin are reported
+    as the maximum."""
+    if self.num == 0:
+      return 0
+    rank = max(int(math.ceil(q / 100. * self.num)), 1)
+    value = int(np.searchsorted(np.cumsum(self.counts), rank))
+    return self.max if value > self.max_value else value
+
+  def to_dict(self):
+    last = np.flatnonzero(self.counts[:-1])
+    counts = self.counts[:last[-1] + 1] if len(last) else self.counts[:0]
+    return {
+        "num": self.num,
+        "mean": self.mean(),
+        "max": self.max,
+        "percentiles": {str(_): self.percentile(_) for _ in PERCENTILES},
+        "counts": counts.tolist(),
+        "overflow": int(self.counts[-1])
+    }
+
+
+class HyperLogLog(object):
+  """A HyperLogLog sketch of the number of unique strings.
+
+  The relative error is about `1.04 / sqrt(2 ** precision)`, 0.8% for the
+  default precision, with `2 ** precision` bytes of registers.
+  """
+
+  def __init__(self, precision=14):
+    self.precision = precision
+    self.registers = np.zeros([1 << precision], dtype=np.uint8)
+
+  def add_hashes(self, hashes):
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    if hashes.size == 0:
+      return
+    value_bits = 64 - self.precision
+    indices = (hashes >> np.uint64(value_bits)).astype(np.int64)
+    values = hashes & np.uint64((1 << value_bits) - 1)
+    # frexp gives the bit length of the (exactly representable) values
+    _, bit_lengths = np.frexp(values.astype(np.float64))
+    ranks = (value_bits + 1 - bit_lengths).astype(np.uint8)
+    np.maximum.at(self.registers, indices, ranks)
+
+  def add(self, strings):
+    self.add_hashes(hash64(strings))
+
+  def merge(self, other):
+    if other.precision != self.precision:
+      raise ValueError("Can not merge HyperLogLogs of different precision")
+    np.maximum(self.registers, other.registers, out=self.registers)
+
+  def estimate(self):
+    num_registers = len(self.registers)
+    alpha = 0.7213 / (1. + 1.079 / num_registers)
+    estimate = alpha * num_registers ** 2 / np.sum(
+        np.power(2., -self.registers.astype(np.float64)))
+    num_zeros = int(np.sum(self.registers == 0))
+    if estimate <= 2.5 * num_registers and num_zeros > 0:
+      # Linear counting is more accurate for small cardinalities
+      estimate = num_registers * math.log(num_registers / num_zeros)
+    return int(round(estimate))
+
+
+class CorpusStats(object):
+  """Mergeable fixed-size statistics of `source<TAB>target` lines.
+
+  Args:
+    max_length: The largest length with its own histogram bin.
+    precision: Precision of the HyperLogLog sketches.
+  """
+
+  def __init__(self, max_length=1024, precision=14):
+    self.num_examples = 0
+    self.num_skipped = 0
+    self.source_length = Histogram(max_length)
+    self.target_length = Histogram(max_length)
+    self.overlap = Histogram(max_length)
+    self.source_oov = 0
+    self.target_oov = 0
+    self.source_tokens = HyperLogLog(precision)
+    self.target_tokens = HyperLogLog(precision)
+    self.examples = HyperLogLog(precision)
+
+  def add_lines(self, lines, delimiter=" ", vocab_words=None):
+    """Adds the statistics of a list of lines.
+
+    Args:
+      lines: Unicode `source<TAB>target` lines, others are counted as
+        skipped.
+      delimiter: The token delimiter.
+      vocab_words: A set of in-vocabulary words, or None.
+    """
+    source_lengths, target_lengths, overlaps = [], [], []
+    source_tokens, target_tokens, examples = set(), set(), []
+    for line in lines:
+      line = line.strip()
+      pieces = line.split("\t")
+      if len(pieces) != 2:
+        if line:
+          self.num_skipped += 1
+        continue
+      source = [_ for _ in pieces[0].strip().split(delimiter) if _]
+      target = [_ for _ in pieces[1].strip().split(delimiter) if _]
+      target_set = set(target)
+      source_lengths.append(len(source))
+      target_lengths.append(len(target))
+      overlaps.append(sum(1 for _ in source if _ in target_set))
+      source_tokens.update(source)
+      target_tokens.update(target_set)
+      examples.append(line)
+      if vocab_words is not None:
+        self.source_oov += sum(1 for _ in source if _ not in vocab_words)
+        self.target_oov += sum(1 for _ in target if _ not in vocab_words)
+
+    self.num_examples += len(examples)
+    self.source_length.add(source_lengths)
+    self.target_length.add(target_lengths)
+    self.overlap.add(overlaps)
+    self.source_tokens.add(source_tokens)
+    self.target_tokens.add(target_tokens)
+    self.examples.add(examples)
+
+  def merge(self, other):
+    self.num_examples += other.num_examples
+    self.num_skipped += other.num_skipped
+    self.source_length.merge(other.source_length)
+    self.target_length.merge(other.target_length)
+    self.overlap.merge(other.overlap)
+    self.source_oov += other.source_oov
+    self.target_oov += other.target_oov
+    self.source_tokens.merge(other.source_tokens)
+    self.target_tokens.merge(other.target_tokens)
+    self.examples.merge(other.examples)
+
+  def to_dict(self, with_oov=False):
+    """Returns the statistics as a JSON-serializable dictionary. The unique
+    counts are HyperLogLog estimates."""
+    vocab_tokens = HyperLogLog(self.source_tokens.precision)
+    vocab_tokens.merge(self.source_tokens)
+    vocab_tokens.merge(self.target_tokens)
+    result = {
+        "num_examples": self.num_examples,
+        "num_skipped_lines": self.num_skipped,
+        "approx_unique_examples": self.examples.estimate(),
+        "approx_source_vocab_size": self.source_tokens.estimate(),
+        "approx_target_vocab_size": self.target_tokens.estimate(),
+        "approx_vocab_size": vocab_tokens.estimate(),
+        "source_length": self.source_length.to_dict(),
+        "target_length": self.target_length.to_dict(),
+        "overlap": self.overlap.to_dict(),
+        "overlap_ratio": self.overlap.sum / max(self.source_length.sum, 1)
+    }
+    if with_oov:
+      result["source_oov_rate"] = self.source_oov / max(
+          self.source_length.sum, 1)
+      result["target_oov_rate"] = self.target_oov / max(
+          self.target_length.sum, 1)
+    return result
+
+
+_worker_options = {}
+
+
+def _init_worker(options):
+  _worker_options.update(options)
+  _worker_options["vocab_words"] = None
+  if options["vocab_path"] is not None:
+    vocab_instance = vocab.load_vocab(
+        options["vocab_path"], max_size=options["vocab_size"])
+    _worker_options["vocab_words"] = frozenset(vocab_instance.words())
+
+
+def _summarize_range(byte_range):
+  stats = CorpusStats(_worker_options["max_length"],
+                      _worker_options["precision"])
+  stats.add_lines(
+      read_range(*byte_range).split("\n"), _worker_options["delimiter"],
+      _worker_options["vocab_words"])
+  return stats
+
+
+def compute_corpus_stats(paths,
+                         delimiter=" ",
+                         vocab_path=None,
+                         vocab_size=None,
+                         num_workers=None,
+                         range_bytes=16 << 20,
+                         max_length=1024,
+                         precision=14):
+  """Computes the `CorpusStats` of files with a pool of worker processes.
+
+  Args:
+    paths: Files of `source<TAB>target` lines.
+    delimiter: The token delimiter.
+    vocab_path: A vocabulary file to compute OOV rates against, or None.
+    vocab_size: The maximum vocabulary size, including the special words.
+    num_workers: Number of worker processes, defaults to the number of CPUs.
+      With 1 the files are read in this process.
+    range_bytes: Size of the byte ranges the files are split into.
+    max_length: The largest length with its own histogram bin.
+    precision: Precision of the HyperLogLog sketches.
+
+  Returns:
+    The merged `CorpusStats`.
+  """
+  num_workers = num_workers or multiprocessing.cpu_count()
+  options = {
+      "delimiter": delimiter,
+      "vocab_path": vocab_path,
+      "vocab_size": vocab_size,
+      "max_length": max_length,
+      "precision": precision
+  }
+  ranges = split_into_ranges(paths, range_bytes)
+  tf.logging.info("Reading %d bytes in %d ranges with %d workers",
+                  sum(end - start for _, start, end in ranges), len(ranges),
+                  num_workers)
+
+  stats = CorpusStats(max_length, precision)
+  if num_workers == 1:
+    _init_worker(options)
+    for byte_range in ranges:
+      stats.merge(_summarize_range(byte_range))
+    return stats
+
+  pool = multiprocessing.Pool(
+      num_workers, initializer=_init_worker, initargs=(options,))
+  try:
+    for range_stats in pool.imap_unordered(_summarize_range, ranges):
+      stats.merge(range_stats)
+    pool.close()
+  except:
+    pool.terminate()
+    raise
+  finally:
+    pool.join()
+  return stats
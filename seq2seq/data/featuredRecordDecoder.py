@@ -5,6 +5,7 @@ from tensorflow.python.ops import array_ops
 from tensorflow.python.ops import parsing_ops
 from tensorflow.contrib.slim.python.slim.data import data_decoder
 from seq2seq.data import split_tokens_decoder
+from seq2seq.features import global_vars
 
 def merge_dict(d1, d2):
   d = {}
@@ -33,7 +34,7 @@ class FeaturedTFExampleDecoder(data_decoder.DataDecoder):
   contains the instructions for post_processing its tensors for stage 2.
   """
 
-  def __init__(self, source_keys_to_tensor, target_keys_to_tensor=None, items_to_handlers=None):
+  def __init__(self, source_keys_to_tensor, target_keys_to_tensor=None, items_to_handlers=None, format_version=None):
     """Constructs the decoder.
 
     Args:
@@ -41,7 +42,11 @@ class FeaturedTFExampleDecoder(data_decoder.DataDecoder):
         tf.VarLenFeature or tf.FixedLenFeature instances. See tensorflow's
         parsing_ops.py.
       target_keys_to_tensor: None mean infer mode
+      format_version: the format of the string features, see
+        `seq2seq.features.global_vars`. None reads it from the
+        `format_version` feature of every example, legacy examples have none.
     """
+    self._format_version = format_version
     self._source_keys_to_tensor = source_keys_to_tensor
     self._source_feature_keys = list(source_keys_to_tensor.keys())
     self._target_keys_to_tensor = target_keys_to_tensor
@@ -51,6 +56,8 @@ class FeaturedTFExampleDecoder(data_decoder.DataDecoder):
     self._keys_to_features = source_keys_to_tensor.copy()
     for k in target_keys_to_tensor:
       self._keys_to_features[k] = target_keys_to_tensor[k]
+    if format_version is None:
+      self._keys_to_features[global_vars.FORMAT_VERSION_KEY] = global_vars.format_version_feature
 
     if items_to_handlers is not None:
       self._items = items_to_handlers.keys()
@@ -79,6 +86,15 @@ class FeaturedTFExampleDecoder(data_decoder.DataDecoder):
     example = parsing_ops.parse_single_example(serialized_example,
                                                self._keys_to_features)
 
+    def split_tokens(values):
+      if self._format_version == global_vars.LEGACY_FORMAT_VERSION:
+        return tf.string_split(values, delimiter=" ").values
+      if self._format_version is not None:
+        return values
+      # Only legacy examples pay for the split
+      is_legacy = tf.equal(example[global_vars.FORMAT_VERSION_KEY], global_vars.LEGACY_FORMAT_VERSION)
+      return tf.cond(is_legacy, lambda: tf.string_split(values, delimiter=" ").values, lambda: values)
+
     def get_feature_tensor(example, keys_to_features):
       features = {}
       # Reshape non-sparse elements just once:
@@ -89,8 +105,7 @@ class FeaturedTFExampleDecoder(data_decoder.DataDecoder):
         if isinstance(example[k], tf.SparseTensor):
           example[k] = example[k].values
         if example[k].dtype is not tf.int64 and example[k].dtype is not tf.float32:
-          tokens = tf.string_split(example[k], delimiter=" ").values
-          features[k] = tokens
+          features[k] = split_tokens(example[k])
         else:
           features[k] = example[k]
       return features
@@ -109,4 +124,66 @@ class FeaturedTFExampleDecoder(data_decoder.DataDecoder):
 
     outputs = [ all_features[v] for v in self._items ]
 
-    return outputs
\ No newline at end of file
+    return outputs
+
+  def decode_batch(self, serialized_examples):
+    """Decodes a batch of serialized TF-examples with a single `parse_example`.
+
+    Args:
+      serialized_examples: a string tensor of shape `[batch_size]`.
+
+    Returns:
+      A dictionary from the items of `list_items` to tensors of shape
+      `[batch_size, ...]`. Variable length features are padded with 0 or "".
+      Batches may mix format versions, but only batches of a single version
+      avoid splitting the tokens twice.
+    """
+    examples = parsing_ops.parse_example(serialized_examples, self._keys_to_features)
+    batch_size = tf.shape(serialized_examples)[0]
+
+    def dense_and_lengths(sparse, default_value):
+      dense = tf.sparse_tensor_to_dense(sparse, default_value=default_value)
+      rows = sparse.indices[:, 0]
+      lengths = tf.unsorted_segment_sum(tf.ones_like(rows, dtype=tf.int32), rows, batch_size)
+      return dense, lengths
+
+    def split_tokens(sparse):
+      def split_legacy():
+        joined = tf.reduce_join(tf.sparse_tensor_to_dense(sparse, default_value=""), axis=1)
+        return dense_and_lengths(tf.string_split(joined, delimiter=" "), "")
+      if self._format_version == global_vars.LEGACY_FORMAT_VERSION:
+        return split_legacy()
+      if self._format_version is not None:
+        return dense_and_lengths(sparse, "")
+      is_legacy = tf.equal(examples[global_vars.FORMAT_VERSION_KEY], global_vars.LEGACY_FORMAT_VERSION)
+
+      def split_rows():
+        # A batch mixing versions splits both ways and picks every row's own
+        legacy, legacy_lengths = split_legacy()
+        tokens, token_lengths = dense_and_lengths(sparse, "")
+        lengths = tf.where(is_legacy, legacy_lengths, token_lengths)
+        width = tf.reduce_max(tf.concat([lengths, [0]], 0))
+        def pad(dense):
+          dense = dense[:, :width]
+          return tf.pad(dense, [[0, 0], [0, width - tf.shape(dense)[1]]], constant_values="")
+        return tf.where(is_legacy, pad(legacy), pad(tokens)), lengths
+
+      return tf.cond(
+        tf.reduce_all(is_legacy), split_legacy,
+        lambda: tf.cond(tf.reduce_any(is_legacy), split_rows, lambda: dense_and_lengths(sparse, "")))
+
+    features = {}
+    lengths = {}
+    for k in self._source_feature_keys + self._target_feature_keys:
+      v = examples[k]
+      if not isinstance(v, tf.SparseTensor):
+        features[k] = v
+      elif v.dtype == tf.string:
+        features[k], lengths[k] = split_tokens(v)
+      else:
+        features[k], lengths[k] = dense_and_lengths(v, tf.zeros([], dtype=v.dtype))
+    features["source_len"] = lengths["source_tokens"]
+    if "target_tokens" in lengths:
+      features["target_len"] = lengths["target_tokens"]
+
+    return dict((k, features[k]) for k in self._items if k in features)
\ No newline at end of file
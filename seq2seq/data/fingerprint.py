@@ -0,0 +1,205 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Line fingerprints to deduplicate text files and find overlaps between
+data splits.
+
+Lines are normalized by dropping SEQUENCE_END tokens and all whitespace
+inside every tab-separated field, and hashed to 64 bit fingerprints. The
+fingerprints of a file are held in numpy arrays, 8 bytes per line or field
+instead of a Python string, and are computed by a pool of worker processes
+over byte ranges of the files. Two different lines share a fingerprint with
+a probability of about `num_lines ** 2 / 2 ** 65`.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections
+import io
+import multiprocessing
+
+import numpy as np
+
+from seq2seq.data.corpus_stats import hash64
+from seq2seq.data.byte_ranges import read_range, split_into_ranges
+
+
+class FileFingerprints(
+    collections.namedtuple("FileFingerprints", [
+        "path", "line_fingerprints", "non_empty", "field_fingerprints",
+        "field_line_ids"
+    ])):
+  """Fingerprints of a file.
+
+  path: The file name.
+  line_fingerprints: uint64 `[num_lines]`, the fingerprint of every line.
+  non_empty: bool `[num_lines]`, False for lines that are empty after
+    normalization.
+  field_fingerprints: uint64, the fingerprints of the non-empty
+    tab-separated fields of all lines.
+  field_line_ids: int64, the line of every field fingerprint.
+  """
+
+
+def normalize_field(text):
+  """Drops SEQUENCE_END tokens and whitespace, like `split_join` of the run
+  scripts."""
+  return "".join(_ for _ in text.split() if _ != "SEQUENCE_END")
+
+
+def normalize_line(line):
+  return "\t".join(normalize_field(_) for _ in line.split("\t"))
+
+
+def fingerprint_lines(lines):
+  """Returns a FileFingerprints of a list of lines without path."""
+  normalized = [normalize_line(_) for _ in lines]
+  non_empty = np.array([len(_.strip("\t")) > 0 for _ in normalized],
+                       dtype=np.bool_)
+  fields, field_line_ids = [], []
+  for i, line in enumerate(normalized):
+    for field in line.split("\t"):
+      if field:
+        fields.append(field)
+        field_line_ids.append(i)
+  return FileFingerprints(None, hash64(normalized), non_empty, hash64(fields),
+                          np.array(field_line_ids, dtype=np.int64))
+
+
+def _fingerprint_range(byte_range):
+  lines = read_range(*byte_range).split("\n")
+  if lines and not lines[-1]:
+    lines.pop()
+  return fingerprint_lines(lines)
+
+
+def _concat(path, parts):
+  offsets = np.cumsum([0] + [len(_.line_fingerprints) for _ in parts])
+  return FileFingerprints(
+      path,
+      np.concatenate([_.line_fingerprints for _ in parts] + [
+          np.zeros([0], np.uint64)]),
+      np.concatenate([_.non_empty for _ in parts] + [np.zeros([0], np.bool_)]),
+      np.concatenate([_.field_fingerprints for _ in parts] + [
+          np.zeros([0], np.uint64)]),
+      np.concatenate([_.field_line_ids + offset
+                      for _, offset in zip(parts, offsets)] + [
+                          np.zeros([0], np.int64)]))
+
+
+def _map(fn, tasks, num_workers):
+  num_workers = num_workers or multiprocessing.cpu_count()
+  if num_workers == 1 or len(tasks) <= 1:
+    return [fn(_) for _ in tasks]
+  pool = multiprocessing.Pool(num_workers)
+  try:
+    results = pool.map(fn, tasks, chunksize=1)
+    pool.close()
+  except:
+    pool.terminate()
+    raise
+  finally:
+    pool.join()
+  return results
+
+
+def fingerprint_files(paths, num_workers=None, range_bytes=64 << 20):
+  """Returns the FileFingerprints of every file, in the order of paths."""
+  ranges = [(path, start, end)
+            for path in paths
+            for _, start, end in split_into_ranges([path], range_bytes)]
+  results = _map(_fingerprint_range, ranges, num_workers)
+  parts = collections.defaultdict(list)
+  for (path, _, _), result in zip(ranges, results):
+    parts[path].append(result)
+  return [_concat(path, parts[path]) for path in paths]
+
+
+def unique_fingerprints(files, fields=False):
+  """Returns the sorted unique fingerprints of the non-empty lines, or of
+  all fields, of a list of FileFingerprints."""
+  if fields:
+    arrays = [_.field_fingerprints for _ in files]
+  else:
+    arrays = [_.line_fingerprints[_.non_empty] for _ in files]
+  return np.unique(np.concatenate(arrays + [np.zeros([0], np.uint64)]))
+
+
+def contains(sorted_fingerprints, fingerprints):
+  """Returns a bool array, whether every fingerprint is in the sorted
+  unique array sorted_fingerprints."""
+  fingerprints = np.asarray(fingerprints, dtype=np.uint64)
+  if len(sorted_fingerprints) == 0:
+    return np.zeros(fingerprints.shape, dtype=np.bool_)
+  positions = np.searchsorted(sorted_fingerprints, fingerprints)
+  positions = np.minimum(positions, len(sorted_fingerprints) - 1)
+  return sorted_fingerprints[positions] == fingerprints
+
+
+def overlapping_lines(file_fingerprints, exclude, fields=False):
+  """Returns a bool array, whether every line of a file is, or with fields
+  has a field, in the sorted unique fingerprints exclude."""
+  if not fields:
+    return contains(exclude, file_fingerprints.line_fingerprints) & \
+        file_fingerprints.non_empty
+  overlapping = np.zeros(file_fingerprints.non_empty.shape, dtype=np.bool_)
+  hits = contains(exclude, file_fingerprints.field_fingerprints)
+  overlapping[file_fingerprints.field_line_ids[hits]] = True
+  return overlapping
+
+
+def duplicated_lines(files):
+  """Returns a bool array per file, whether every line repeats an earlier
+  line of the files, in order."""
+  line_fingerprints = np.concatenate(
+      [_.line_fingerprints for _ in files] + [np.zeros([0], np.uint64)])
+  _, first = np.unique(line_fingerprints, return_index=True)
+  duplicated = np.ones(line_fingerprints.shape, dtype=np.bool_)
+  duplicated[first] = False
+  offsets = np.cumsum([0] + [len(_.line_fingerprints) for _ in files])
+  return [duplicated[start:end] for start, end in zip(offsets, offsets[1:])]
+
+
+def _write_lines(task):
+  path, save_path, keep = task
+  num_written = 0
+  with io.open(path, "rb") as source, io.open(save_path, "wb") as target:
+    for line, keep_line in zip(source, keep):
+      if keep_line:
+        if not line.endswith(b"\n"):
+          line += b"\n"
+        target.write(line)
+        num_written += 1
+  return num_written
+
+
+def write_lines(paths, save_paths, keeps, num_workers=None):
+  """Copies the lines of every file that have True in the bool array keeps
+  to save_paths, one process per file. Returns the written line counts."""
+  return _map(_write_lines, list(zip(paths, save_paths, keeps)), num_workers)
+
+
+def read_lines(path, line_mask, limit=None):
+  """Returns the lines of a file that have True in the bool array line_mask,
+  at most limit of them."""
+  lines = []
+  with io.open(path, "rb") as file:
+    for line, selected in zip(file, line_mask):
+      if selected:
+        lines.append(line.decode("utf-8").rstrip("\n"))
+        if limit is not None and len(lines) >= limit:
+          break
+  return lines
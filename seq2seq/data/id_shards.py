@@ -0,0 +1,305 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Pre-tokenized id shards.
+
+A shard stores the vocabulary ids of a parallel corpus so that training
+does not need to split and look up strings. A shard with the prefix `P`
+consists of the numpy files
+
+  P.source_ids.npy      int32, the ids of all source sequences, concatenated
+  P.source_offsets.npy  int64, `[num_examples + 1]` start of every sequence
+  P.target_ids.npy      optional, like the source
+  P.target_offsets.npy  optional, like the source
+
+The ids include SEQUENCE_END for sources and SEQUENCE_START/SEQUENCE_END
+for targets, like `ParallelTextInputPipeline` produces them. Shards are
+read with `np.memmap`, so they must be on a local file system.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import itertools
+
+import numpy as np
+import tensorflow as tf
+
+SOURCE_IDS_SUFFIX = ".source_ids.npy"
+SOURCE_OFFSETS_SUFFIX = ".source_offsets.npy"
+TARGET_IDS_SUFFIX = ".target_ids.npy"
+TARGET_OFFSETS_SUFFIX = ".target_offsets.npy"
+
+
+def _tokenize(line, delimiter):
+  line = line.rstrip("\n")
+  if delimiter == "":
+    return list(line)
+  return [_ for _ in line.split(delimiter) if _]
+
+
+def encode_source(vocab_instance, line, delimiter=" "):
+  """Returns the ids of a source line, ending with SEQUENCE_END."""
+  tokens = _tokenize(line, delimiter) + ["SEQUENCE_END"]
+  return [vocab_instance.word2id(_) for _ in tokens]
+
+
+def encode_target(vocab_instance, line, delimiter=" "):
+  """Returns the ids of a target line, wrapped in SEQUENCE_START and
+  SEQUENCE_END."""
+  tokens = ["SEQUENCE_START"] + _tokenize(line, delimiter) + ["SEQUENCE_END"]
+  return [vocab_instance.word2id(_) for _ in tokens]
+
+
+def _flatten(sequences):
+  offsets = np.zeros([len(sequences) + 1], dtype=np.int64)
+  offsets[1:] = np.cumsum([len(_) for _ in sequences])
+  ids = np.fromiter(itertools.chain.from_iterable(sequences), dtype=np.int32,
+                    count=offsets[-1])
+  return ids, offsets
+
+
+def write_id_shard(prefix, source_ids, target_ids=None, sort_by_length=False):
+  """Writes one shard.
+
+  Args:
+    prefix: The path prefix of the shard files.
+    source_ids: A list of source id sequences.
+    target_ids: A list of aligned target id sequences, or None.
+    sort_by_length: If true, examples are written sorted by their source
+      and target lengths so that neighbours need little padding.
+  """
+  if target_ids is not None and len(target_ids) != len(source_ids):
+    raise ValueError("Got {} sources but {} targets".format(
+        len(source_ids), len(target_ids)))
+
+  if sort_by_length:
+    order = sorted(
+        range(len(source_ids)),
+        key=lambda i: (len(source_ids[i]),
+                       len(target_ids[i]) if target_ids else 0))
+    source_ids = [source_ids[_] for _ in order]
+    if target_ids is not None:
+      target_ids = [target_ids[_] for _ in order]
+
+  ids, offsets = _flatten(source_ids)
+  np.save(prefix + SOURCE_IDS_SUFFIX, ids)
+  np.save(prefix + SOURCE_OFFSETS_SUFFIX, offsets)
+  if target_ids is not None:
+    ids, offsets = _flatten(target_ids)
+    np.save(prefix + TARGET_IDS_SUFFIX, ids)
+    np.save(prefix + TARGET_OFFSETS_SUFFIX, offsets)
+
+
+def convert_parallel_text(source_file,
+                          vocab_instance,
+                          output_prefix,
+                          target_file=None,
+                          examples_per_shard=1000000,
+                          sort_by_length=False,
+                          source_delimiter=" ",
+                          target_delimiter=" "):
+  """Converts a parallel text file pair into id shards named
+  `<output_prefix>-00000`, `<output_prefix>-00001`, ...
+
+  Args:
+    source_file: Path to the source text.
+    vocab_instance: A `seq2seq.data.vocab.Vocab` used for both source and
+      target.
+    output_prefix: The path prefix of the shards.
+    target_file: Path to the aligned target text, or None.
+    examples_per_shard: The maximum number of examples per shard.
+    sort_by_length: See `write_id_shard`.
+    source_delimiter: The delimiter of the source tokens.
+    target_delimiter: The delimiter of the target tokens.
+
+  Returns:
+    The list of written shard prefixes.
+  """
+  source_lines = io.open(source_file, encoding="utf-8")
+  target_lines = None
+  if target_file is not None:
+    target_lines = io.open(target_file, encoding="utf-8")
+
+  prefixes = []
+  with source_lines:
+    while True:
+      source_chunk = list(itertools.islice(source_lines, examples_per_shard))
+      if not source_chunk:
+        break
+      target_ids = None
+      if target_lines is not None:
+        target_chunk = list(itertools.islice(target_lines, len(source_chunk)))
+        if len(target_chunk) != len(source_chunk):
+          raise ValueError("{} has fewer lines than {}".format(
+              target_file, source_file))
+        target_ids = [
+            encode_target(vocab_instance, _, target_delimiter)
+            for _ in target_chunk
+        ]
+      source_ids = [
+          encode_source(vocab_instance, _, source_delimiter)
+          for _ in source_chunk
+      ]
+      prefix = "{}-{:05d}".format(output_prefix, len(prefixes))
+      write_id_shard(prefix, source_ids, target_ids, sort_by_length)
+      tf.logging.info("Wrote %d examples to %s", len(source_ids), prefix)
+      prefixes.append(prefix)
+
+  if target_lines is not None:
+    target_lines.close()
+  return prefixes
+
+
+class IdShard(object):
+  """Read-only, memory-mapped access to a shard written by `write_id_shard`.
+
+  Args:
+    prefix: The path prefix of the shard files.
+  """
+
+  def __init__(self, prefix):
+    self.prefix = prefix
+    self.source_ids = np.load(prefix + SOURCE_IDS_SUFFIX, mmap_mode="r")
+    self.source_offsets = np.load(prefix + SOURCE_OFFSETS_SUFFIX)
+    self.target_ids = None
+    self.target_offsets = None
+    if tf.gfile.Exists(prefix + TARGET_IDS_SUFFIX):
+      self.target_ids = np.load(prefix + TARGET_IDS_SUFFIX, mmap_mode="r")
+      self.target_offsets = np.load(prefix + TARGET_OFFSETS_SUFFIX)
+
+  @property
+  def has_targets(self):
+    return self.target_ids is not None
+
+  def __len__(self):
+    return len(self.source_offsets) - 1
+
+  def source(self, index):
+    """Returns the source ids of an example as int64 array."""
+    start, end = self.source_offsets[index:index + 2]
+    return self.source_ids[start:end].astype(np.int64)
+
+  def target(self, index):
+    """Returns the target ids of an example as int64 array."""
+    start, end = self.target_offsets[index:index + 2]
+    return self.target_ids[start:end].astype(np.int64)
+
+  def source_block(self, start, end):
+    """Returns the source ids of the examples `start` to `end`, see
+    `_padded_block`."""
+    return _padded_block(self.source_ids, self.source_offsets, start, end)
+
+  def target_block(self, start, end):
+    """Returns the target ids of the examples `start` to `end`, see
+    `_padded_block`."""
+    return _padded_block(self.target_ids, self.target_offsets, start, end)
+
+
+def _padded_block(ids, offsets, start, end):
+  """Reads the sequences of consecutive examples with one slice of the
+  memory-mapped ids. Returns a `[end - start, max_length]` int64 matrix
+  padded with 0 and the int32 lengths."""
+  offsets = offsets[start:end + 1]
+  lengths = np.diff(offsets).astype(np.int32)
+  padded = np.zeros([len(lengths), lengths.max() if len(lengths) else 0],
+                    dtype=np.int64)
+  padded[np.arange(padded.shape[1]) < lengths[:, None]] = \
+    ids[offsets[0]:offsets[-1]]
+  return padded, lengths
+
+
+def find_shards(patterns):
+  """Returns the sorted prefixes of the shards matching a list of prefix
+  patterns, e.g. `["data/train-*"]`."""
+  prefixes = []
+  for pattern in patterns:
+    matches = tf.gfile.Glob(pattern + SOURCE_IDS_SUFFIX)
+    if not matches:
+      raise ValueError("No id shards match {}".format(pattern))
+    prefixes.extend(
+        sorted(_[:-len(SOURCE_IDS_SUFFIX)] for _ in matches))
+  return prefixes
+
+
+def iterate_blocks(prefixes,
+                   block_size=512,
+                   shuffle=False,
+                   num_epochs=None,
+                   seed=None):
+  """Yields the examples of shards in blocks of up to `block_size`
+  consecutive examples, as `(source_ids, source_len)` or
+  `(source_ids, source_len, target_ids, target_len)` tuples of padded id
+  matrices and lengths. Reading a block costs one slice of the memory-mapped
+  arrays, not one Python call per example.
+
+  Args:
+    prefixes: The shard prefixes.
+    block_size: The maximum number of examples of a block.
+    shuffle: Read shards and blocks of every epoch in random order. The
+      examples of a block stay in order, so the reader should shuffle them.
+    num_epochs: The number of epochs, None to repeat forever.
+    seed: The seed of the random order.
+  """
+  shards = [IdShard(_) for _ in prefixes]
+  has_targets = all(_.has_targets for _ in shards)
+  random_state = np.random.RandomState(seed)
+  epochs = itertools.count() if num_epochs is None else range(num_epochs)
+  for _ in epochs:
+    shard_order = range(len(shards))
+    if shuffle:
+      shard_order = random_state.permutation(len(shards))
+    for shard_index in shard_order:
+      shard = shards[shard_index]
+      starts = np.arange(0, len(shard), block_size)
+      if shuffle:
+        starts = random_state.permutation(starts)
+      for start in starts:
+        end = min(start + block_size, len(shard))
+        if has_targets:
+          yield shard.source_block(start, end) + shard.target_block(start, end)
+        else:
+          yield shard.source_block(start, end)
+
+
+def iterate_examples(prefixes, shuffle=False, num_epochs=None, seed=None):
+  """Yields the examples of shards as `(source_ids,)` or
+  `(source_ids, target_ids)` tuples.
+
+  Args:
+    prefixes: The shard prefixes.
+    shuffle: Read shards and examples of every epoch in random order.
+    num_epochs: The number of epochs, None to repeat forever.
+    seed: The seed of the random order.
+  """
+  shards = [IdShard(_) for _ in prefixes]
+  has_targets = all(_.has_targets for _ in shards)
+  random_state = np.random.RandomState(seed)
+  epochs = itertools.count() if num_epochs is None else range(num_epochs)
+  for _ in epochs:
+    shard_order = range(len(shards))
+    if shuffle:
+      shard_order = random_state.permutation(len(shards))
+    for shard_index in shard_order:
+      shard = shards[shard_index]
+      example_order = range(len(shard))
+      if shuffle:
+        example_order = random_state.permutation(len(shard))
+      for index in example_order:
+        if has_targets:
+          yield shard.source(index), shard.target(index)
+        else:
+          yield (shard.source(index),)
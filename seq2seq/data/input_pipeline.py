@@ -35,6 +35,9 @@ from seq2seq.configurable import Configurable
 from seq2seq.data import split_tokens_decoder, parallel_data_provider
 from seq2seq.data.sequence_example_decoder import TFSEquenceExampleDecoder
 from seq2seq.data import featuredRecordDecoder
+from seq2seq.data import id_shards
+from seq2seq.data import record_shards
+from seq2seq.data import vocab
 from seq2seq.features import global_vars
 from seq2seq.data.featuredDataProvider import FeaturedDataProvider
 
@@ -68,6 +71,78 @@ def make_input_pipeline_from_def(def_dict, mode, **kwargs):
   return pipeline_class(params=params, mode=mode)
 
 
+def _decode_to_dict(decoder, data):
+  """Decodes all items of a `data_decoder.DataDecoder` into a dictionary.
+  """
+  items = decoder.list_items()
+  return dict(zip(items, decoder.decode(data, items)))
+
+
+def read_files_dataset(file_lists, reader_fn, params):
+  """Creates a `tf.data.Dataset` of records read from one or more aligned
+  lists of files.
+
+  Files at the same position of each list are read together and their records
+  are zipped, e.g. the i-th source file with the i-th target file. When
+  shuffling, the shards are read in random order and `num_readers` shards are
+  interleaved, otherwise the files are read one after the other.
+
+  Args:
+    file_lists: A list of file name lists. All lists must have the same length.
+    reader_fn: A function mapping a file name to a `tf.data.Dataset`,
+      e.g. `tf.data.TextLineDataset`.
+    params: The params of the `InputPipeline`.
+
+  Returns:
+    A `tf.data.Dataset` whose elements are tuples with one record per list.
+  """
+  num_files = len(file_lists[0])
+  for files in file_lists:
+    if len(files) != num_files:
+      raise ValueError(
+          "Aligned files must have the same number of shards, got {}".format(
+              [len(_) for _ in file_lists]))
+
+  files = tf.data.Dataset.from_tensor_slices(tuple(file_lists))
+  if params["shuffle"]:
+    files = files.shuffle(num_files, seed=_shuffle_seed(params, 0))
+  files = files.repeat(params["num_epochs"])
+
+  cycle_length = 1
+  if params["shuffle"]:
+    cycle_length = max(1, min(params["num_readers"], num_files))
+
+  records = files.interleave(
+      lambda *shard: tf.data.Dataset.zip(tuple(reader_fn(_) for _ in shard)),
+      cycle_length=cycle_length,
+      block_length=1)
+
+  if params["shuffle"]:
+    records = records.shuffle(
+        params["shuffle_buffer_size"], seed=_shuffle_seed(params, 1))
+  return records
+
+
+def _shuffle_seed(params, offset):
+  """The seed of one of the shuffles of a pipeline, None if the pipeline is
+  not seeded. Every shuffle draws a new order each epoch from its seed."""
+  if params["seed"] is None:
+    return None
+  return params["seed"] + offset
+
+
+def expand_files(patterns):
+  """Expands a list of file names or glob patterns, keeping the order of
+  the patterns. Files matched by the same pattern are sorted."""
+  files = []
+  for pattern in patterns:
+    matches = tf.gfile.Glob(pattern)
+    if not matches:
+      raise ValueError("No files match {}".format(pattern))
+    files.extend(sorted(matches))
+  return files
+
+
 @six.add_metaclass(abc.ABCMeta)
 class InputPipeline(Configurable):
   """Abstract InputPipeline class. All input pipelines must inherit from this.
@@ -78,24 +153,95 @@ class InputPipeline(Configurable):
     shuffle: If true, shuffle the data.
     num_epochs: Number of times to iterate through the dataset. If None,
       iterate forever.
+    input_pipeline: The engine that reads the data. "queue" uses a
+      DataProvider and queue runners, "dataset" uses `tf.data` (see
+      `make_dataset`).
+    num_readers: The number of shards read in parallel when shuffling, by
+      the "dataset" engine and by pipelines whose DataProvider supports it.
+    num_parallel_calls: The number of examples decoded in parallel by the
+      "dataset" engine.
+    shuffle_buffer_size: The number of examples the "dataset" engine
+      shuffles over.
+    prefetch_buffer_size: The number of batches the "dataset" engine
+      prepares ahead of the model.
+    seed: The seed of the shuffled file order and shuffle buffers. Each
+      epoch is shuffled differently but reproducibly. If None, every run
+      reads the data in a new random order.
   """
 
   def __init__(self, params, mode):
     Configurable.__init__(self, params, mode)
+    if self.params["input_pipeline"] not in ["queue", "dataset"]:
+      raise ValueError("Unknown input_pipeline: {}".format(
+          self.params["input_pipeline"]))
 
   @staticmethod
   def default_params():
     return {
         "shuffle": True,
         "num_epochs": None,
+        "input_pipeline": "queue",
+        "num_readers": 4,
+        "num_parallel_calls": 4,
+        "shuffle_buffer_size": 10000,
+        "prefetch_buffer_size": 2,
+        "seed": None,
     }
 
+  @property
+  def use_dataset(self):
+    """True if examples are read with `make_dataset` instead of a
+    DataProvider."""
+    return self.params["input_pipeline"] == "dataset"
+
+  @property
+  def saves_position(self):
+    """True if the state of the iterator of `make_dataset` can be saved,
+    see `seq2seq.training.hooks.InputPositionHook`."""
+    return self.use_dataset
+
   def make_data_provider(self, **kwargs):
     """Creates DataProvider instance for this input pipeline. Additional
     keyword arguments are passed to the DataProvider.
     """
     raise NotImplementedError("Not implemented.")
 
+  def make_record_dataset(self):
+    """Creates a `tf.data.Dataset` of the undecoded records that
+    `make_dataset` decodes, a tuple of one record per aligned file.
+    """
+    raise NotImplementedError(
+        "{} does not read records".format(self.__class__.__name__))
+
+  def make_dataset(self):
+    """Creates a `tf.data.Dataset` of single, unbatched examples. Each
+    element is a dictionary with the same items as the ones read from the
+    DataProvider.
+    """
+    raise NotImplementedError(
+        "{} does not support the dataset input_pipeline".format(
+            self.__class__.__name__))
+
+  @property
+  def parses_batches(self):
+    """True if the "dataset" engine reads padded batches from
+    `make_batched_dataset` instead of examples from `make_dataset`."""
+    return False
+
+  def make_batched_dataset(self, batch_size):
+    """Creates a `tf.data.Dataset` of padded batches of up to `batch_size`
+    examples, with the same items as the elements of `make_dataset`.
+    """
+    raise NotImplementedError(
+        "{} does not parse batches".format(self.__class__.__name__))
+
+  def finish_batch(self, batch):
+    """Completes a batch read from the dataset of the "dataset" engine, e.g.
+    with items that need lookup tables, which the datasets of one-shot
+    iterators cannot use. Returns the batch.
+    """
+    return batch
+
   @property
   def feature_keys(self):
     """Defines the features that this input pipeline provides. Returns
@@ -144,36 +290,39 @@ class ParallelTextInputPipeline(InputPipeline):
     })
     return params
 
-  def make_data_provider(self, **kwargs):
-    decoder_source = split_tokens_decoder.SplitTokensDecoder(
+  def _source_decoder(self):
+    return split_tokens_decoder.SplitTokensDecoder(
         tokens_feature_name="source_tokens",
         length_feature_name="source_len",
         append_token="SEQUENCE_END",
         delimiter=self.params["source_delimiter"])
 
+  def _target_decoder(self):
+    return split_tokens_decoder.SplitTokensDecoder(
+        tokens_feature_name="target_tokens",
+        length_feature_name="target_len",
+        prepend_token="SEQUENCE_START",
+        append_token="SEQUENCE_END",
+        delimiter=self.params["target_delimiter"])
+
+  def make_data_provider(self, **kwargs):
     dataset_source = tf.contrib.slim.dataset.Dataset(
         data_sources=self.params["source_files"],
         reader=tf.TextLineReader,
-        decoder=decoder_source,
+        decoder=self._source_decoder(),
         num_samples=None,
         items_to_descriptions={})
 
     dataset_target = None
     if len(self.params["target_files"]) > 0:
-      decoder_target = split_tokens_decoder.SplitTokensDecoder(
-          tokens_feature_name="target_tokens",
-          length_feature_name="target_len",
-          prepend_token="SEQUENCE_START",
-          append_token="SEQUENCE_END",
-          delimiter=self.params["target_delimiter"])
-
       dataset_target = tf.contrib.slim.dataset.Dataset(
           data_sources=self.params["target_files"],
           reader=tf.TextLineReader,
-          decoder=decoder_target,
+          decoder=self._target_decoder(),
           num_samples=None,
           items_to_descriptions={})
 
+    kwargs.setdefault("seed", self.params["seed"])
     return parallel_data_provider.ParallelDataProvider(
         dataset1=dataset_source,
         dataset2=dataset_target,
@@ -181,6 +330,28 @@ class ParallelTextInputPipeline(InputPipeline):
         num_epochs=self.params["num_epochs"],
         **kwargs)
 
+  def make_record_dataset(self):
+    file_lists = [expand_files(self.params["source_files"])]
+    if len(self.params["target_files"]) > 0:
+      file_lists.append(expand_files(self.params["target_files"]))
+    return read_files_dataset(file_lists, tf.data.TextLineDataset,
+                              self.params)
+
+  def make_dataset(self):
+    decoders = [self._source_decoder()]
+    if len(self.params["target_files"]) > 0:
+      decoders.append(self._target_decoder())
+
+    def decode(*lines):
+      """Splits the aligned source and target lines."""
+      example = {}
+      for decoder, line in zip(decoders, lines):
+        example.update(_decode_to_dict(decoder, line))
+      return example
+
+    return self.make_record_dataset().map(
+        decode, num_parallel_calls=self.params["num_parallel_calls"])
+
   @property
   def feature_keys(self):
     return set(["source_tokens", "source_len"])
@@ -216,8 +387,7 @@ class TFRecordInputPipeline(InputPipeline):
     })
     return params
 
-  def make_data_provider(self, **kwargs):
-
+  def _splitters(self):
     splitter_source = split_tokens_decoder.SplitTokensDecoder(
         tokens_feature_name="source_tokens",
         length_feature_name="source_len",
@@ -231,12 +401,20 @@ class TFRecordInputPipeline(InputPipeline):
         append_token="SEQUENCE_END",
         delimiter=self.params["target_delimiter"])
 
-    keys_to_features = {
+    return splitter_source, splitter_target
+
+  def _keys_to_features(self):
+    return {
         self.params["source_field"]: tf.FixedLenFeature((), tf.string),
         self.params["target_field"]: tf.FixedLenFeature(
             (), tf.string, default_value="")
     }
 
+  def make_data_provider(self, **kwargs):
+
+    splitter_source, splitter_target = self._splitters()
+    keys_to_features = self._keys_to_features()
+
     items_to_handlers = {}
     items_to_handlers["source_tokens"] = tfexample_decoder.ItemHandlerCallback(
         keys=[self.params["source_field"]],
@@ -265,12 +443,34 @@ class TFRecordInputPipeline(InputPipeline):
         num_samples=None,
         items_to_descriptions={})
 
+    kwargs.setdefault("seed", self.params["seed"])
     return tf.contrib.slim.dataset_data_provider.DatasetDataProvider(
         dataset=dataset,
         shuffle=self.params["shuffle"],
         num_epochs=self.params["num_epochs"],
         **kwargs)
 
+  def make_record_dataset(self):
+    return read_files_dataset([expand_files(self.params["files"])],
+                              tf.data.TFRecordDataset, self.params)
+
+  def make_dataset(self):
+    splitter_source, splitter_target = self._splitters()
+    keys_to_features = self._keys_to_features()
+
+    def decode(serialized_example):
+      """Parses the example and splits the source and target text."""
+      parsed = tf.parse_single_example(serialized_example, keys_to_features)
+      example = _decode_to_dict(splitter_source,
+                                parsed[self.params["source_field"]])
+      example.update(
+          _decode_to_dict(splitter_target,
+                          parsed[self.params["target_field"]]))
+      return example
+
+    return self.make_record_dataset().map(
+        decode, num_parallel_calls=self.params["num_parallel_calls"])
+
   @property
   def feature_keys(self):
     return set(["source_tokens", "source_len"])
@@ -280,6 +480,118 @@ class TFRecordInputPipeline(InputPipeline):
     return set(["target_tokens", "target_len"])
 
 
+class IdShardInputPipeline(InputPipeline):
+  """An input pipeline that reads pre-tokenized id shards written by
+  `seq2seq.data.id_shards`. It provides `source_ids` and `target_ids`
+  directly, so the model skips splitting and vocabulary lookup. Only the
+  "dataset" input_pipeline is supported.
+
+  Params:
+    files: An array of shard prefixes or prefix patterns.
+    keep_tokens: If true, also provide `source_tokens` and `target_tokens`,
+      e.g. for hooks and metrics that print or score text.
+    vocab_source: The source vocabulary, only needed with keep_tokens.
+    vocab_target: The target vocabulary, only needed with keep_tokens.
+    read_block_size: The number of consecutive examples read from a shard
+      at once. Blocks are shuffled, the examples of a block are mixed by the
+      shuffle buffer.
+  """
+
+  @staticmethod
+  def default_params():
+    params = InputPipeline.default_params()
+    params.update({
+        "files": [],
+        "read_block_size": 512,
+        "keep_tokens": False,
+        "vocab_source": "",
+        "vocab_target": "",
+        "input_pipeline": "dataset",
+    })
+    return params
+
+  @property
+  def saves_position(self):
+    # The shards are read by a Python generator, whose state is not saved
+    return False
+
+  def make_data_provider(self, **kwargs):
+    raise NotImplementedError(
+        "IdShardInputPipeline only supports the dataset input_pipeline")
+
+  def _has_targets(self, prefixes):
+    return all(id_shards.IdShard(_).has_targets for _ in prefixes)
+
+  def make_dataset(self):
+    prefixes = id_shards.find_shards(self.params["files"])
+    has_targets = self._has_targets(prefixes)
+    num_sequences = 2 if has_targets else 1
+
+    def generator():
+      """Reads blocks of the shards in a background thread of tf.data."""
+      return id_shards.iterate_blocks(
+          prefixes,
+          block_size=self.params["read_block_size"],
+          shuffle=self.params["shuffle"],
+          num_epochs=self.params["num_epochs"],
+          seed=_shuffle_seed(self.params, 0))
+
+    dataset = tf.data.Dataset.from_generator(
+        generator,
+        output_types=(tf.int64, tf.int32) * num_sequences,
+        output_shapes=(tf.TensorShape([None, None]),
+                       tf.TensorShape([None])) * num_sequences)
+    # The examples of a block are split by tf.data, not in Python
+    dataset = dataset.flat_map(
+        lambda *block: tf.data.Dataset.from_tensor_slices(block))
+
+    names = ["source", "target"][:num_sequences]
+
+    def decode(*sequences):
+      """Removes the padding of the block from the ids."""
+      example = {}
+      for index, name in enumerate(names):
+        ids, length = sequences[2 * index:2 * index + 2]
+        example[name + "_ids"] = ids[:length]
+        example[name + "_len"] = length
+      return example
+
+    if self.params["shuffle"]:
+      dataset = dataset.shuffle(
+          self.params["shuffle_buffer_size"],
+          seed=_shuffle_seed(self.params, 1))
+    return dataset.map(
+        decode, num_parallel_calls=self.params["num_parallel_calls"])
+
+  def finish_batch(self, batch):
+    """Adds the tokens of the ids if `keep_tokens` is set, padded with the
+    PAD word."""
+    if not self.params["keep_tokens"]:
+      return batch
+    batch = dict(batch)
+    for name in ["source", "target"]:
+      if name + "_ids" in batch:
+        _, id_to_vocab_table, _, _ = vocab.create_vocabulary_lookup_table(
+            self.params["vocab_" + name])
+        batch[name + "_tokens"] = id_to_vocab_table.lookup(
+            batch[name + "_ids"])
+    return batch
+
+  @property
+  def feature_keys(self):
+    keys = set(["source_ids", "source_len"])
+    if self.params["keep_tokens"]:
+      keys.add("source_tokens")
+    return keys
+
+  @property
+  def label_keys(self):
+    keys = set(["target_ids", "target_len"])
+    if self.params["keep_tokens"]:
+      keys.add("target_tokens")
+    return keys
+
+
 class FeaturedTFRecordInputPipeline(InputPipeline):
   """An input pipeline that reads a TFRecords containing both source
   and target sequences.
@@ -292,13 +604,37 @@ class FeaturedTFRecordInputPipeline(InputPipeline):
       to  " " (space). For character-level training this can be set to the
       empty string.
     target_delimiter: Same as `source_delimiter` but for the target text.
+    format_version: The format of the string features, 0 for legacy files
+      with space joined tokens, 1 for one bytes value per token. Defaults to
+      None, which reads the version of every example.
+    parse_batches: If true, the "dataset" engine batches the serialized
+      records and parses every batch with one `parse_example` call. The
+      batches are padded like the ones of `padded_batch` but cannot be
+      bucketed by length.
+    manifest: A `<save_path>.manifest.json` written with the records, see
+      `seq2seq.data.record_shards`. If `files` is empty the shards of the
+      manifest are read and `num_samples` is its number of examples.
+    compression_type: "", "GZIP" or "ZLIB". Defaults to the compression of
+      the manifest, or no compression.
   """
 
+  def __init__(self, params, mode):
+    super(FeaturedTFRecordInputPipeline, self).__init__(params, mode)
+    if self.params["parse_batches"] and not self.use_dataset:
+      raise ValueError("parse_batches requires the dataset input_pipeline")
+    self._manifest = None
+    if self.params["manifest"]:
+      self._manifest = record_shards.read_manifest(self.params["manifest"])
+
   @staticmethod
   def default_params():
     params = InputPipeline.default_params()
     params.update({
         "files": [],
+        "format_version": None,
+        "parse_batches": False,
+        "manifest": None,
+        "compression_type": None,
         "source_tokens": "source_tokens",
         "source_len": "source_len",
         "source_oov_list": "source_oov_list",
@@ -320,24 +656,83 @@ class FeaturedTFRecordInputPipeline(InputPipeline):
     })
     return params
 
-  def make_data_provider(self, **kwargs):
+  def _decoder(self):
+    format_version = self.params["format_version"]
+    if format_version is not None:
+      format_version = int(format_version)
+    return featuredRecordDecoder.FeaturedTFExampleDecoder(
+        global_vars.source_keys_to_features,
+        global_vars.target_keys_to_features,
+        format_version=format_version)
+
+  def _files(self):
+    if not self.params["files"] and self._manifest is not None:
+      return [shard["path"] for shard in self._manifest["shards"]]
+    return expand_files(self.params["files"])
+
+  def _compression_type(self):
+    if self.params["compression_type"] is not None:
+      return self.params["compression_type"]
+    if self._manifest is not None:
+      return self._manifest["compression"]
+    return ""
+
+  def make_record_dataset(self):
+    compression_type = self._compression_type()
+    return read_files_dataset(
+        [self._files()],
+        lambda filename: tf.data.TFRecordDataset(
+            filename, compression_type=compression_type),
+        self.params)
 
-    source_keys_to_features = global_vars.source_keys_to_features
-    target_keys_to_features = global_vars.target_keys_to_features
-    decoder = featuredRecordDecoder.FeaturedTFExampleDecoder(source_keys_to_features, target_keys_to_features)
+  @property
+  def num_samples(self):
+    """The number of examples of the manifest shards, None if the pipeline
+    reads `files`."""
+    if self.params["files"] or self._manifest is None:
+      return None
+    return self._manifest["num_examples"]
+
+  def make_data_provider(self, **kwargs):
     dataset = tf.contrib.slim.dataset.Dataset(
-        data_sources=self.params["files"],
+        data_sources=self._files(),
         reader=tf.TFRecordReader,
-        decoder=decoder,
-        num_samples=None,
+        decoder=self._decoder(),
+        num_samples=self.num_samples,
         items_to_descriptions={})
 
+    # Parallel readers do not keep the order of the records
+    if self.params["shuffle"]:
+      kwargs.setdefault("num_readers", self.params["num_readers"])
+    options = record_shards.record_options(self._compression_type())
+    if options is not None:
+      kwargs.setdefault("reader_kwargs", {"options": options})
+    kwargs.setdefault("seed", self.params["seed"])
+
     return FeaturedDataProvider(
         dataset=dataset,
         shuffle=self.params["shuffle"],
         num_epochs=self.params["num_epochs"],
         **kwargs)
 
+  def make_dataset(self):
+    decoder = self._decoder()
+    dataset = self.make_record_dataset()
+    return dataset.map(
+        lambda record: _decode_to_dict(decoder, record),
+        num_parallel_calls=self.params["num_parallel_calls"])
+
+  @property
+  def parses_batches(self):
+    return self.params["parse_batches"]
+
+  def make_batched_dataset(self, batch_size):
+    decoder = self._decoder()
+    dataset = self.make_record_dataset().batch(batch_size)
+    return dataset.map(
+        lambda records: decoder.decode_batch(records),
+        num_parallel_calls=self.params["num_parallel_calls"])
+
   @property
   def feature_keys(self):
     return set(global_vars.source_feature_keys + ["source_len"])
@@ -412,6 +807,7 @@ class ImageCaptioningInputPipeline(InputPipeline):
         num_samples=None,
         items_to_descriptions={})
 
+    kwargs.setdefault("seed", self.params["seed"])
     return tf.contrib.slim.dataset_data_provider.DatasetDataProvider(
         dataset=dataset,
         shuffle=self.params["shuffle"],
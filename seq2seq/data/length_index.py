@@ -0,0 +1,317 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Sequence length index of a parallel text corpus, used to choose bucket
+boundaries.
+
+The index of a file pair is a 2-D histogram where `histogram[s, t]` is the
+number of examples with source length `s` and target length `t`. Lengths
+are counted like `ParallelTextInputPipeline` does, i.e. including the
+SEQUENCE_START and SEQUENCE_END tokens. The index of every source file is
+cached next to it in `<source_file>.lengths.npz`.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import re
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import gfile
+
+from seq2seq.data import input_pipeline
+
+LENGTH_INDEX_SUFFIX = ".lengths.npz"
+
+# Changes whenever lengths are counted differently, invalidating the caches
+_INDEX_VERSION = 1
+
+
+def _count_tokens(line, delimiter):
+  """Counts the tokens of a line like `tf.string_split` splits them: on
+  every character of the delimiter, without empty tokens, and into bytes
+  if the delimiter is empty."""
+  line = line.rstrip("\n")
+  if delimiter == "":
+    return len(line.encode("utf-8"))
+  return len([_ for _ in re.split("[" + re.escape(delimiter) + "]", line) if _])
+
+
+def _read_lines(path):
+  with gfile.GFile(path) as file:
+    for line in file:
+      if isinstance(line, bytes):
+        line = line.decode("utf-8")
+      yield line
+
+
+def scan_lengths(source_file,
+                 target_file=None,
+                 source_delimiter=" ",
+                 target_delimiter=" "):
+  """Reads a file pair once and returns its length histogram.
+
+  Args:
+    source_file: Path to the source text.
+    target_file: Path to the aligned target text, or None.
+    source_delimiter: The delimiter of the source tokens.
+    target_delimiter: The delimiter of the target tokens.
+
+  Returns:
+    An int64 array of shape `[max_source_len + 1, max_target_len + 1]`. All
+    target lengths are 0 if there is no target file.
+  """
+  # Source gets SEQUENCE_END, target SEQUENCE_START and SEQUENCE_END
+  source_lengths = [_count_tokens(_, source_delimiter) + 1
+                    for _ in _read_lines(source_file)]
+  if target_file is None:
+    target_lengths = [0] * len(source_lengths)
+  else:
+    target_lengths = [_count_tokens(_, target_delimiter) + 2
+                      for _ in _read_lines(target_file)]
+  if len(source_lengths) != len(target_lengths):
+    raise ValueError("{} and {} are not aligned: {} vs {} lines".format(
+        source_file, target_file, len(source_lengths), len(target_lengths)))
+
+  source_lengths = np.array(source_lengths, dtype=np.int64)
+  target_lengths = np.array(target_lengths, dtype=np.int64)
+  histogram = np.zeros(
+      [max(source_lengths.tolist() + [0]) + 1,
+       max(target_lengths.tolist() + [0]) + 1],
+      dtype=np.int64)
+  np.add.at(histogram, (source_lengths, target_lengths), 1)
+  return histogram
+
+
+def _file_stamp(path):
+  """Size and modification time, used to invalidate cached indices."""
+  if path is None:
+    return np.array([-1, -1], dtype=np.int64)
+  stat = gfile.Stat(path)
+  return np.array([stat.length, stat.mtime_nsec], dtype=np.int64)
+
+
+def _cache_key(source_file, target_file, source_delimiter, target_delimiter):
+  return np.concatenate([
+      [_INDEX_VERSION],
+      _file_stamp(source_file), _file_stamp(target_file),
+      [ord(_) for _ in source_delimiter] + [-1],
+      [ord(_) for _ in target_delimiter]
+  ]).astype(np.int64)
+
+
+def _load_cached(path, key):
+  if not gfile.Exists(path):
+    return None
+  with gfile.GFile(path, "rb") as file:
+    cached = np.load(io.BytesIO(file.read()))
+    if not np.array_equal(cached["key"], key):
+      return None
+    return cached["histogram"]
+
+
+def _save_cached(path, key, histogram):
+  buffer = io.BytesIO()
+  np.savez(buffer, key=key, histogram=histogram)
+  try:
+    with gfile.GFile(path, "wb") as file:
+      file.write(buffer.getvalue())
+  except tf.errors.OpError as error:
+    tf.logging.warning("Could not cache length index %s: %s", path, error)
+
+
+def merge_histograms(histograms):
+  """Sums histograms of different shapes."""
+  shape = np.max([_.shape for _ in histograms], axis=0)
+  merged = np.zeros(shape, dtype=np.int64)
+  for histogram in histograms:
+    merged[:histogram.shape[0], :histogram.shape[1]] += histogram
+  return merged
+
+
+def load_length_index(source_files,
+                      target_files=None,
+                      source_delimiter=" ",
+                      target_delimiter=" ",
+                      use_cache=True):
+  """Returns the length histogram of a sharded parallel corpus. Shards with
+  an up to date cached index are not read again.
+
+  Args:
+    source_files: A list of source file names.
+    target_files: A list of aligned target file names, or None.
+    source_delimiter: The delimiter of the source tokens.
+    target_delimiter: The delimiter of the target tokens.
+    use_cache: Read and write `<source_file>.lengths.npz`.
+
+  Returns:
+    The histogram of all shards, see `scan_lengths`.
+  """
+  if not target_files:
+    target_files = [None] * len(source_files)
+  if len(source_files) != len(target_files):
+    raise ValueError("Got {} source files but {} target files".format(
+        len(source_files), len(target_files)))
+
+  histograms = []
+  for source_file, target_file in zip(source_files, target_files):
+    path = source_file + LENGTH_INDEX_SUFFIX
+    key = _cache_key(source_file, target_file, source_delimiter,
+                     target_delimiter)
+    histogram = _load_cached(path, key) if use_cache else None
+    if histogram is None:
+      tf.logging.info("Building length index of %s", source_file)
+      histogram = scan_lengths(source_file, target_file, source_delimiter,
+                               target_delimiter)
+      if use_cache:
+        _save_cached(path, key, histogram)
+    histograms.append(histogram)
+  return merge_histograms(histograms)
+
+
+def _bucket_length_grid(histogram, by):
+  """The length examples are bucketed by, for every histogram cell."""
+  source_len, target_len = np.indices(histogram.shape)
+  if by == "source":
+    return source_len
+  if by == "max":
+    return np.maximum(source_len, target_len)
+  raise ValueError("Unknown bucket length: {}".format(by))
+
+
+def bucket_length_counts(histogram, by="source"):
+  """Returns the number of examples per bucketing length.
+
+  Args:
+    histogram: A length histogram, see `scan_lengths`.
+    by: "source" to bucket by the source length like `create_input_fn`
+      does by default, "max" for the longer of source and target like it does
+      with `max_tokens_per_batch`.
+  """
+  lengths = _bucket_length_grid(histogram, by)
+  return np.bincount(lengths.ravel(), weights=histogram.ravel()).astype(
+      np.int64)
+
+
+def choose_bucket_boundaries(length_counts, num_buckets):
+  """Chooses the bucket boundaries that minimize the padding.
+
+  Every example is assumed to be padded to the longest length of its bucket,
+  an upper bound of the padding to the longest example of its batch. The
+  optimal split of the sorted lengths is found by dynamic programming.
+
+  Args:
+    length_counts: The number of examples of every length.
+    num_buckets: The maximum number of buckets.
+
+  Returns:
+    The increasing boundaries, at most `num_buckets - 1` of them, in the
+    format of `bucket_boundaries` of `create_input_fn`.
+  """
+  lengths = np.flatnonzero(length_counts)
+  counts = length_counts[lengths].astype(np.float64)
+  num_lengths = len(lengths)
+  num_buckets = min(num_buckets, num_lengths)
+  if num_buckets <= 1:
+    return []
+
+  # cost(i, j) of a bucket with lengths[i:j] padded to lengths[j - 1]
+  count_sums = np.concatenate([[0.], np.cumsum(counts)])
+  token_sums = np.concatenate([[0.], np.cumsum(counts * lengths)])
+
+  def bucket_costs(end):
+    starts = np.arange(end)
+    return (lengths[end - 1] * (count_sums[end] - count_sums[starts]) -
+            (token_sums[end] - token_sums[starts]))
+
+  # costs[k, j]: best cost of lengths[:j] in k + 1 buckets
+  costs = np.full([num_buckets, num_lengths + 1], np.inf)
+  splits = np.zeros([num_buckets, num_lengths + 1], dtype=np.int64)
+  for end in range(1, num_lengths + 1):
+    costs[0, end] = bucket_costs(end)[0]
+  for k in range(1, num_buckets):
+    for end in range(k + 1, num_lengths + 1):
+      candidates = costs[k - 1, :end] + bucket_costs(end)
+      splits[k, end] = np.argmin(candidates)
+      costs[k, end] = candidates[splits[k, end]]
+
+  boundaries = []
+  end = num_lengths
+  for k in range(num_buckets - 1, 0, -1):
+    end = splits[k, end]
+    boundaries.append(int(lengths[end - 1]) + 1)
+  return sorted(boundaries)
+
+
+def expected_padding_ratio(histogram, bucket_boundaries, by="source"):
+  """The expected fraction of padding tokens in source and target batches.
+
+  Every example is padded to the longest source and target of its bucket,
+  so this is an upper bound of the padding of the actual batches.
+
+  Args:
+    histogram: A length histogram, see `scan_lengths`.
+    bucket_boundaries: The bucket boundaries, empty for no bucketing.
+    by: The bucketing length, see `bucket_length_counts`.
+
+  Returns:
+    A float in `[0, 1)`.
+  """
+  source_len, target_len = np.indices(histogram.shape)
+  buckets = np.searchsorted(
+      np.array(bucket_boundaries, dtype=np.int64),
+      _bucket_length_grid(histogram, by), side="right")
+
+  num_tokens = np.sum(histogram * (source_len + target_len))
+  num_padded_tokens = 0
+  for bucket in np.unique(buckets[histogram > 0]):
+    in_bucket = (buckets == bucket) & (histogram > 0)
+    num_padded_tokens += np.sum(histogram[in_bucket]) * (
+        source_len[in_bucket].max() + target_len[in_bucket].max())
+  if num_padded_tokens == 0:
+    return 0.
+  return 1. - float(num_tokens) / num_padded_tokens
+
+
+def auto_bucket_boundaries(pipeline_params, num_buckets, by="source"):
+  """Chooses bucket boundaries for the files of a `ParallelTextInputPipeline`.
+
+  Args:
+    pipeline_params: The params of the input pipeline.
+    num_buckets: The maximum number of buckets.
+    by: The bucketing length, see `bucket_length_counts`.
+
+  Returns:
+    A tuple `(bucket_boundaries, expected_padding_ratio)`.
+  """
+  if "source_files" not in pipeline_params:
+    raise ValueError(
+        "Automatic buckets need the source_files of a parallel text pipeline")
+  # The index is cached per file, so glob patterns are expanded like the
+  # pipeline does
+  source_files = input_pipeline.expand_files(pipeline_params["source_files"])
+  target_files = pipeline_params.get("target_files")
+  if target_files:
+    target_files = input_pipeline.expand_files(target_files)
+  histogram = load_length_index(
+      source_files=source_files,
+      target_files=target_files,
+      source_delimiter=pipeline_params.get("source_delimiter", " "),
+      target_delimiter=pipeline_params.get("target_delimiter", " "))
+  boundaries = choose_bucket_boundaries(
+      bucket_length_counts(histogram, by), num_buckets)
+  return boundaries, expected_padding_ratio(histogram, boundaries, by)
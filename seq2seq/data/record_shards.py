@@ -0,0 +1,224 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Sharded TFRecord files with a manifest.
+
+`ShardedRecordWriter` writes examples to `<save_path>.<prefix><n>` files,
+starting a new shard every `max_examples` examples, on a background thread.
+`write_manifest` writes `<save_path>.manifest.json`:
+
+  {
+    "num_examples": 12345,
+    "compression": "GZIP",
+    "shards": [
+      {"path": "train.0", "num_examples": 10000,
+       "lengths": {"source_ids": {"min": 2, "max": 40, "mean": 11.5}, ...}},
+      ...
+    ]
+  }
+
+Shard paths are relative to the directory of the manifest.
+`FeaturedTFRecordInputPipeline` reads the files, the number of examples and
+the compression of its `manifest` param.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import os
+import threading
+
+from six.moves import queue
+
+import tensorflow as tf
+from tensorflow import gfile
+
+MANIFEST_SUFFIX = ".manifest.json"
+COMPRESSION_TYPES = ["", "GZIP", "ZLIB"]
+
+
+def _check_compression(compression):
+  compression = (compression or "").upper()
+  if compression not in COMPRESSION_TYPES:
+    raise ValueError("Unknown compression {}, expected one of {}".format(
+        compression, COMPRESSION_TYPES))
+  return compression
+
+
+def record_options(compression):
+  """Returns the `TFRecordOptions` of a compression type, or None."""
+  compression = _check_compression(compression)
+  if not compression:
+    return None
+  return tf.python_io.TFRecordOptions(
+      getattr(tf.python_io.TFRecordCompressionType, compression))
+
+
+def _feature_length(feature):
+  kind = feature.WhichOneof("kind")
+  if kind is None:
+    return 0
+  return len(getattr(feature, kind).value)
+
+
+class _LengthStats(object):
+  """Minimum, maximum and mean number of values of a feature."""
+
+  def __init__(self):
+    self.min = None
+    self.max = None
+    self.sum = 0
+    self.num = 0
+
+  def add(self, length):
+    self.min = length if self.min is None else min(self.min, length)
+    self.max = length if self.max is None else max(self.max, length)
+    self.sum += length
+    self.num += 1
+
+  def to_dict(self):
+    return {"min": self.min, "max": self.max,
+            "mean": self.sum / max(self.num, 1)}
+
+
+class ShardedRecordWriter(object):
+  """Writes examples to TFRecord files `<save_path>.<prefix><n>`, starting a
+  new file every `max_examples` examples, and records what it wrote.
+
+  `write` serializes the example and puts it on a bounded queue, a background
+  thread writes (and compresses) the records, so preparing the next examples
+  overlaps with the I/O. Errors of the thread are raised by the next `write`
+  or by `close`. After `close`, `shards` lists the path (a basename), the
+  number of examples and the length stats of every shard.
+
+  Args:
+    save_path: The path prefix of the shards.
+    max_examples: The maximum number of examples per shard.
+    prefix: A prefix of the shard numbers.
+    compression: None, "GZIP" or "ZLIB".
+    length_keys: The features whose number of values are summarized per
+      shard. Defaults to all features of the examples.
+    queue_size: The maximum number of records waiting to be written.
+  """
+
+  def __init__(self, save_path, max_examples, prefix="", compression=None,
+               length_keys=None, queue_size=1000):
+    self._save_path = save_path
+    self._max_examples = max_examples
+    self._prefix = prefix
+    self._options = record_options(compression)
+    self._length_keys = length_keys
+    self.shards = []
+    self._queue = queue.Queue(maxsize=queue_size)
+    self._error = None
+    self._thread = threading.Thread(target=self._run)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def _run(self):
+    writer, lengths = None, None
+    try:
+      while True:
+        item = self._queue.get()
+        if item is None:
+          break
+        if writer is None or self.shards[-1]["num_examples"] == self._max_examples:
+          if writer is not None:
+            writer.close()
+            self._finish_shard(lengths)
+          path = "{}.{}{}".format(self._save_path, self._prefix, len(self.shards))
+          writer = tf.python_io.TFRecordWriter(path, options=self._options)
+          self.shards.append({"path": os.path.basename(path), "num_examples": 0})
+          lengths = {}
+        record, example_lengths = item
+        writer.write(record)
+        self.shards[-1]["num_examples"] += 1
+        for key, length in example_lengths:
+          lengths.setdefault(key, _LengthStats()).add(length)
+      if writer is not None:
+        writer.close()
+        self._finish_shard(lengths)
+    except Exception as error:  # pylint: disable=broad-except
+      self._error = error
+      # unblock a producer waiting on the full queue
+      while True:
+        try:
+          self._queue.get_nowait()
+        except queue.Empty:
+          break
+
+  def _finish_shard(self, lengths):
+    self.shards[-1]["lengths"] = {
+        key: stats.to_dict() for key, stats in sorted(lengths.items())}
+
+  def _raise_error(self):
+    if self._error is not None:
+      raise self._error
+
+  def _put(self, item):
+    while True:
+      self._raise_error()
+      if not self._thread.is_alive():
+        if item is not None:
+          raise ValueError("The writer of {} is closed".format(self._save_path))
+        return
+      try:
+        self._queue.put(item, timeout=0.1)
+        return
+      except queue.Full:
+        continue
+
+  def write(self, example):
+    """Queues a `tf.train.Example`."""
+    features = example.features.feature
+    keys = self._length_keys if self._length_keys is not None else features
+    example_lengths = [(key, _feature_length(features[key]))
+                       for key in keys if key in features]
+    self._put((example.SerializeToString(), example_lengths))
+
+  def close(self):
+    """Writes the queued records and closes the last shard."""
+    self._put(None)
+    self._thread.join()
+    self._raise_error()
+
+
+def manifest_path(save_path):
+  return save_path + MANIFEST_SUFFIX
+
+
+def write_manifest(save_path, shards, compression=None):
+  """Writes `<save_path>.manifest.json` listing the shards and their sizes."""
+  manifest = {
+      "num_examples": sum(shard["num_examples"] for shard in shards),
+      "compression": _check_compression(compression),
+      "shards": shards,
+  }
+  path = manifest_path(save_path)
+  with gfile.GFile(path, "w") as file:
+    file.write(json.dumps(manifest, indent=2, sort_keys=True))
+  return path
+
+
+def read_manifest(path):
+  """Reads a manifest and makes its shard paths absolute."""
+  with gfile.GFile(path) as file:
+    manifest = json.loads(file.read())
+  directory = os.path.dirname(path)
+  for shard in manifest["shards"]:
+    shard["path"] = os.path.join(directory, shard["path"])
+  manifest.setdefault("compression", "")
+  return manifest
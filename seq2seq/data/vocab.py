@@ -23,10 +23,15 @@ from __future__ import print_function
 total vocab = special_words + actual vocab
 """
 
+import os
 import codecs
+import io
 import six
 import csv
+import zlib
+import tempfile
 import collections
+import numpy as np
 import tensorflow as tf
 from tensorflow import gfile
 from seq2seq.features import SpecialWordsIns
@@ -68,60 +73,125 @@ def get_special_vocab(first_index=0, special_words=SpecialWords):
   """
   return SpecialVocab(*range(first_index, first_index+len(special_words)))
 
-def create_tensor_vocab(vocab_instance):
-  """create embedding's all kinds of tensor from vocab_cls
-  :param vocab_instance: 
-  :return: 
-  """
-  assert isinstance(vocab_instance, Vocab)
-  word_to_ids = vocab_instance._word_to_id
-  word_to_count = vocab_instance._word_to_count
-
-  vocab, ids = list(word_to_ids.keys()), list(word_to_ids.values())
-  vocab_size = len(vocab)
-
-  counts = [word_to_count[v] for v in word_to_count]
-  count_tensor = tf.constant(counts, dtype=tf.int64)
-  vocab_tensor = tf.constant(vocab)
-  vocab_idx_tensor = tf.constant(ids, dtype=tf.int64)
+LOOKUP_TABLE_SUFFIX = ".table.tsv"
+
+# (vocab file, size, mtime) -> (table file, vocab size)
+_table_files = {}
+
+
+def _write_once(path, content):
+  """Writes a file unless it exists. Workers sharing the vocabulary may
+  write the same file concurrently, so it is renamed into place."""
+  if gfile.Exists(path):
+    return
+  tmp_path = "{}.tmp{}".format(path, os.getpid())
+  with gfile.GFile(tmp_path, "wb") as file:
+    file.write(content)
+  gfile.Rename(tmp_path, path, overwrite=True)
+
+
+def _write_table_file(vocab_file, words, counts):
+  """Returns a file of "word\tcount" lines for `TextFileInitializer`s.
+
+  The vocabulary file itself is used if it already consists of these lines.
+  Otherwise they are written next to it, named by the checksum of their
+  content, and kept, so graphs and exported models referencing the file
+  stay usable. If the vocabulary directory is not writable, e.g. a read-only
+  mount, the file is written to the temp directory instead."""
+  lines = []
+  for word, count in zip(words, counts):
+    if isinstance(word, bytes):
+      word = word.decode("utf-8")
+    if "\t" in word or "\n" in word:
+      raise ValueError("Vocabulary words must not contain tabs: {!r}".format(word))
+    lines.append(u"{}\t{}\n".format(word, count))
+  content = u"".join(lines).encode("utf-8")
+
+  if gfile.Stat(vocab_file).length == len(content):
+    with gfile.GFile(vocab_file, "rb") as file:
+      if file.read() == content:
+        return vocab_file
+
+  name = "{}.{:08x}{}".format(os.path.basename(vocab_file),
+                              zlib.crc32(content) & 0xffffffff,
+                              LOOKUP_TABLE_SUFFIX)
+  path = os.path.join(os.path.dirname(vocab_file), name)
+  try:
+    _write_once(path, content)
+  except tf.errors.OpError as error:
+    tmp_path = os.path.join(tempfile.gettempdir(), name)
+    tf.logging.warning("Could not write vocabulary table %s, writing %s "
+                       "instead: %s", path, tmp_path, error)
+    _write_once(tmp_path, content)
+    path = tmp_path
+  return path
+
+
+def _file_lookup_tables(table_file, vocab_size, default_value, count_dtype):
+  """Creates the word -> id, id -> word and word -> count tables of a file
+  written by `_write_table_file`. The graph only keeps the file name, which
+  is registered as an asset."""
+  line_number = tf.contrib.lookup.TextFileIndex.LINE_NUMBER
+  table_file = tf.constant(table_file, dtype=tf.string, name="vocab_table_file")
 
   # Create ID -> word mapping
-  id_to_vocab_init = tf.contrib.lookup.KeyValueTensorInitializer(
-      vocab_idx_tensor, vocab_tensor, tf.int64, tf.string)
+  id_to_vocab_init = tf.contrib.lookup.TextFileInitializer(
+      table_file, tf.int64, line_number, tf.string, 0,
+      vocab_size=vocab_size, delimiter="\t")
   id_to_vocab_table = tf.contrib.lookup.HashTable(id_to_vocab_init, "UNK")
 
   # Create word -> id mapping
-  vocab_to_id_init = tf.contrib.lookup.KeyValueTensorInitializer(
-      vocab_tensor, vocab_idx_tensor, tf.string, tf.int64)
+  vocab_to_id_init = tf.contrib.lookup.TextFileInitializer(
+      table_file, tf.string, 0, tf.int64, line_number,
+      vocab_size=vocab_size, delimiter="\t")
   vocab_to_id_table = tf.contrib.lookup.HashTable(vocab_to_id_init,
-                                                  vocab_instance.special_vocab.UNK)
+                                                  default_value)
 
   # Create word -> count mapping
-  word_to_count_init = tf.contrib.lookup.KeyValueTensorInitializer(
-      vocab_tensor, count_tensor, tf.string, tf.int64)
+  word_to_count_init = tf.contrib.lookup.TextFileInitializer(
+      table_file, tf.string, 0, count_dtype, 1,
+      vocab_size=vocab_size, delimiter="\t")
   word_to_count_table = tf.contrib.lookup.HashTable(word_to_count_init, -1)
 
+  if table_file not in tf.get_collection(tf.GraphKeys.ASSET_FILEPATHS):
+    tf.add_to_collection(tf.GraphKeys.ASSET_FILEPATHS, table_file)
+
+  return vocab_to_id_table, id_to_vocab_table, word_to_count_table
+
+
+def create_tensor_vocab(vocab_instance):
+  """create embedding's all kinds of tensor from vocab_cls
+  :param vocab_instance: 
+  :return: 
+  """
+  assert isinstance(vocab_instance, (Vocab, CompactVocab))
+  if vocab_instance._vocab_file is None:
+    raise ValueError("The tables of a vocab are initialized from its vocab "
+                     "file, but the vocab was not read from a file")
+  # The table file is written once per vocab instance
+  table_file = getattr(vocab_instance, "_table_file", None)
+  if table_file is None:
+    table_file = _write_table_file(vocab_instance._vocab_file,
+                                   vocab_instance.words(), vocab_instance.counts())
+    vocab_instance._table_file = table_file
+  vocab_size = vocab_instance.size()
+
+  vocab_to_id_table, id_to_vocab_table, word_to_count_table = _file_lookup_tables(
+      table_file, vocab_size, vocab_instance.special_vocab.UNK, tf.int64)
+
   return vocab_to_id_table, id_to_vocab_table, word_to_count_table, vocab_size
 
-def create_vocabulary_lookup_table(filename, default_value=None):
-  """Creates a lookup table for a vocabulary file.
-  Args:
-    filename: Path to a vocabulary file containg one word per line.
-      Each word is mapped to its line number.
-    default_value: UNK tokens will be mapped to this id.
-      If None, UNK tokens will be mapped to [vocab_size]
-    Returns:
-      A tuple (vocab_to_id_table, id_to_vocab_table,
-      word_to_count_table, vocab_size). The vocab size does not include
-      the UNK token.
-    """
-  if not gfile.Exists(filename):
-    raise ValueError("File does not exist: {}".format(filename))
+def _vocabulary_table_file(filename):
+  """Returns the table file and size of a vocabulary file with the special
+  words prepended, rewriting it only when the vocabulary file changed."""
+  stat = gfile.Stat(filename)
+  key = (filename, stat.length, stat.mtime_nsec)
+  if key in _table_files:
+    return _table_files[key]
 
   # Load vocabulary into memory
   with gfile.GFile(filename) as file:
     vocab = list(line.strip("\n") for line in file)
-  vocab_size = len(vocab)
 
   has_counts = len(vocab[0].split()) == 2
   if has_counts:
@@ -133,38 +203,70 @@ def create_vocabulary_lookup_table(filename, default_value=None):
 
   # Add special vocabulary items
   special_vocab = get_special_vocab(first_index=0)
-  vocab_size = len(special_vocab) + vocab_size
-
   vocab = list(special_vocab._fields) + vocab
   counts = [-1. for _ in list(special_vocab._fields)] + counts
 
-  if default_value is None:
-    default_value = special_vocab.UNK
+  _table_files[key] = (_write_table_file(filename, vocab, counts), len(vocab))
+  return _table_files[key]
 
-  tf.logging.info("Creating vocabulary lookup table of size %d", vocab_size)
+def create_vocabulary_lookup_table(filename, default_value=None):
+  """Creates a lookup table for a vocabulary file. The tables are
+  initialized from a copy of the file with the special words prepended,
+  so the vocabulary is not stored in the graph.
 
-  vocab_tensor = tf.constant(vocab)
-  count_tensor = tf.constant(counts, dtype=tf.float32)
-  vocab_idx_tensor = tf.range(vocab_size, dtype=tf.int64)
+  Args:
+    filename: Path to a vocabulary file containg one word per line.
+      Each word is mapped to its line number.
+    default_value: UNK tokens will be mapped to this id.
+      If None, UNK tokens will be mapped to [vocab_size]
+    Returns:
+      A tuple (vocab_to_id_table, id_to_vocab_table,
+      word_to_count_table, vocab_size). The vocab size does not include
+      the UNK token.
+    """
+  if not gfile.Exists(filename):
+    raise ValueError("File does not exist: {}".format(filename))
 
-  # Create ID -> word mapping
-  id_to_vocab_init = tf.contrib.lookup.KeyValueTensorInitializer(
-      vocab_idx_tensor, vocab_tensor, tf.int64, tf.string)
-  id_to_vocab_table = tf.contrib.lookup.HashTable(id_to_vocab_init, "UNK")
+  table_file, vocab_size = _vocabulary_table_file(filename)
 
-  # Create word -> id mapping
-  vocab_to_id_init = tf.contrib.lookup.KeyValueTensorInitializer(
-      vocab_tensor, vocab_idx_tensor, tf.string, tf.int64)
-  vocab_to_id_table = tf.contrib.lookup.HashTable(vocab_to_id_init,
-                                                  default_value)
+  if default_value is None:
+    default_value = get_special_vocab(first_index=0).UNK
 
-  # Create word -> count mapping
-  word_to_count_init = tf.contrib.lookup.KeyValueTensorInitializer(
-      vocab_tensor, count_tensor, tf.string, tf.float32)
-  word_to_count_table = tf.contrib.lookup.HashTable(word_to_count_init, -1)
+  tf.logging.info("Creating vocabulary lookup table of size %d", vocab_size)
+
+  vocab_to_id_table, id_to_vocab_table, word_to_count_table = _file_lookup_tables(
+      table_file, vocab_size, default_value, tf.float32)
 
   return vocab_to_id_table, id_to_vocab_table, word_to_count_table, vocab_size
 
+def _read_vocab_file(vocab_file, special_words, value_index=1, max_size=None):
+  """Reads the words and counts of a vocab file, checking that it has no
+  duplicated or special words. `max_size` includes the special words."""
+  words, counts = [], []
+  seen = set(special_words)
+  with codecs.open(vocab_file, 'r', "utf-8") as vocab_f:
+    for line in vocab_f:
+      pieces = line.strip().split()
+      if len(pieces) == 0:
+        continue
+      count = -1
+      if len(pieces) >= 2:
+       count = int(pieces[value_index])
+      w = pieces[0]
+      if w in special_words:
+        s = " ".join(special_words)
+        raise Exception('{} shouldn\'t be in the vocab file, but {} is'.format(s,w))
+      if w in seen:
+        raise Exception('Duplicated word in vocabulary file: %s' % w)
+      seen.add(w)
+      words.append(w)
+      counts.append(count)
+      if max_size is not None and len(special_words) + len(words) >= max_size:
+        print("max_size of vocab was specified as %i; we now have %i words. Stopping reading." % (max_size, len(special_words) + len(words)))
+        break
+  return words, counts
+
+
 class Vocab(object):
   """Vocabulary class for mapping between words and ids (integers)"""
 
@@ -197,24 +299,8 @@ class Vocab(object):
       self.addWord(w, -1)
 
     # Read the vocab file and add words up to max_size
-    with codecs.open(vocab_file, 'r', "utf-8") as vocab_f:
-      for line in vocab_f:
-        pieces = line.strip().split()
-        if len(pieces) == 0:
-          continue
-        count = -1
-        if len(pieces) >= 2:
-         count = int(pieces[value_index])
-        w = pieces[0]
-        if w in special_words:
-          s = " ".join(special_words)
-          raise Exception('{} shouldn\'t be in the vocab file, but {} is'.format(s,w))
-        if w in self._word_to_id:
-          raise Exception('Duplicated word in vocabulary file: %s' % w)
-        self.addWord(w, count)
-        if max_size is not None and self._count >= max_size:
-          print("max_size of vocab was specified as %i; we now have %i words. Stopping reading." % (max_size, self._count))
-          break
+    for w, count in zip(*_read_vocab_file(vocab_file, special_words, value_index, max_size)):
+      self.addWord(w, count)
 
     last_word = self._id_to_word[self._count-1]
     if six.PY2:
@@ -239,6 +325,14 @@ class Vocab(object):
     """Returns the total size of the vocabulary"""
     return self._count
 
+  def words(self):
+    """Returns all words, indexed by id."""
+    return [self._id_to_word[i] for i in range(self._count)]
+
+  def counts(self):
+    """Returns the counts of all words, indexed by id. Special words have -1."""
+    return [self._word_to_count[self._id_to_word[i]] for i in range(self._count)]
+
   def addWord(self, word, count=-1):
     if word not in self._word_to_id:
       word_id = self._count
@@ -264,6 +358,230 @@ class Vocab(object):
 
 
 
+VOCAB_SNAPSHOT_SUFFIX = ".vocab.npz"
+
+
+def _to_bytes(word):
+  if isinstance(word, six.text_type):
+    return word.encode("utf-8")
+  return word
+
+
+class CompactVocab(object):
+  """A read-only `Vocab` kept in a few numpy arrays.
+
+  The utf-8 bytes of all words are concatenated in id order into one blob
+  with an offsets array, next to an open addressing hash table of ids that
+  `_lookup` probes without decoding the words. `load_vocab` caches these
+  arrays in a `.vocab.npz` snapshot next to the vocab file, so loading it
+  again does not parse the text. The word -> id dict and the word array
+  used by `word2id` and the batch methods are built from the blob on first
+  use.
+
+  Args:
+    words: all words including the special words, indexed by id.
+    counts: the counts of the words, -1 for special words.
+    special_word_ins: the special words, must be the first words.
+  """
+
+  def __init__(self, words, counts, special_word_ins=SpecialWordsIns, _arrays=None):
+    self._vocab_file = None
+    self.special_word_ins = special_word_ins
+    self.special_vocab = None if special_word_ins is None else get_special_vocab(0, special_word_ins._total_words)
+    if _arrays is None:
+      _arrays = self._build_arrays(words, counts)
+    blob, self._offsets, self._counts, self._table = _arrays
+    self._blob = blob.tobytes() if isinstance(blob, np.ndarray) else blob
+    self._mask = len(self._table) - 1
+    self._unk_id = None if special_word_ins is None else self.special_vocab.UNK
+    self._word_array = None
+    self._word_to_id = None
+
+  @staticmethod
+  def _build_arrays(words, counts):
+    encoded = [_to_bytes(w) for w in words]
+    offsets = np.zeros([len(encoded) + 1], dtype=np.int64)
+    offsets[1:] = np.cumsum([len(w) for w in encoded])
+    table_size = 1
+    while table_size < 2 * max(len(encoded), 1):
+      table_size *= 2
+    table = np.full([table_size], -1, dtype=np.int32)
+    mask = table_size - 1
+    for word_id, w in enumerate(encoded):
+      slot = zlib.crc32(w) & mask
+      while table[slot] >= 0:
+        slot = (slot + 1) & mask
+      table[slot] = word_id
+    return b"".join(encoded), offsets, np.array(counts, dtype=np.int64), table
+
+  @classmethod
+  def from_file(cls, vocab_file, special_word_ins=SpecialWordsIns, value_index=1, max_size=None):
+    """Builds the vocab from a text vocab file like `Vocab`."""
+    special_words = [] if special_word_ins is None else special_word_ins._total_words
+    words, counts = _read_vocab_file(vocab_file, special_words, value_index, max_size)
+    vocab_instance = cls(list(special_words) + words, [-1] * len(special_words) + counts, special_word_ins)
+    vocab_instance._vocab_file = vocab_file
+    return vocab_instance
+
+  def _lookup(self, word):
+    """Probes the hash table for the id of a word, -1 if it is OOV."""
+    word = _to_bytes(word)
+    slot = zlib.crc32(word) & self._mask
+    while True:
+      word_id = self._table[slot]
+      if word_id < 0:
+        return -1
+      if self._blob[self._offsets[word_id]:self._offsets[word_id + 1]] == word:
+        return int(word_id)
+      slot = (slot + 1) & self._mask
+
+  def _words(self):
+    """Returns all words as an object array indexed by id, decoded once."""
+    if self._word_array is None:
+      offsets = self._offsets.tolist()
+      blob = self._blob
+      words = np.empty([len(offsets) - 1], dtype=object)
+      words[:] = [blob[offsets[i]:offsets[i + 1]].decode("utf-8")
+                  for i in range(len(offsets) - 1)]
+      self._word_array = words
+    return self._word_array
+
+  def _word_ids(self):
+    """Returns the word -> id dict, built once from the words."""
+    if self._word_to_id is None:
+      self._word_to_id = dict(zip(self._words().tolist(), range(self.size())))
+    return self._word_to_id
+
+  def _missing_id(self, word):
+    """Returns the id of a word missing from the dict, which is either a
+    utf-8 encoded word or OOV."""
+    if isinstance(word, bytes):
+      word_id = self._word_ids().get(word.decode("utf-8"))
+      if word_id is not None:
+        return word_id
+    if self._unk_id is None:
+      raise ValueError("{} not find in vocab, but special_word_ins is None".format(word))
+    return self._unk_id
+
+  def _encode(self, words):
+    """Returns the ids of a flat list of words as an int64 array."""
+    word_ids = self._word_ids()
+    ids = np.array([word_ids.get(w, -1) for w in words], dtype=np.int64)
+    for i in np.flatnonzero(ids < 0):
+      ids[i] = self._missing_id(words[i])
+    return ids
+
+  def word2id(self, word):
+    """Returns the id (integer) of a word (string). Returns [UNK] id if word is OOV."""
+    word_id = self._word_ids().get(word)
+    if word_id is None:
+      return self._missing_id(word)
+    return word_id
+
+  def id2word(self, word_id):
+    """Returns the word (string) corresponding to an id (integer)."""
+    if not 0 <= word_id < self.size():
+      raise ValueError('Id not found in vocab: %d' % word_id)
+    if self._word_array is not None:
+      return self._word_array[word_id]
+    return self._blob[self._offsets[word_id]:self._offsets[word_id + 1]].decode("utf-8")
+
+  def size(self):
+    """Returns the total size of the vocabulary"""
+    return len(self._offsets) - 1
+
+  def words(self):
+    """Returns all words, indexed by id."""
+    return self._words().tolist()
+
+  def counts(self):
+    """Returns the counts of all words, indexed by id. Special words have -1."""
+    return self._counts.tolist()
+
+  def encode_batch(self, words):
+    """Returns the ids of a list of words, or of a list of word lists, as
+    an int64 array. Word lists are padded with the PAD id."""
+    if len(words) > 0 and isinstance(words[0], (list, tuple)):
+      lengths = np.array([len(_) for _ in words], dtype=np.int64)
+      ids = np.zeros([len(words), lengths.max()], dtype=np.int64)
+      if self.special_word_ins is not None:
+        ids.fill(self.special_vocab.PAD)
+      # Row major order of the mask is the order of the flattened words
+      mask = np.arange(ids.shape[1]) < lengths[:, np.newaxis]
+      ids[mask] = self._encode([w for sequence in words for w in sequence])
+      return ids
+    return self._encode(list(words))
+
+  def decode_batch(self, ids):
+    """Returns the words of an array of ids, as nested lists of the same shape."""
+    ids = np.asarray(ids, dtype=np.int64)
+    invalid = (ids < 0) | (ids >= self.size())
+    if invalid.any():
+      raise ValueError('Id not found in vocab: %d' % ids[invalid].flat[0])
+    if ids.ndim == 0:
+      return self._words()[int(ids)]
+    return self._words()[ids].tolist()
+
+  def write_metadata(self, fpath):
+    """Writes metadata file for Tensorboard word embedding visualizer, see `Vocab.write_metadata`."""
+    with codecs.open(fpath, "w", "utf-8") as f:
+      for word in self.words():
+        f.write(word + "\n")
+
+  def save_snapshot(self, path, key=None):
+    """Writes the arrays of the vocab to a `.npz` file."""
+    buffer = io.BytesIO()
+    np.savez(buffer, key=np.zeros([0], dtype=np.int64) if key is None else key,
+             blob=np.frombuffer(self._blob, dtype=np.uint8), offsets=self._offsets,
+             counts=self._counts, table=self._table)
+    with gfile.GFile(path, "wb") as file:
+      file.write(buffer.getvalue())
+
+  @classmethod
+  def load_snapshot(cls, path, special_word_ins=SpecialWordsIns, key=None):
+    """Reads a snapshot written by `save_snapshot`. Returns None if its key
+    differs from `key`."""
+    with gfile.GFile(path, "rb") as file:
+      arrays = np.load(io.BytesIO(file.read()))
+      if key is not None and not np.array_equal(arrays["key"], key):
+        return None
+      return cls(None, None, special_word_ins,
+                 _arrays=(arrays["blob"], arrays["offsets"], arrays["counts"], arrays["table"]))
+
+
+def _snapshot_key(vocab_file, special_words, value_index, max_size):
+  """Size and modification time of the vocab file and the parse options."""
+  stat = gfile.Stat(vocab_file)
+  special = zlib.crc32("\n".join(special_words).encode("utf-8")) & 0xffffffff
+  return np.array([stat.length, stat.mtime_nsec, special, value_index,
+                   -1 if max_size is None else max_size], dtype=np.int64)
+
+
+def load_vocab(vocab_file, special_word_ins=SpecialWordsIns, value_index=1, max_size=None, use_cache=True):
+  """Returns a `CompactVocab` of a vocab file, read from its snapshot
+  `<vocab_file>.vocab.npz` if that is up to date, and writes the snapshot
+  otherwise."""
+  if not use_cache:
+    return CompactVocab.from_file(vocab_file, special_word_ins, value_index, max_size)
+
+  special_words = [] if special_word_ins is None else special_word_ins._total_words
+  path = vocab_file + VOCAB_SNAPSHOT_SUFFIX
+  key = _snapshot_key(vocab_file, special_words, value_index, max_size)
+  if gfile.Exists(path):
+    vocab_instance = CompactVocab.load_snapshot(path, special_word_ins, key)
+    if vocab_instance is not None:
+      vocab_instance._vocab_file = vocab_file
+      return vocab_instance
+
+  tf.logging.info("Building vocab snapshot of %s", vocab_file)
+  vocab_instance = CompactVocab.from_file(vocab_file, special_word_ins, value_index, max_size)
+  try:
+    vocab_instance.save_snapshot(path, key)
+  except tf.errors.OpError as error:
+    tf.logging.warning("Could not cache vocab snapshot %s: %s", path, error)
+  return vocab_instance
+
+
 if __name__ == "__main__":
 
   vocab_cls = Vocab("/home/bigdata/active_project/test_seq2seq_py2/yard_seq2seq/q2q_sim_95/data/vocab/shared.vocab.txt")
@@ -0,0 +1,300 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Builds vocabulary files from large tokenized corpora.
+
+The input files are split into byte ranges that are counted by a pool of
+worker processes, every worker merges the counts of its ranges and the
+results are merged once more in the calling process. With a count-min sketch
+a worker only keeps the sketch and a bounded set of candidate words, so the
+memory does not grow with the number of unique tokens; the counts written
+are then upper bounds of the true counts.
+
+The vocabulary file has one `word<TAB>count` line per word, sorted by
+decreasing count, which is what `Vocab` and `create_vocabulary_lookup_table`
+read.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import re
+import zlib
+import collections
+import multiprocessing
+
+import numpy as np
+import tensorflow as tf
+
+from seq2seq.data.byte_ranges import read_range, split_into_ranges
+
+# Mersenne prime for the sketch hashes, a * crc32 + b fits in an uint64
+_SKETCH_PRIME = (1 << 31) - 1
+
+
+class CountMinSketch(object):
+  """A count-min sketch of word counts.
+
+  Sketches with the same width, depth and seed are merged by adding their
+  tables. Estimates never undercount.
+
+  Args:
+    width: Number of counters per row.
+    depth: Number of rows, i.e. hash functions.
+    seed: Seed of the hash functions.
+  """
+
+  def __init__(self, width=1 << 20, depth=4, seed=0):
+    self.width = width
+    self.depth = depth
+    self.seed = seed
+    self.table = np.zeros([depth, width], dtype=np.int64)
+    rng = np.random.RandomState(seed)
+    self._a = rng.randint(1, _SKETCH_PRIME, size=[depth, 1]).astype(np.uint64)
+    self._b = rng.randint(0, _SKETCH_PRIME, size=[depth, 1]).astype(np.uint64)
+
+  def _indices(self, words):
+    hashes = np.fromiter(
+        (zlib.crc32(_.encode("utf-8")) & 0xffffffff for _ in words),
+        dtype=np.uint64, count=len(words))
+    return ((self._a * hashes + self._b) % _SKETCH_PRIME) % self.width
+
+  def add(self, words, counts):
+    """Adds `counts[i]` to the count of `words[i]`."""
+    indices = self._indices(words)
+    counts = np.asarray(counts, dtype=np.int64)
+    for row in range(self.depth):
+      np.add.at(self.table[row], indices[row], counts)
+
+  def estimate(self, words):
+    """Returns the estimated counts of `words` as an int64 array."""
+    if not words:
+      return np.zeros([0], dtype=np.int64)
+    indices = self._indices(words)
+    return self.table[np.arange(self.depth)[:, None], indices].min(axis=0)
+
+  def merge(self, other):
+    if (other.width, other.depth, other.seed) != (self.width, self.depth,
+                                                 self.seed):
+      raise ValueError("Can not merge count-min sketches of different shape")
+    self.table += other.table
+
+
+def char_filter_pattern(filter_alphabet=False, filter_number=False,
+                        punctuations=None):
+  """Returns a regex matching the words to drop, or None.
+
+  Args:
+    filter_alphabet: Drop words with an ASCII letter.
+    filter_number: Drop words with an ASCII digit.
+    punctuations: A string of punctuation characters, words longer than one
+      character that contain one of them are dropped.
+  """
+  alternatives = []
+  if filter_alphabet:
+    alternatives.append("[A-Za-z]")
+  if filter_number:
+    alternatives.append("[0-9]")
+  if punctuations:
+    punctuation_class = "[{}]".format(re.escape(punctuations))
+    alternatives.append(punctuation_class + ".")
+    alternatives.append("." + punctuation_class)
+  if not alternatives:
+    return None
+  return "|".join(alternatives)
+
+
+def count_text(text, delimiter=" ", downcase=False, counter=None):
+  """Counts the tokens of the lines of `text` into a Counter."""
+  if counter is None:
+    counter = collections.Counter()
+  if downcase:
+    text = text.lower()
+  for line in text.split("\n"):
+    line = line.strip()
+    if delimiter == "":
+      counter.update(line)
+    else:
+      counter.update(line.split(delimiter))
+  counter.pop("", None)
+  return counter
+
+
+def drop_filtered(counter, pattern):
+  """Removes the tokens matching `pattern` from a Counter."""
+  # Tabs and newlines can not be stored in a vocabulary file
+  dropped = [_ for _ in counter if "\t" in _ or "\n" in _]
+  if pattern is not None:
+    search = re.compile(pattern, re.DOTALL).search
+    dropped.extend(_ for _ in counter if search(_))
+  for word in dropped:
+    counter.pop(word, None)
+  return counter
+
+
+def _prune_candidates(candidates, sketch, max_candidates):
+  """Keeps the max_candidates words with the largest sketch estimates."""
+  if len(candidates) <= max_candidates:
+    return candidates
+  words = list(candidates)
+  estimates = sketch.estimate(words)
+  keep = np.argpartition(-estimates, max_candidates - 1)[:max_candidates]
+  return set(words[_] for _ in keep)
+
+
+def _count_ranges(task):
+  """Worker: counts a list of byte ranges.
+
+  Returns a Counter, or (sketch table, candidate words) if the task has a
+  sketch configuration."""
+  ranges, options = task
+  sketch = None
+  if options["sketch"] is not None:
+    sketch = CountMinSketch(**options["sketch"])
+    candidates = set()
+  counter = collections.Counter()
+  for path, start, end in ranges:
+    text = read_range(path, start, end)
+    if sketch is None:
+      count_text(text, options["delimiter"], options["downcase"], counter)
+      continue
+    range_counter = count_text(text, options["delimiter"], options["downcase"])
+    drop_filtered(range_counter, options["pattern"])
+    words = list(range_counter)
+    sketch.add(words, [range_counter[_] for _ in words])
+    candidates.update(words)
+    candidates = _prune_candidates(candidates, sketch, 2 * options["max_candidates"])
+  if sketch is None:
+    return drop_filtered(counter, options["pattern"])
+  return sketch.table, _prune_candidates(candidates, sketch, options["max_candidates"])
+
+
+def count_tokens(paths,
+                 delimiter=" ",
+                 downcase=False,
+                 filter_pattern=None,
+                 num_workers=None,
+                 range_bytes=64 << 20,
+                 sketch_width=None,
+                 sketch_depth=4,
+                 max_candidates=1000000):
+  """Counts the tokens of files with a pool of worker processes.
+
+  Args:
+    paths: Tokenized text files.
+    delimiter: Token delimiter, "" counts characters.
+    downcase: Downcase the text before counting.
+    filter_pattern: A regex, see `char_filter_pattern`. Matching tokens are
+      not counted.
+    num_workers: Number of worker processes, defaults to the number of CPUs.
+      With 1 the files are counted in this process.
+    range_bytes: Size of the byte ranges the files are split into.
+    sketch_width: If set, count with a count-min sketch of this width instead
+      of exact counters.
+    sketch_depth: Depth of the count-min sketch.
+    max_candidates: With a sketch, the number of words whose counts are kept.
+
+  Returns:
+    A dictionary from token to count.
+  """
+  num_workers = num_workers or multiprocessing.cpu_count()
+  ranges = split_into_ranges(paths, range_bytes)
+  sketch_config = None
+  if sketch_width is not None:
+    sketch_config = {"width": sketch_width, "depth": sketch_depth}
+  options = {
+      "delimiter": delimiter,
+      "downcase": downcase,
+      "pattern": filter_pattern,
+      "sketch": sketch_config,
+      "max_candidates": max_candidates
+  }
+  tasks = [(ranges[_::num_workers], options)
+           for _ in range(min(num_workers, len(ranges)))]
+  tf.logging.info("Counting %d bytes in %d ranges with %d workers",
+                  sum(end - start for _, start, end in ranges), len(ranges),
+                  len(tasks))
+
+  if num_workers == 1:
+    results = [_count_ranges(_) for _ in tasks]
+  else:
+    pool = multiprocessing.Pool(num_workers)
+    try:
+      results = pool.map(_count_ranges, tasks, chunksize=1)
+      pool.close()
+    except:
+      pool.terminate()
+      raise
+    finally:
+      pool.join()
+
+  if sketch_config is None:
+    counter = collections.Counter()
+    for result in results:
+      counter.update(result)
+    return dict(counter)
+
+  sketch = CountMinSketch(**sketch_config)
+  candidates = set()
+  for table, worker_candidates in results:
+    sketch.table += table
+    candidates.update(worker_candidates)
+  words = list(_prune_candidates(candidates, sketch, max_candidates))
+  return dict(zip(words, sketch.estimate(words).tolist()))
+
+
+def select_words(counts, min_frequency=0, max_vocab_size=None):
+  """Returns the (word, count) pairs with count > min_frequency, sorted by
+  decreasing count and word, at most max_vocab_size of them."""
+  word_with_counts = [(w, c) for w, c in counts.items() if c > min_frequency]
+  word_with_counts.sort(key=lambda x: (x[1], x[0]), reverse=True)
+  if max_vocab_size is not None:
+    word_with_counts = word_with_counts[:max_vocab_size]
+  return word_with_counts
+
+
+def write_vocab(word_with_counts, path):
+  """Writes `word<TAB>count` lines."""
+  with io.open(path, "w", encoding="utf-8") as file:
+    for word, count in word_with_counts:
+      file.write("{}\t{}\n".format(word, count))
+
+
+def build_vocab(paths,
+                save_path=None,
+                min_frequency=0,
+                max_vocab_size=None,
+                **count_kwargs):
+  """Counts the tokens of files and writes a vocabulary file.
+
+  Args:
+    paths: Tokenized text files.
+    save_path: Vocabulary file to write, or None.
+    min_frequency: Only words with a count larger than this are kept.
+    max_vocab_size: Maximum number of words.
+    **count_kwargs: Passed to `count_tokens`.
+
+  Returns:
+    The list of (word, count) pairs of the vocabulary.
+  """
+  counts = count_tokens(paths, **count_kwargs)
+  tf.logging.info("Found %d unique tokens.", len(counts))
+  word_with_counts = select_words(counts, min_frequency, max_vocab_size)
+  tf.logging.info("Kept %d tokens with frequency > %d.",
+                  len(word_with_counts), min_frequency)
+  if save_path is not None:
+    write_vocab(word_with_counts, save_path)
+  return word_with_counts
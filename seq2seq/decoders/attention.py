@@ -20,6 +20,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import abc
+from collections import namedtuple
 import six
 
 import tensorflow as tf
@@ -46,6 +47,20 @@ def att_sum_dot(keys, query):
   return tf.reduce_sum(keys * tf.expand_dims(query, 1), [2])
 
 
+class AttentionMemory(
+    namedtuple("AttentionMemory", ["keys", "scores_mask"])):
+  """Attention keys that have been prepared once per source sequence so that
+  they can be reused at every decoding step.
+
+  Args:
+    keys: The keys projected to `num_units`. A tensor of shape
+      `[B, T, num_units]`.
+    scores_mask: A float32 tensor of shape `[B, T]` that is 1.0 for valid
+      source positions and 0.0 for padding.
+  """
+  pass
+
+
 @six.add_metaclass(abc.ABCMeta)
 class AttentionLayer(GraphModule, Configurable):
   """
@@ -68,6 +83,42 @@ class AttentionLayer(GraphModule, Configurable):
     """Computes the attention score"""
     raise NotImplementedError
 
+  def _project_keys(self, keys):
+    """Transforms the keys into a tensor with `num_units` units"""
+    return tf.contrib.layers.fully_connected(
+        inputs=keys,
+        num_outputs=self.params["num_units"],
+        activation_fn=None,
+        scope="att_keys")
+
+  @staticmethod
+  def _scores_mask(values_length, num_scores):
+    """Returns a float mask that is 0.0 for all padded inputs"""
+    return tf.sequence_mask(
+        lengths=tf.to_int32(values_length),
+        maxlen=tf.to_int32(num_scores),
+        dtype=tf.float32)
+
+  def prepare_memory(self, keys, values_length):
+    """Projects the keys and creates the score mask once per source sequence.
+    The result can be passed as `keys` to every following call of the layer,
+    which then only needs to transform the query. This must be called before
+    the layer is called for the first time.
+
+    Args:
+      keys: The keys used to calculate attention scores.
+        A tensor of shape `[B, T, ...]`.
+      values_length: An int32 tensor of shape `[B]` defining the sequence
+        length of the attention values.
+
+    Returns:
+      An instance of `AttentionMemory`.
+    """
+    with self.variable_scope():
+      att_keys = self._project_keys(keys)
+    scores_mask = self._scores_mask(values_length, tf.shape(keys)[1])
+    return AttentionMemory(keys=att_keys, scores_mask=scores_mask)
+
   def _build(self, query, keys, values, values_length):
     """Computes attention scores and outputs.
 
@@ -78,7 +129,8 @@ class AttentionLayer(GraphModule, Configurable):
       keys: The keys used to calculate attention scores. In seq2seq, these
         are typically the outputs of the encoder and equivalent to `values`.
         A tensor of shape `[B, T, ...]` where each element in the `T`
-        dimension corresponds to the key for that value.
+        dimension corresponds to the key for that value. May also be an
+        `AttentionMemory` returned by `prepare_memory`.
       values: The elements to compute attention over. In seq2seq, this is
         typically the sequence of encoder outputs.
         A tensor of shape `[B, T, input_dim]`.
@@ -96,12 +148,14 @@ class AttentionLayer(GraphModule, Configurable):
     values_depth = values.get_shape().as_list()[-1]
 
     # Fully connected layers to transform both keys and query
-    # into a tensor with `num_units` units
-    att_keys = tf.contrib.layers.fully_connected(
-        inputs=keys,
-        num_outputs=self.params["num_units"],
-        activation_fn=None,
-        scope="att_keys")
+    # into a tensor with `num_units` units. Keys that went through
+    # `prepare_memory` are already transformed.
+    if isinstance(keys, AttentionMemory):
+      att_keys = keys.keys
+      scores_mask = keys.scores_mask
+    else:
+      att_keys = self._project_keys(keys)
+      scores_mask = None
     att_query = tf.contrib.layers.fully_connected(
         inputs=query,
         num_outputs=self.params["num_units"],
@@ -111,11 +165,8 @@ class AttentionLayer(GraphModule, Configurable):
     scores = self.score_fn(att_keys, att_query)
 
     # Replace all scores for padded inputs with tf.float32.min
-    num_scores = tf.shape(scores)[1]
-    scores_mask = tf.sequence_mask(
-        lengths=tf.to_int32(values_length),
-        maxlen=tf.to_int32(num_scores),
-        dtype=tf.float32)
+    if scores_mask is None:
+      scores_mask = self._scores_mask(values_length, tf.shape(scores)[1])
     scores = scores * scores_mask + ((1.0 - scores_mask) * tf.float32.min)
 
     # Normalize the scores
@@ -80,6 +80,8 @@ class AttentionDecoder(RNNDecoder):
     self.attention_values_length = attention_values_length
     self.attention_fn = attention_fn
     self.reverse_scores_lengths = reverse_scores_lengths
+    # Keys prepared once in `_setup`, see `AttentionLayer.prepare_memory`
+    self.attention_memory = None
 
   @property
   def output_size(self):
@@ -115,9 +117,12 @@ class AttentionDecoder(RNNDecoder):
     """Computes the decoder outputs."""
 
     # Compute attention
+    attention_keys = self.attention_keys
+    if self.attention_memory is not None:
+      attention_keys = self.attention_memory
     att_scores, attention_context = self.attention_fn(
         query=cell_output,
-        keys=self.attention_keys,
+        keys=attention_keys,
         values=self.attention_values,
         values_length=self.attention_values_length)
 
@@ -141,8 +146,17 @@ class AttentionDecoder(RNNDecoder):
 
     return softmax_input, logits, att_scores, attention_context
 
+  def _prepare_attention_memory(self):
+    """Projects the attention keys once instead of at every decoding step
+    if the attention function supports it."""
+    if hasattr(self.attention_fn, "prepare_memory"):
+      self.attention_memory = self.attention_fn.prepare_memory(
+          keys=self.attention_keys,
+          values_length=self.attention_values_length)
+
   def _setup(self, initial_state, helper):
     self.initial_state = initial_state
+    self._prepare_attention_memory()
 
     def att_next_inputs(time, outputs, state, sample_ids, name=None):
       """Wraps the original decoder helper function to append the attention
@@ -71,7 +71,8 @@ class BeamDecoderOutput(
 class BeamSearchDecoder(RNNDecoder):
   """The BeamSearchDecoder wraps another decoder to perform beam search instead
   of greedy selection. This decoder must be used with batch size of 1, which
-  will result in an effective batch size of `beam_width`.
+  will result in an effective batch size of `beam_width`. See
+  `BatchBeamSearchDecoder` for decoding several examples at once.
 
   Args:
     decoder: A instance of `RNNDecoder` to be used with beam search.
@@ -186,3 +187,115 @@ class BeamSearchDecoder(RNNDecoder):
     next_inputs.set_shape([self.batch_size, None])
 
     return (outputs, next_state, next_inputs, finished)
+
+
+class BatchBeamSearchDecoder(BeamSearchDecoder):
+  """A BeamSearchDecoder that decodes a whole batch of source sequences at
+  once. The wrapped decoder runs on `batch_size * beam_width` rows where the
+  beams of each example are contiguous, i.e. the memory and initial state
+  must be tiled with `tf.contrib.seq2seq.tile_batch`. The beam search state
+  is kept in the shape `[batch_size, beam_width]`.
+
+  The final outputs have the same layout as the ones of `BeamSearchDecoder`,
+  `[T, batch_size, beam_width, ...]`.
+
+  Args:
+    decoder: A instance of `RNNDecoder` to be used with beam search.
+    config: A `BeamSearchConfig` that defines beam search decoding parameters.
+  """
+
+  @property
+  def batch_size(self):
+    return self.decoder.batch_size
+
+  def _split_beams(self, tensor):
+    """Reshapes a `[batch_size * beam_width, ...]` tensor to
+    `[batch_size, beam_width, ...]`."""
+    shape = tf.shape(tensor)
+    return tf.reshape(
+        tensor, tf.concat([[-1, self.config.beam_width], shape[1:]], 0))
+
+  def _split_time_beams(self, tensor):
+    """Reshapes a `[T, batch_size * beam_width, ...]` tensor to
+    `[T, batch_size, beam_width, ...]`."""
+    shape = tf.shape(tensor)
+    return tf.reshape(
+        tensor,
+        tf.concat([[shape[0], -1, self.config.beam_width], shape[2:]], 0))
+
+  def initialize(self, name=None):
+    finished, first_inputs, initial_state = self.decoder.initialize()
+
+    # Create beam state
+    batch_size = tf.shape(finished)[0] // self.config.beam_width
+    beam_state = beam_search.create_initial_batch_beam_state(
+        config=self.config, batch_size=batch_size)
+    return finished, first_inputs, (initial_state, beam_state)
+
+  def finalize(self, outputs, final_state, final_sequence_lengths=None):
+    outputs = nest.map_structure(self._split_time_beams, outputs)
+    outputs.predicted_ids.set_shape([None, None, self.config.beam_width])
+    outputs.beam_parent_ids.set_shape([None, None, self.config.beam_width])
+
+    # Gather according to beam search result
+    predicted_ids = beam_search.gather_tree(outputs.predicted_ids,
+                                            outputs.beam_parent_ids)
+
+    final_outputs = FinalBeamDecoderOutput(
+        predicted_ids=predicted_ids, beam_search_output=outputs)
+
+    return final_outputs, final_state
+
+  def _build(self, initial_state, helper):
+    # Repeat every example of the initial state beam_width times
+    initial_state = tf.contrib.seq2seq.tile_batch(
+        initial_state, multiplier=self.config.beam_width)
+    self.decoder._setup(initial_state, helper)  #pylint: disable=W0212
+    return super(BeamSearchDecoder, self)._build(self.decoder.initial_state,
+                                                 self.decoder.helper)
+
+  def step(self, time_, inputs, state, name=None):
+    decoder_state, beam_state = state
+
+    # Call the original decoder
+    (decoder_output, decoder_state, _, _) = self.decoder.step(time_, inputs,
+                                                              decoder_state)
+
+    # Perform a step of beam search
+    bs_output, beam_state = beam_search.batch_beam_search_step(
+        time_=time_,
+        logits=self._split_beams(decoder_output.logits),
+        beam_state=beam_state,
+        config=self.config)
+
+    # Shuffle everything according to beam search result
+    parent_rows = beam_search.flat_beam_indices(bs_output.beam_parent_ids,
+                                                self.config.beam_width)
+    if isinstance(decoder_state, AttentionWrapperState):
+      beam_cell_state = nest.map_structure(
+        lambda x: tf.gather(x, parent_rows), decoder_state.cell_state)
+      decoder_state = decoder_state.clone(cell_state=beam_cell_state)
+    else:
+      decoder_state = nest.map_structure(
+          lambda x: tf.gather(x, parent_rows), decoder_state)
+    decoder_output = nest.map_structure(
+        lambda x: tf.gather(x, parent_rows), decoder_output)
+
+    next_state = (decoder_state, beam_state)
+
+    predicted_ids = tf.reshape(bs_output.predicted_ids, [-1])
+    outputs = BeamDecoderOutput(
+        logits=tf.zeros([tf.shape(predicted_ids)[0], self.config.vocab_size]),
+        predicted_ids=predicted_ids,
+        log_probs=tf.reshape(beam_state.log_probs, [-1]),
+        scores=tf.reshape(bs_output.scores, [-1]),
+        beam_parent_ids=tf.reshape(bs_output.beam_parent_ids, [-1]),
+        original_outputs=decoder_output)
+
+    finished, next_inputs, next_state = self.decoder.helper.next_inputs(
+        time=time_,
+        outputs=decoder_output,
+        state=next_state,
+        sample_ids=predicted_ids)
+
+    return (outputs, next_state, next_inputs, finished)
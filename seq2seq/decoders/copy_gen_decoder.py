@@ -38,6 +38,8 @@ class CopyGenDecoder(RNNDecoder):
     self.attention_values_length = attention_values_length
     self.attention_fn = attention_fn
     self.reverse_scores_lengths = reverse_scores_lengths
+    # Keys prepared once in `_setup`, see `AttentionLayer.prepare_memory`
+    self.attention_memory = None
 
   @property
   def output_size(self):
@@ -88,9 +90,12 @@ class CopyGenDecoder(RNNDecoder):
     """Computes the decoder outputs."""
 
     # Compute attention
+    attention_keys = self.attention_keys
+    if self.attention_memory is not None:
+      attention_keys = self.attention_memory
     att_scores, attention_context = self.attention_fn(
         query=cell_output,
-        keys=self.attention_keys,
+        keys=attention_keys,
         values=self.attention_values,
         values_length=self.attention_values_length)
 
@@ -119,9 +124,18 @@ class CopyGenDecoder(RNNDecoder):
 
     return softmax_input, logits, att_scores, attention_context, pgens
 
+  def _prepare_attention_memory(self):
+    """Projects the attention keys once instead of at every decoding step
+    if the attention function supports it."""
+    if hasattr(self.attention_fn, "prepare_memory"):
+      self.attention_memory = self.attention_fn.prepare_memory(
+          keys=self.attention_keys,
+          values_length=self.attention_values_length)
+
   def _setup(self, initial_state, helper):
 
     self.initial_state = initial_state
+    self._prepare_attention_memory()
 
     self.W_u = 0
     # wout_dim = 2 * self.params["decoder.params"]["rnn_cell"]["cell_params"]["num_units"]  # dim(context_vector + hidden states)
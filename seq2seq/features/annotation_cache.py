@@ -0,0 +1,153 @@
+#encoding=utf-8
+
+"""
+content addressed cache of sentence annotations (pos tags, ner tags)
+"""
+
+__author__ = "liyi"
+__date__ = "2017-07-04"
+
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+import collections
+
+import six
+
+
+_model_signatures = {}
+
+
+def model_signature(model_path):
+  """The path, size and modification time of a model file, so annotations
+  of a retrained model at the same path are not read from the cache."""
+  if model_path not in _model_signatures:
+    signature = [model_path]
+    if os.path.exists(model_path):
+      stat = os.stat(model_path)
+      signature += [str(stat.st_size), repr(stat.st_mtime)]
+    _model_signatures[model_path] = signature
+  return _model_signatures[model_path]
+
+
+def annotation_key(kind, tokens, *extra):
+  """Hash of the annotation kind and the token sequence (plus e.g. the
+  pos tags a ner annotation depends on)."""
+  parts = [kind]
+  for seq in (tokens,) + extra:
+    parts.append(u"\x1f".join(t.decode("utf-8") if isinstance(t, bytes) else six.text_type(t) for t in seq))
+  return hashlib.sha1(u"\x1e".join(parts).encode("utf-8")).hexdigest()
+
+
+class AnnotationCache(object):
+  """A bounded in-memory LRU in front of an optional sqlite store.
+
+  Values are lists of strings. The sqlite connection is opened on first use
+  in every process, so a cache created before forking workers is safe to use
+  in the workers. Puts are buffered in memory and written every
+  `commit_every` puts and on `flush()`, each time in one short transaction,
+  so workers sharing the store do not wait for each other's write lock.
+
+  Args:
+    path: sqlite file, None keeps the annotations only in memory.
+    max_memory_items: size of the LRU.
+    commit_every: puts between two writes of the sqlite store.
+  """
+
+  def __init__(self, path=None, max_memory_items=100000, commit_every=1000):
+    self._path = path
+    self._max_memory_items = max_memory_items
+    self._commit_every = commit_every
+    self._memory = collections.OrderedDict()
+    self._lock = threading.Lock()
+    self._conn = None
+    self._conn_pid = None
+    self._pending = collections.OrderedDict()
+    self.memory_hits = 0
+    self.disk_hits = 0
+    self.misses = 0
+
+  def _connection(self):
+    if self._path is None:
+      return None
+    if self._conn is None or self._conn_pid != os.getpid():
+      self._conn = sqlite3.connect(self._path, timeout=60, check_same_thread=False)
+      self._conn.execute("PRAGMA journal_mode=WAL")
+      self._conn.execute("CREATE TABLE IF NOT EXISTS annotations (key TEXT PRIMARY KEY, value TEXT)")
+      self._conn_pid = os.getpid()
+      # Puts buffered before a fork are written by the parent
+      self._pending.clear()
+    return self._conn
+
+  def _remember(self, key, value):
+    self._memory.pop(key, None)
+    self._memory[key] = value
+    while len(self._memory) > self._max_memory_items:
+      self._memory.popitem(last=False)
+
+  def get(self, key):
+    """Returns a copy of the cached annotation, or None."""
+    with self._lock:
+      if key in self._memory:
+        value = self._memory.pop(key)
+        self._memory[key] = value
+        self.memory_hits += 1
+        return list(value)
+      conn = self._connection()
+      if key in self._pending:
+        value = json.loads(self._pending[key])
+        self._remember(key, value)
+        self.memory_hits += 1
+        return list(value)
+      if conn is not None:
+        row = conn.execute("SELECT value FROM annotations WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+          value = json.loads(row[0])
+          self._remember(key, value)
+          self.disk_hits += 1
+          return list(value)
+      self.misses += 1
+      return None
+
+  def put(self, key, value):
+    value = [v.decode("utf-8") if isinstance(v, bytes) else v for v in value]
+    with self._lock:
+      self._remember(key, value)
+      conn = self._connection()
+      if conn is not None:
+        self._pending[key] = json.dumps(value, ensure_ascii=False)
+        if len(self._pending) >= self._commit_every:
+          self._write_pending(conn)
+
+  def _write_pending(self, conn):
+    if not self._pending:
+      return
+    with conn:
+      conn.executemany("INSERT OR REPLACE INTO annotations (key, value) VALUES (?, ?)",
+                       list(self._pending.items()))
+    self._pending.clear()
+
+  def get_or_compute(self, key, compute_fn):
+    """Returns the cached annotation or computes, caches and returns it."""
+    value = self.get(key)
+    if value is None:
+      value = list(compute_fn())
+      self.put(key, value)
+      value = list(value)
+    return value
+
+  def flush(self):
+    with self._lock:
+      if self._conn is not None and self._conn_pid == os.getpid():
+        self._write_pending(self._conn)
+
+  def stats(self):
+    lookups = self.memory_hits + self.disk_hits + self.misses
+    return {
+      "memory_hits": self.memory_hits,
+      "disk_hits": self.disk_hits,
+      "misses": self.misses,
+      "hit_rate": (self.memory_hits + self.disk_hits) / float(max(lookups, 1)),
+    }
@@ -0,0 +1,95 @@
+#encoding=utf-8
+
+"""
+copy features of a (source, target) pair computed in one pass:
+extend source ids, source oov list, extend target ids and target->source aliment
+"""
+
+__author__ = "liyi"
+__date__ = "2017-07-06"
+
+import collections
+
+CopyAlignment = collections.namedtuple(
+  "CopyAlignment", ["extend_source_ids", "source_oov_list", "extend_target_ids", "aliment"])
+
+
+def first_positions(tokens):
+  """token -> index of its first occurrence"""
+  positions = {}
+  for i, token in enumerate(tokens):
+    if token not in positions:
+      positions[token] = i
+  return positions
+
+
+class CopyAligner(object):
+  """Builds copy features with a token -> first source position dict.
+
+  Source UNK tokens get the ids `oov_start_id + i` where i is their index in
+  the oov list. A target UNK token gets the extend id of the first source
+  position with the same token, or stays `unk_id`. The aliment of a target
+  token is the first source position of the same token, or -1.
+
+  Args:
+    oov_start_id: first extend id, i.e. the vocab size.
+    unk_id: id of UNK in source_ids and target_ids.
+    unique: give repeated source oov tokens a single extend id.
+  """
+
+  def __init__(self, oov_start_id, unk_id, unique=False):
+    self._oov_start_id = oov_start_id
+    self._unk_id = unk_id
+    self._unique = unique
+
+  def align_source(self, source_tokens, source_ids):
+    """Returns (extend_source_ids, source_oov_list, first_position)."""
+    assert len(source_tokens) == len(source_ids), (len(source_tokens), len(source_ids))
+    extend_source_ids = []
+    source_oov_list = []
+    oov_ids = {}
+    first_position = {}
+    for i, (token, source_id) in enumerate(zip(source_tokens, source_ids)):
+      if token not in first_position:
+        first_position[token] = i
+      if source_id == self._unk_id:
+        new_id = oov_ids.get(token) if self._unique else None
+        if new_id is None:
+          new_id = len(source_oov_list) + self._oov_start_id
+          source_oov_list.append(token)
+          oov_ids[token] = new_id
+        extend_source_ids.append(new_id)
+      else:
+        extend_source_ids.append(source_id)
+    return extend_source_ids, source_oov_list, first_position
+
+  def align_target(self, extend_source_ids, first_position, target_tokens, target_ids=None):
+    """Returns (extend_target_ids, aliment), extend_target_ids is None without target_ids."""
+    aliment = [first_position.get(token, -1) for token in target_tokens]
+    if target_ids is None:
+      return None, aliment
+    assert len(target_tokens) == len(target_ids), (len(target_tokens), len(target_ids))
+    extend_target_ids = []
+    for position, target_id in zip(aliment, target_ids):
+      if target_id == self._unk_id and position >= 0:
+        extend_target_ids.append(extend_source_ids[position])
+      else:
+        extend_target_ids.append(target_id)
+    return extend_target_ids, aliment
+
+  def align(self, source_tokens, source_ids, target_tokens=None, target_ids=None):
+    """Returns the CopyAlignment of one example, the target fields are None without target_tokens."""
+    extend_source_ids, source_oov_list, first_position = self.align_source(source_tokens, source_ids)
+    extend_target_ids, aliment = None, None
+    if target_tokens is not None:
+      extend_target_ids, aliment = self.align_target(extend_source_ids, first_position, target_tokens, target_ids)
+    return CopyAlignment(extend_source_ids, source_oov_list, extend_target_ids, aliment)
+
+  def align_batch(self, source_tokens_list, source_ids_list, target_tokens_list=None, target_ids_list=None):
+    """Returns the CopyAlignment of every example of a batch."""
+    num = len(source_tokens_list)
+    if target_tokens_list is None:
+      target_tokens_list = [None] * num
+    if target_ids_list is None:
+      target_ids_list = [None] * num
+    return [self.align(*args) for args in zip(source_tokens_list, source_ids_list, target_tokens_list, target_ids_list)]
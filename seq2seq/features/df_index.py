@@ -0,0 +1,159 @@
+#encoding=utf-8
+
+"""
+document frequency index for online tf-idf features
+
+the index of `prefix` is a few files that are memory mapped when loaded:
+  prefix.df_words         utf-8 bytes of all words, concatenated
+  prefix.df_offsets.npy   int64 [num_words + 1], start of every word
+  prefix.df_table.npy     int32, open addressing hash table of word ids
+  prefix.df_counts.npy    int64 [num_words], documents containing the word
+  prefix.df_meta.json     number of documents and words
+a document is a non-empty line of the corpus, tokens are split by whitespace
+"""
+
+from __future__ import division
+
+__author__ = "liyi"
+__date__ = "2017-07-06"
+
+import os
+import math
+import mmap
+import codecs
+import collections
+
+import click
+import numpy as np
+
+import seq2seq.features.utils as utils
+from seq2seq.data.vocab import CompactVocab
+
+DF_WORDS_SUFFIX = ".df_words"
+DF_OFFSETS_SUFFIX = ".df_offsets.npy"
+DF_TABLE_SUFFIX = ".df_table.npy"
+DF_COUNTS_SUFFIX = ".df_counts.npy"
+DF_META_SUFFIX = ".df_meta.json"
+
+
+def _open_blob(path):
+  with open(path, "rb") as f:
+    if os.fstat(f.fileno()).st_size == 0:
+      return b""
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class DocumentFrequencyIndex(object):
+  """word -> number of documents containing it, plus the number of documents.
+
+  idf(word) = log(num_docs / (1 + df(word))), tf(word) is the count of the
+  word in its sentence divided by the number of unique words of the sentence.
+
+  Args:
+    words: the words of the index.
+    doc_counts: the document frequency of every word.
+    num_docs: the number of documents.
+  """
+
+  def __init__(self, words, doc_counts, num_docs, _arrays=None):
+    self._vocab = CompactVocab(words, doc_counts, special_word_ins=None, _arrays=_arrays)
+    self._doc_counts = self._vocab._counts
+    self.num_docs = num_docs
+
+  @classmethod
+  def build(cls, path_or_dir):
+    """counts the documents of every word of the files of path_or_dir in one pass"""
+    doc_counts = collections.Counter()
+    num_docs = 0
+    for path in sorted(utils.get_dir_or_file_path(path_or_dir)):
+      with codecs.open(path, "r", "utf-8") as f:
+        for line in f:
+          tokens = line.split()
+          if len(tokens) == 0:
+            continue
+          num_docs += 1
+          doc_counts.update(set(tokens))
+    words = sorted(doc_counts)
+    return cls(words, [doc_counts[w] for w in words], num_docs)
+
+  def save(self, prefix):
+    vocab = self._vocab
+    with open(prefix + DF_WORDS_SUFFIX, "wb") as f:
+      f.write(vocab._blob)
+    np.save(prefix + DF_OFFSETS_SUFFIX, vocab._offsets)
+    np.save(prefix + DF_TABLE_SUFFIX, vocab._table)
+    np.save(prefix + DF_COUNTS_SUFFIX, vocab._counts)
+    utils.jsonWrite({"num_docs": self.num_docs, "num_words": self.size()}, prefix + DF_META_SUFFIX)
+
+  @classmethod
+  def load(cls, prefix):
+    """memory maps an index written by `save`"""
+    meta = utils.jsonRead(prefix + DF_META_SUFFIX)
+    arrays = (_open_blob(prefix + DF_WORDS_SUFFIX),
+              np.load(prefix + DF_OFFSETS_SUFFIX, mmap_mode="r"),
+              np.load(prefix + DF_COUNTS_SUFFIX, mmap_mode="r"),
+              np.load(prefix + DF_TABLE_SUFFIX, mmap_mode="r"))
+    return cls(None, None, meta["num_docs"], _arrays=arrays)
+
+  @staticmethod
+  def exists(prefix):
+    return os.path.exists(prefix + DF_META_SUFFIX)
+
+  def size(self):
+    return self._vocab.size()
+
+  def df(self, word):
+    word_id = self._vocab._lookup(word)
+    return 0 if word_id < 0 else int(self._doc_counts[word_id])
+
+  def idf(self, word):
+    return math.log(self.num_docs / (1 + self.df(word)))
+
+  def doc_counts(self, words):
+    """document frequencies of a list of words as an int64 array"""
+    ids = np.array([self._vocab._lookup(w) for w in words], dtype=np.int64)
+    counts = np.asarray(self._doc_counts)[np.maximum(ids, 0)] if len(ids) else np.zeros([0], np.int64)
+    return np.where(ids >= 0, counts, 0)
+
+  def tfidf_batch(self, sentences):
+    """tf-idf of every token of a batch of token lists, as a list of float arrays
+
+    the words of the batch are looked up once, tf and idf are computed for all
+    tokens at once; empty tokens get 0.0
+    """
+    if len(sentences) == 0:
+      return []
+    batch_words = {}
+    token_ids, lengths = [], []
+    for tokens in sentences:
+      lengths.append(len(tokens))
+      for token in tokens:
+        token = token.strip()
+        token_ids.append(batch_words.setdefault(token, len(batch_words)) if token else -1)
+    token_ids = np.array(token_ids, dtype=np.int64)
+    sentence_ids = np.repeat(np.arange(len(sentences)), lengths)
+    words = [None] * len(batch_words)
+    for w, i in batch_words.items():
+      words[i] = w
+    idfs = np.log(self.num_docs / (1. + self.doc_counts(words)))
+
+    valid = token_ids >= 0
+    keys = sentence_ids[valid] * max(len(words), 1) + token_ids[valid]
+    unique_keys, inverse, key_counts = np.unique(keys, return_inverse=True, return_counts=True)
+    unique_words = np.bincount(unique_keys // max(len(words), 1), minlength=len(sentences))
+    values = np.zeros([len(token_ids)], dtype=np.float64)
+    values[valid] = key_counts[inverse] / unique_words[sentence_ids[valid]] * idfs[token_ids[valid]]
+    return np.split(values, np.cumsum(lengths)[:-1])
+
+
+@click.command()
+@click.argument("path_or_dir")
+@click.argument("prefix")
+def build_index(path_or_dir, prefix):
+  """builds the document frequency index of the documents(lines) of path_or_dir"""
+  index = DocumentFrequencyIndex.build(path_or_dir)
+  index.save(prefix)
+  print("{} words of {} documents, save to {}*".format(index.size(), index.num_docs, prefix))
+
+if __name__ == "__main__":
+  build_index()
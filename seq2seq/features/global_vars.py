@@ -40,6 +40,14 @@ target_keys_to_features = {
   "target_ners": tf.VarLenFeature(tf.string),
 }
 
+# Version 0 (legacy) joins the tokens of a string feature into one space separated
+# bytes value, version 1 stores every token as its own bytes_list entry.
+FORMAT_VERSION_KEY = "format_version"
+LEGACY_FORMAT_VERSION = 0
+TOKEN_LIST_FORMAT_VERSION = 1
+CURRENT_FORMAT_VERSION = TOKEN_LIST_FORMAT_VERSION
+format_version_feature = tf.FixedLenFeature([], tf.int64, default_value=LEGACY_FORMAT_VERSION)
+
 source_feature_keys = list(source_keys_to_features.keys())
 target_feature_keys = list(target_keys_to_features.keys())
 
@@ -8,6 +8,8 @@ import six
 import pyltp
 
 import math
+import atexit
+import threading
 
 from pyltp import Segmentor
 from pyltp import SentenceSplitter
@@ -16,6 +18,8 @@ from pyltp import NamedEntityRecognizer
 
 import seq2seq.features.utils as utils
 from seq2seq.features import SpecialWords
+from seq2seq.features.annotation_cache import AnnotationCache, annotation_key, model_signature
+from seq2seq.features.df_index import DocumentFrequencyIndex
 
 HOME_PATH = os.path.expanduser("~")
 default_ltp_data_path = os.path.join(HOME_PATH, "software/LTP/ltp_data")
@@ -24,12 +28,62 @@ cws_model_path = os.path.join(LTP_DATA_DIR, 'cws.model')
 pos_model_path = os.path.join(LTP_DATA_DIR, 'pos.model')
 ner_model_path = os.path.join(LTP_DATA_DIR, 'ner.model')  # 命名实体识别模型路径，模型名称为`pos.model`
 
-segmentor = Segmentor()  # 初始化实例
-segmentor.load(cws_model_path)  # 加载模型
-postagger = Postagger() # 初始化实例
-postagger.load(pos_model_path)  # 加载模型
-recognizer = NamedEntityRecognizer() # 初始化实例
-recognizer.load(ner_model_path)  # 加载模型
+class LazyModel(object):
+  """A pyltp model that is loaded on first use.
+
+  Attribute access is forwarded to the loaded model, e.g. `postagger.postag(words)`.
+  Loading is guarded by a lock so threads share one instance.
+  """
+
+  def __init__(self, model_cls, model_path):
+    self._model_cls = model_cls
+    self._model_path = model_path
+    self._model = None
+    self._lock = threading.Lock()
+
+  @property
+  def loaded(self):
+    return self._model is not None
+
+  def get(self):
+    if self._model is None:
+      with self._lock:
+        if self._model is None:
+          model = self._model_cls()  # 初始化实例
+          model.load(self._model_path)  # 加载模型
+          self._model = model
+    return self._model
+
+  def __getattr__(self, name):
+    return getattr(self.get(), name)
+
+segmentor = LazyModel(Segmentor, cws_model_path)
+postagger = LazyModel(Postagger, pos_model_path)
+recognizer = LazyModel(NamedEntityRecognizer, ner_model_path)
+
+_models = {"cws": segmentor, "pos": postagger, "ner": recognizer}
+
+def preload_models(names=("cws", "pos", "ner")):
+  """Loads models before forking worker processes, which then share them copy on write."""
+  for name in names:
+    _models[name].get()
+
+# pos/ner annotations are cached by model file and token sequence, on disk if LTP_ANNOTATION_CACHE is set
+_annotation_cache = AnnotationCache(os.environ.get("LTP_ANNOTATION_CACHE"))
+atexit.register(lambda: _annotation_cache.flush())
+
+def set_annotation_cache(cache):
+  """Replaces the annotation cache used by Postags and NamedEntityRecogize."""
+  global _annotation_cache
+  _annotation_cache.flush()
+  _annotation_cache = cache
+
+def get_annotation_cache():
+  return _annotation_cache
+
+def annotation_cache_stats():
+  """hit/miss counters of the annotation cache"""
+  return _annotation_cache.stats()
 
 def SentenceSplit(para):
   sents = SentenceSplitter.split(para)
@@ -60,7 +114,8 @@ def Postags(words):
   if six.PY2:
     if type(words[0]) == unicode:
       words = [v.encode("utf-8") for v in words]
-  postags = list(postagger.postag(words))  # 词性标注
+  key = annotation_key("pos", model_signature(pos_model_path), words)
+  postags = _annotation_cache.get_or_compute(key, lambda: postagger.postag(words))  # 词性标注
   return postags
 
 def NamedEntityRecogize(words, postags=None):
@@ -71,7 +126,11 @@ def NamedEntityRecogize(words, postags=None):
   if postags is None:
     postags = Postags(words)
 
-  netags = list(recognizer.recognize(words, postags))
+  if six.PY2:
+    # tags read back from the annotation cache are unicode
+    postags = [v.encode("utf-8") if isinstance(v, six.text_type) else v for v in postags]
+  key = annotation_key("ner", model_signature(ner_model_path), words, postags)
+  netags = _annotation_cache.get_or_compute(key, lambda: recognizer.recognize(words, postags))
   return netags
 
 def get_all_ner_tag(file_path, save_path):
@@ -119,25 +178,19 @@ class Tfidf(object):
 
 
 class Tfidf_online(object):
+  """tf-idf of new sentences against the documents(lines) of path_or_dir
+
+  the document frequencies are kept in a DocumentFrequencyIndex, read from
+  index_prefix if it exists and built (and saved to index_prefix) otherwise
+  """
 
-  def __init__(self, path_or_dir):
-    self._paths = utils.get_dir_or_file_path(path_or_dir)
-    doc_word_cnts = []
-    token_list = []
-    for path in self._paths:
-      f = codecs.open(path, "r", "utf-8")
-      for line in f:
-        tokens = line.strip().split()
-        word_cnt = {}
-        for token in tokens:
-          token = token.strip()
-          if len(token) == 0:
-            continue
-          if token not in word_cnt:
-            word_cnt[token] = 0
-          word_cnt[token] += 1
-          doc_word_cnts.append(word_cnt)
-    self._doc_word_cnts = doc_word_cnts
+  def __init__(self, path_or_dir, index_prefix=None):
+    if index_prefix is not None and DocumentFrequencyIndex.exists(index_prefix):
+      self._index = DocumentFrequencyIndex.load(index_prefix)
+    else:
+      self._index = DocumentFrequencyIndex.build(path_or_dir)
+      if index_prefix is not None:
+        self._index.save(index_prefix)
 
   def word_cnt_map(self, token_list):
     word_cnt = {}
@@ -153,24 +206,22 @@ class Tfidf_online(object):
   def tf(self, word, word_dict_cnt):
     if word not in word_dict_cnt:
       return 0.0
-    return word_dict_cnt[word] / len(word_dict_cnt)
+    return word_dict_cnt[word] / float(len(word_dict_cnt))
 
-  def n_containing(self, word, doc_word_cnts):
-    return sum(1 for doc in doc_word_cnts if word in doc)
+  def n_containing(self, word):
+    return self._index.df(word)
 
-  def idf(self, word, doc_word_cnts):
-    return math.log(len(doc_word_cnts) / (1 + self.n_containing(word, doc_word_cnts)))
+  def idf(self, word):
+    return self._index.idf(word)
 
-  def tfidf(self, word, word_cnt, doc_word_cnts):
-    return self.tf(word, word_cnt) * self.idf(word, doc_word_cnts)
+  def tfidf(self, word, word_cnt):
+    return self.tf(word, word_cnt) * self.idf(word)
 
   def get_words_tfidf(self, word_list):
-    word_cnt = self.word_cnt_map(word_list)
-    value_list = []
-    for word in word_list:
-      v = self.tfidf(word, word_cnt, self._doc_word_cnts)
-      value_list.append(v)
-    return value_list
+    return self._index.tfidf_batch([word_list])[0].tolist()
+
+  def get_batch_tfidf(self, word_lists):
+    return [v.tolist() for v in self._index.tfidf_batch(word_lists)]
 
 if __name__ == "__main__":
   words = ['朴槿惠','被' ,'调查','了', "END"]
@@ -4,6 +4,9 @@ import codecs
 import os
 import sys
 import csv
+import json
+import time
+import multiprocessing
 import numpy as np
 import logging
 import tensorflow as tf
@@ -13,8 +16,12 @@ import pyltp
 from collections import OrderedDict
 import seq2seq.features.nlp as NLP
 from seq2seq.data import vocab
+from seq2seq.data.byte_ranges import iter_range_lines, split_into_ranges
+from seq2seq.data.record_shards import ShardedRecordWriter, write_manifest
 from seq2seq.features import global_vars, utils
 from seq2seq.features import SpecialWords, SpecialWordsIns
+from seq2seq.features.annotation_cache import AnnotationCache
+from seq2seq.features.copy_alignment import CopyAligner, first_positions
 
 logger = logging.getLogger(__name__)
 
@@ -43,98 +50,163 @@ def join_str(array, delimeter=" "):
   array = [convert_unicode(v) for v in array]
   return delimeter.join(array)
 
-def get_extend_source_ids(source_tokens, source_ids, vocab_cls, unique=False):
-
-  assert len(source_tokens) == len(source_ids), len(source_tokens)
-  source_oov_list = []
-  extend_source_ids = []
-  oov_start_id = vocab_cls.size()
-
-  for i, source_id in enumerate(source_ids):
-    token = source_tokens[i]
-    if source_id == vocab_cls.special_vocab.UNK:
-      if unique is True:
-        try:
-          ix = source_oov_list.index(token)
-          new_id = ix + oov_start_id
-        except ValueError:
-          new_id = len(source_oov_list) + oov_start_id
-          source_oov_list.append(token)
-      else:
-        new_id = len(source_oov_list) + oov_start_id
-        source_oov_list.append(token)
-      extend_source_ids.append(new_id)
-    else:
-      extend_source_ids.append(source_id)
-
-  assert len(extend_source_ids) == len(source_ids), (len(extend_source_ids), len(source_ids))
+def encode_token(token):
+  """utf-8 bytes of a token for a bytes_list"""
+  if isinstance(token, six.text_type):
+    return token.encode("utf-8")
+  return token
 
+def get_extend_source_ids(source_tokens, source_ids, vocab_cls, unique=False):
+  aligner = CopyAligner(vocab_cls.size(), vocab_cls.special_vocab.UNK, unique=unique)
+  extend_source_ids, source_oov_list, _ = aligner.align_source(source_tokens, source_ids)
   return extend_source_ids, source_oov_list
 
 def get_extend_target_ids(extend_source_ids, source_tokens, target_tokens, target_ids, target_unk_id):
-  extend_target_ids = []
-  for i, target_id in enumerate(target_ids):
-    if target_id == target_unk_id:
-      find_match = False
-      for j, source_token in enumerate(source_tokens):
-        if target_tokens[i] == source_token:
-          extend_target_ids.append(extend_source_ids[j])
-          find_match = True
-          break
-      if not find_match:
-        extend_target_ids.append(target_unk_id)
-    else:
-      extend_target_ids.append(target_id)
+  aligner = CopyAligner(None, target_unk_id)
+  extend_target_ids, _ = aligner.align_target(extend_source_ids, first_positions(source_tokens), target_tokens, target_ids)
   return extend_target_ids
 
+# features whose lengths are summarized per shard in the manifest
+LENGTH_STAT_KEYS = ["source_ids", "target_ids", "source_oov_list"]
+
+# worker processes of generate_features_parallel
+DEFAULT_NUM_WORKERS = multiprocessing.cpu_count()
+
+# Preprocess instance of a worker process, see Preprocess.get_features
+_worker_preprocess = None
+
+def _init_worker(init_kwargs):
+  global _worker_preprocess
+  _worker_preprocess = Preprocess(**init_kwargs)
+
+def _process_chunk(task):
+  task_id, path, start, end, save_path, tfrecord_out_nums, compression = task
+  writer = ShardedRecordWriter(save_path, tfrecord_out_nums, prefix="{:05d}-".format(task_id),
+                               compression=compression, length_keys=LENGTH_STAT_KEYS)
+  for line in iter_range_lines(path, start, end):
+    writer.write(_worker_preprocess.get_example(line))
+  writer.close()
+  NLP.get_annotation_cache().flush()
+  for shard in writer.shards:
+    shard.update({"source": path, "start": start, "end": end})
+  return task_id, writer.shards
+
 class Preprocess(object):
 
-  def __init__(self, vocab_path, pos_path, ner_path, tfidf_path, char_path=None, source_delimeter=" ", target_delimeter=" ", **kwargs):
+  def __init__(self, vocab_path, pos_path, ner_path, tfidf_path, char_path=None, source_delimeter=" ", target_delimeter=" ",
+               annotation_cache_path=None, format_version=global_vars.CURRENT_FORMAT_VERSION, **kwargs):
+    # kept to build the same Preprocess in worker processes
+    self._init_kwargs = dict(vocab_path=vocab_path, pos_path=pos_path, ner_path=ner_path, tfidf_path=tfidf_path,
+                             char_path=char_path, source_delimeter=source_delimeter,
+                             target_delimeter=target_delimeter, annotation_cache_path=annotation_cache_path,
+                             format_version=format_version)
+    if format_version not in (global_vars.LEGACY_FORMAT_VERSION, global_vars.TOKEN_LIST_FORMAT_VERSION):
+      raise ValueError("Unknown format_version {}".format(format_version))
+    self._format_version = format_version
+    if annotation_cache_path is not None:
+      # pos/ner tags of already seen sentences are read from this sqlite file
+      NLP.set_annotation_cache(AnnotationCache(annotation_cache_path))
     self._vocab_path = vocab_path
     self._pos_path = pos_path
     self._ner_path = ner_path
     self._tfidf_path = tfidf_path
     self._char_path = char_path
-    self._vocab_cls = vocab.Vocab(vocab_path)
-    self._pos_cls = vocab.Vocab(pos_path)
-    self._ner_cls = vocab.Vocab(ner_path)
+    self._vocab_cls = vocab.load_vocab(vocab_path)
+    self._pos_cls = vocab.load_vocab(pos_path)
+    self._ner_cls = vocab.load_vocab(ner_path)
     self._tfidf_cls = NLP.Tfidf(tfidf_path, special_words=SpecialWords, default=0.0)
     self._source_delimeter = source_delimeter
     self._target_delimeter = target_delimeter
     self._char_path = None
     if self._char_path is not None:
-      self._char_cls = vocab.Vocab(self._char_path)
-
-  def get_features(self, dir_or_path, save_path, mode, tfrecord_out_nums=10000):
-    paths = utils.get_dir_or_file_path(dir_or_path)
+      self._char_cls = vocab.load_vocab(self._char_path)
+    self._aligner = CopyAligner(self._vocab_cls.size(), self._vocab_cls.special_vocab.UNK)
+
+  def get_example(self, line):
+    """Returns the tf.train.Example of a "source\ttarget" line."""
+    line = line.strip()
+    source, target = line.split("\t")
+    source_tokens = source.strip().split(self._source_delimeter)
+    target_tokens = target.strip().split(self._target_delimeter)
+    source_features = self.get_source_side_features(source_tokens)
+    target_features = self.get_target_side_features(source_features, target_tokens, with_aliment=True)
+    example_features = utils.merge_dict([source_features, target_features])
+    return self.convert_to_tfrecord_example(example_features)
+
+  def get_features(self, dir_or_path, save_path, mode, tfrecord_out_nums=10000, num_workers=1,
+                   chunk_bytes=64 * 1024 * 1024, compression=None):
+    """Writes the features of parallel "source\ttarget" files to TFRecord files.
+
+    With num_workers > 1 the files are split into byte ranges of chunk_bytes
+    which a pool of processes handles independently. The pos and ner models
+    are loaded once here before forking and shared by the workers, every
+    worker builds its own Preprocess (vocabularies, tfidf) once. Chunk i is written to
+    `<save_path>.<i>-<n>` files, so the output doesn't depend on scheduling.
+    Both modes write `<save_path>.manifest.json` with the shards, their sizes
+    and length stats, see `seq2seq.data.record_shards`. compression is None,
+    "GZIP" or "ZLIB".
+    """
+    # sorted like the chunks of the parallel mode, so both write the same order
+    paths = sorted(utils.get_dir_or_file_path(dir_or_path))
     self._sample_cnt = 0
     if os.path.exists(os.path.dirname(save_path)) == False:
       os.makedirs(os.path.dirname(save_path))
 
-    writer = tf.python_io.TFRecordWriter(save_path + ".0")
+    if mode != "train" and mode != "eval":
+      return
 
-    if mode == "train" or mode == "eval":
+    if num_workers > 1:
+      shards = self._get_features_parallel(paths, save_path, tfrecord_out_nums, num_workers, chunk_bytes,
+                                           compression)
+    else:
+      writer = ShardedRecordWriter(save_path, tfrecord_out_nums, compression=compression,
+                                   length_keys=LENGTH_STAT_KEYS)
+      start_time = time.time()
       for i, path in enumerate(paths):
         f = codecs.open(path, "r", "utf-8")
         for line in f:
-
-          if self._sample_cnt % tfrecord_out_nums == 0:
-            if self._sample_cnt > 0:
-              writer.close()
-            writer = tf.python_io.TFRecordWriter(save_path + ".{}".format(self._sample_cnt / tfrecord_out_nums))
-
-          line = line.strip()
-          source, target = line.split("\t")
-          source_tokens = source.strip().split(self._source_delimeter)
-          target_tokens = target.strip().split(self._target_delimeter)
-          source_features = self.get_source_side_features(source_tokens)
-          target_features = self.get_target_side_features(source_features, target_tokens)
-          aliment_features = self.get_aliment_extend_features(source_features, target_features)
-          example_features = utils.merge_dict([source_features, aliment_features, target_features])
-          example = self.convert_to_tfrecord_example(example_features)
+          writer.write(self.get_example(line))
           self._sample_cnt += 1
-          writer.write(example.SerializeToString())
+          if self._sample_cnt % tfrecord_out_nums == 0:
+            tf.logging.info("processed %d examples, %.1f examples/sec", self._sample_cnt,
+                            self._sample_cnt / (time.time() - start_time))
+        f.close()
       writer.close()
+      shards = writer.shards
+
+    self._sample_cnt = sum(shard["num_examples"] for shard in shards)
+    write_manifest(save_path, shards, compression)
+    NLP.get_annotation_cache().flush()
+    tf.logging.info("annotation cache: %s", NLP.annotation_cache_stats())
+
+  def _get_features_parallel(self, paths, save_path, tfrecord_out_nums, num_workers, chunk_bytes, compression=None):
+    chunks = split_into_ranges(paths, chunk_bytes)
+    tasks = [(i, path, start, end, save_path, tfrecord_out_nums, compression)
+             for i, (path, start, end) in enumerate(chunks)]
+    total_bytes = sum(end - start for _, start, end in chunks)
+    tf.logging.info("processing %d bytes in %d chunks with %d workers", total_bytes, len(tasks), num_workers)
+
+    results = {}
+    done_bytes, done_examples = 0, 0
+    start_time = time.time()
+    # load the taggers once here, forked workers share them
+    NLP.preload_models(["pos", "ner"])
+    pool = multiprocessing.Pool(num_workers, initializer=_init_worker, initargs=(self._init_kwargs,))
+    try:
+      for task_id, shards in pool.imap_unordered(_process_chunk, tasks):
+        results[task_id] = shards
+        done_bytes += chunks[task_id][2] - chunks[task_id][1]
+        done_examples += sum(shard["num_examples"] for shard in shards)
+        elapsed = time.time() - start_time
+        tf.logging.info("chunks %d/%d, %.1f%% bytes, %d examples, %.1f examples/sec", len(results), len(tasks),
+                        100.0 * done_bytes / max(total_bytes, 1), done_examples, done_examples / max(elapsed, 1e-6))
+      pool.close()
+    except:
+      pool.terminate()
+      raise
+    finally:
+      pool.join()
+    return [shard for task_id in sorted(results) for shard in results[task_id]]
 
   def get_source_side_features(self, source_tokens, add_end_symbol=SpecialWordsIns.SEQUENCE_END, ):
 
@@ -151,7 +223,7 @@ class Preprocess(object):
     source_pos_ids = [self._pos_cls.word2id(pos) for pos in source_postags]
     source_tfidfs = self._tfidf_cls.encode(source_tokens)
 
-    extend_source_ids, source_oov_list = get_extend_source_ids(source_tokens, source_ids, self._vocab_cls)
+    extend_source_ids, source_oov_list, _ = self._aligner.align_source(source_tokens, source_ids)
     source_oov_nums = len(source_oov_list)
 
     vars = locals()
@@ -167,18 +239,14 @@ class Preprocess(object):
     return source_features
 
   def get_aliment_extend_features(self, source_features, target_features):
-    source_tokens, target_tokens = source_features["source_token"], target_features["target_token"]
-    aliment_features = {}
-    aliment = []
-    for target_token in target_tokens:
-      if target_token in source_tokens:
-        aliment.append(source_tokens.index(target_token))
-      else:
-        aliment.append(-1)
-    aliment_features["aliment"] = aliment
-    return aliment_features
+    source_tokens, target_tokens = source_features["source_tokens"], target_features["target_tokens"]
+    _, aliment = self._aligner.align_target(
+      source_features["extend_source_ids"], first_positions(source_tokens), target_tokens)
+    return {"aliment": aliment}
 
-  def get_target_side_features(self, source_features, target_tokens, add_start_symbol=SpecialWordsIns.SEQUENCE_START, add_end_symbol=SpecialWordsIns.SEQUENCE_END):
+  def get_target_side_features(self, source_features, target_tokens, add_start_symbol=SpecialWordsIns.SEQUENCE_START,
+                               add_end_symbol=SpecialWordsIns.SEQUENCE_END, with_aliment=False):
+    """with_aliment also returns the aliment computed in the same pass as extend_target_ids"""
 
     target_features = {}
     ##get raw target nlp features: words, ner
@@ -189,23 +257,24 @@ class Preprocess(object):
     target_ners.append(add_end_symbol)
 
     target_ids = words_to_id(target_tokens, self._vocab_cls)
-    extend_target_ids = get_extend_target_ids(source_features["extend_source_ids"], source_features["source_tokens"], target_tokens, target_ids, self._vocab_cls.special_vocab.UNK)
+    target_ner_ids = [self._ner_cls.word2id(ner) for ner in target_ners]
+    extend_target_ids, aliment = self._aligner.align_target(
+      source_features["extend_source_ids"], first_positions(source_features["source_tokens"]), target_tokens, target_ids)
     vars = locals()
     target_keys = global_vars.target_feature_keys
     for key in target_keys:
       target_features[key] = vars[key]
+    if with_aliment:
+      target_features["aliment"] = aliment
     return target_features
 
   def convert_to_tfrecord_example(self, all_features):
     int64_keys = ["source_ids", "extend_source_ids","source_oov_nums","source_ner_ids", "source_pos_ids", "target_ids", "extend_target_ids", "target_ner_ids", "aliment"]
     float_keys = ["source_tfidfs"]
     bytes_keys = ["source_ners", "source_postags","source_tokens", "source_oov_list", "target_tokens", "target_ners"]
-    features = OrderedDict()
-    vars = locals()
     ex = tf.train.Example()
     for key in all_features:
-      var = vars[key]
-      features[key] = var
+      var = all_features[key]
       if key in int64_keys:
         if type(var) != list:
           var = [var]
@@ -215,10 +284,15 @@ class Preprocess(object):
           var = [var]
         ex.features.feature[key].float_list.value.extend(var)
       elif key in bytes_keys:
-        s = join_str(var).encode("utf-8")
-        ex.features.feature[key].bytes_list.value.extend([s])
+        if self._format_version == global_vars.LEGACY_FORMAT_VERSION:
+          values = [join_str(var).encode("utf-8")]
+        else:
+          values = [encode_token(v) for v in var]
+        ex.features.feature[key].bytes_list.value.extend(values)
       else:
         raise ValueError("{} not in int64_keys,float_keys, bytes_keys".format(key))
+    if self._format_version != global_vars.LEGACY_FORMAT_VERSION:
+      ex.features.feature[global_vars.FORMAT_VERSION_KEY].int64_list.value.append(self._format_version)
     return ex
 
   def get_infer_features_from_files(self, source_paths, save_path):
@@ -237,6 +311,8 @@ class Preprocess(object):
         example = self.convert_to_tfrecord_example(source_features)
         writer.write(example.SerializeToString())
         source_features_list.append(source_features)
+    writer.close()
+    NLP.get_annotation_cache().flush()
     return source_features_list
 
 
@@ -260,18 +336,11 @@ def get_features(parallel_text_path, save_path, vocab_cls, pos_cls, ner_cls, tfi
   f = codecs.open(parallel_text_path, "r", "utf-8")
   all_features = []
   cnt = 0
-  writer = None
+  writer = ShardedRecordWriter(save_path, tfrecord_out_nums, length_keys=LENGTH_STAT_KEYS)
+  aligner = CopyAligner(vocab_cls.size(), vocab_cls.special_vocab.UNK, unique=copy_source_unique)
 
   for st in f:
 
-    if cnt == 0:
-      writer = tf.python_io.TFRecordWriter(save_path + ".0")
-    elif (cnt + 1) % tfrecord_out_nums == 0:
-      writer.close()
-      x = int( (cnt + 1) / tfrecord_out_nums )
-      path = save_path + ".{}".format(x)
-      writer = tf.python_io.TFRecordWriter(path)
-
     source_line, target_line = st.strip().split("\t")
     source_line = source_line.strip()
     target_line = target_line.strip()
@@ -308,9 +377,8 @@ def get_features(parallel_text_path, save_path, vocab_cls, pos_cls, ner_cls, tfi
     target_ids = words_to_id(target_tokens, vocab_cls)
     target_ner_ids = [ner_cls.word2id(ner) for ner in target_ners]
 
-    extend_source_ids, source_oov_list = get_extend_source_ids(source_tokens, source_ids, vocab_cls, unique=copy_source_unique)
+    extend_source_ids, source_oov_list, extend_target_ids, _ = aligner.align(source_tokens, source_ids, target_tokens, target_ids)
     source_oov_nums = len(source_oov_list)
-    extend_target_ids = get_extend_target_ids(extend_source_ids, source_tokens, target_tokens, target_ids, vocab_cls.special_vocab.UNK)
 
     assert len(source_ids) == len(source_tokens)
     assert len(source_ids) == len(extend_source_ids)
@@ -350,13 +418,14 @@ def get_features(parallel_text_path, save_path, vocab_cls, pos_cls, ner_cls, tfi
       else:
         raise ValueError("{} not in int64_keys,float_keys, bytes_keys".format(key))
 
-    writer.write(ex.SerializeToString())
+    writer.write(ex)
 
     all_features.append(features)
 
     cnt += 1
 
   writer.close()
+  write_manifest(save_path, writer.shards)
 
   return all_features
 
@@ -442,6 +511,31 @@ def generate_features(parallel_text_path, save_path, vocab_path, copy_source_uni
   # from  pprint import pprint
   # pprint(features)
 
+@click.command()
+@click.argument("dir_or_path")
+@click.argument("save_path")
+@click.argument("vocab_path")
+@click.option("--pos_path", type=str)
+@click.option("--ner_path", type=str)
+@click.option("--tfidf_path", type=str)
+@click.option("--mode", type=str, default="train", help="train or eval")
+@click.option("--out_nums", type=int, default=10000, help="record nums every tf record file")
+@click.option("--num_workers", type=int, default=DEFAULT_NUM_WORKERS, help="worker processes")
+@click.option("--chunk_mb", type=int, default=64, help="MB of input handled by a worker at once")
+@click.option("--annotation_cache", type=str, default=None, help="sqlite file caching pos/ner tags")
+@click.option("--format_version", type=int, default=global_vars.CURRENT_FORMAT_VERSION,
+              help="0 joins string features with spaces (legacy), 1 writes one bytes value per token")
+@click.option("--compression", type=click.Choice(["", "GZIP", "ZLIB"]), default="", help="record compression")
+def generate_features_parallel(dir_or_path, save_path, vocab_path, pos_path=None, ner_path=None, tfidf_path=None,
+                               mode="train", out_nums=10000, num_workers=DEFAULT_NUM_WORKERS, chunk_mb=64,
+                               annotation_cache=None,
+                               format_version=global_vars.CURRENT_FORMAT_VERSION, compression=""):
+  tf.logging.set_verbosity(tf.logging.INFO)
+  preprocess = Preprocess(vocab_path, pos_path, ner_path, tfidf_path, annotation_cache_path=annotation_cache,
+                          format_version=format_version)
+  preprocess.get_features(dir_or_path, save_path, mode, tfrecord_out_nums=out_nums,
+                          num_workers=num_workers, chunk_bytes=chunk_mb * 1024 * 1024, compression=compression)
+
 @click.command()
 @click.argument("load_path")
 def load_features(load_path):
@@ -495,6 +589,7 @@ def pipeline_debug(load_path):
       print("\n")
 
 cli.add_command(generate_features)
+cli.add_command(generate_features_parallel)
 cli.add_command(load_features)
 cli.add_command(pipeline_debug)
 
@@ -72,7 +72,14 @@ class BeamSearchConfig(
 
 def gather_tree_py(values, parents):
   """Gathers path through a tree backwards from the leave nodes. Used
-  to reconstruct beams given their parents."""
+  to reconstruct beams given their parents.
+
+  `values` and `parents` are either of shape `[T, beam_width]` or, for
+  batched beam search, of shape `[T, batch_size, beam_width]`."""
+  if values.ndim == 3:
+    res = [gather_tree_py(values[:, i], parents[:, i])
+           for i in range(values.shape[1])]
+    return np.stack(res, axis=1).astype(values.dtype)
   beam_length = values.shape[0]
   num_beams = values.shape[1]
   res = np.zeros_like(values)
@@ -111,6 +118,25 @@ def create_initial_beam_state(config):
           [config.beam_width], dtype=tf.int32))
 
 
+def create_initial_batch_beam_state(config, batch_size):
+  """Creates an instance of `BeamState` for batched beam search. All
+  fields are of shape `[batch_size, beam_width]`.
+
+  Args:
+    config: A BeamSearchConfig
+    batch_size: The number of source sequences decoded in parallel
+
+  Returns:
+    An instance of `BeamState`.
+  """
+  return BeamSearchState(
+      log_probs=tf.zeros([batch_size, config.beam_width]),
+      finished=tf.zeros(
+          [batch_size, config.beam_width], dtype=tf.bool),
+      lengths=tf.zeros(
+          [batch_size, config.beam_width], dtype=tf.int32))
+
+
 def length_penalty(sequence_lengths, penalty_factor):
   """Calculates the length penalty according to
   https://arxiv.org/abs/1609.08144
@@ -148,9 +174,19 @@ def choose_top_k(scores_flat, config):
 
 def choose_top_k_mask_unk(scores_flat, config):
   """ choose top k beams as successors mask unk index as 0(without unk)
-  :param scores_flat: flatten [b, vocab_size] to [-1], scores
+  :param scores_flat: flatten [b, vocab_size] to [-1], scores. For batched
+    beam search a tensor of shape [batch_size, beam_width * vocab_size]
   """
   base_unk_index = config.vocab_size - 3
+  if scores_flat.get_shape().ndims == 2:
+    # Batched beam search: push all unk scores to the bottom of each row
+    unk_mask = tf.equal(
+        tf.mod(tf.range(tf.shape(scores_flat)[1]), config.vocab_size),
+        base_unk_index)
+    scores_flat = tf.where(
+        tf.tile(tf.expand_dims(unk_mask, 0), [tf.shape(scores_flat)[0], 1]),
+        tf.fill(tf.shape(scores_flat), tf.float32.min), scores_flat)
+    return tf.nn.top_k(scores_flat, k=config.beam_width)
   batch_size = tf.cast(tf.size(scores_flat) / config.vocab_size, tf.int32)
   # batch_size = tf.Print(batch_size, [batch_size], "batch_size:")
   top_num = batch_size + config.beam_width #extra elements is for mask the unk indexs
@@ -188,19 +224,21 @@ def mask_probs(probs, eos_token, finished):
   allocate all probability mass to eos. Unfinished beams remain unchanged.
 
   Args:
-    probs: Log probabiltiies of shape `[beam_width, vocab_size]`
+    probs: Log probabiltiies of shape `[beam_width, vocab_size]`, or
+      `[batch_size, beam_width, vocab_size]` for batched beam search.
     eos_token: An int32 id corresponding to the EOS token to allocate
       probability to
-    finished: A boolean tensor of shape `[beam_width]` that specifies which
-      elements in the beam are finished already.
+    finished: A boolean tensor of shape `[beam_width]` (or
+      `[batch_size, beam_width]`) that specifies which elements in the beam
+      are finished already.
 
   Returns:
-    A tensor of shape `[beam_width, vocab_size]`, where unfinished beams
+    A tensor of the same shape as `probs`, where unfinished beams
     stay unchanged and finished beams are replaced with a tensor that has all
     probability on the EOS token.
   """
-  vocab_size = tf.shape(probs)[1]
-  finished_mask = tf.expand_dims(tf.to_float(1. - tf.to_float(finished)), 1)
+  vocab_size = tf.shape(probs)[-1]
+  finished_mask = tf.expand_dims(tf.to_float(1. - tf.to_float(finished)), -1)
   # These examples are not finished and we leave them
   non_finished_examples = finished_mask * probs
   # All finished examples are replaced with a vector that has all
@@ -299,3 +337,122 @@ def beam_search_step(time_, logits, beam_state, config):
       beam_parent_ids=next_beam_ids)
 
   return output, next_state
+
+
+def batch_gather(params, indices):
+  """Gathers `params[b, indices[b, k]]` for every batch entry `b`.
+
+  Args:
+    params: A tensor of shape `[batch_size, N]`
+    indices: An int32 tensor of shape `[batch_size, K]`
+
+  Returns:
+    A tensor of shape `[batch_size, K]`.
+  """
+  batch_size = tf.shape(params)[0]
+  offsets = tf.expand_dims(tf.range(batch_size) * tf.shape(params)[1], 1)
+  flat = tf.gather(tf.reshape(params, [-1]), tf.reshape(indices + offsets, [-1]))
+  return tf.reshape(flat, tf.shape(indices))
+
+
+def flat_beam_indices(beam_parent_ids, beam_width):
+  """Converts per-example beam parent ids of shape `[batch_size, beam_width]`
+  into row indices into a flattened `[batch_size * beam_width, ...]` tensor.
+  """
+  batch_size = tf.shape(beam_parent_ids)[0]
+  offsets = tf.expand_dims(tf.range(batch_size) * beam_width, 1)
+  return tf.reshape(beam_parent_ids + offsets, [-1])
+
+
+def batch_beam_search_step(time_, logits, beam_state, config):
+  """Performs a single step of Beam Search Decoding for a batch of source
+  sequences. Each batch entry keeps its own `beam_width` hypotheses.
+
+  Args:
+    time_: Beam search time step, should start at 0. At time 0 we assume
+      that all beams are equal and consider only the first beam for
+      continuations.
+    logits: Logits at the current time step. A tensor of shape
+      `[batch_size, beam_width, vocab_size]`
+    beam_state: Current state of the beam search. An instance of `BeamState`
+      where all fields are of shape `[batch_size, beam_width]`.
+    config: An instance of `BeamSearchConfig`
+
+  Returns:
+    A tuple `(BeamSearchStepOutput, BeamSearchState)`. All fields are of
+    shape `[batch_size, beam_width]` and `beam_parent_ids` index into the
+    beams of the same batch entry.
+  """
+  batch_size = tf.shape(logits)[0]
+
+  # Calculate the current lengths of the predictions
+  prediction_lengths = beam_state.lengths
+  previously_finished = beam_state.finished
+
+  # Calculate the total log probs for the new hypotheses
+  # Final Shape: [batch_size, beam_width, vocab_size]
+  probs = tf.nn.log_softmax(logits)
+  probs = mask_probs(probs, config.eos_token, previously_finished)
+  total_probs = tf.expand_dims(beam_state.log_probs, 2) + probs
+
+  # Calculate the continuation lengths
+  # We add 1 to all continuations that are not EOS and were not
+  # finished previously
+  lengths_to_add = tf.one_hot(
+      tf.fill([batch_size, config.beam_width], config.eos_token),
+      config.vocab_size, 0, 1)
+  add_mask = (1 - tf.to_int32(previously_finished))
+  lengths_to_add = tf.expand_dims(add_mask, 2) * lengths_to_add
+  new_prediction_lengths = tf.expand_dims(prediction_lengths,
+                                          2) + lengths_to_add
+
+  # Calculate the scores for each beam
+  scores = hyp_score(
+      log_probs=total_probs,
+      sequence_lengths=new_prediction_lengths,
+      config=config)
+
+  scores_flat = tf.reshape(scores, [batch_size, -1])
+  # During the first time step we only consider the initial beam
+  scores_flat = tf.cond(
+      tf.convert_to_tensor(time_) > 0, lambda: scores_flat,
+      lambda: scores[:, 0])
+
+  # Pick the next beams according to the specified successors function
+  next_beam_scores, word_indices = config.choose_successors_fn(scores_flat,
+                                                               config)
+  next_beam_scores.set_shape([None, config.beam_width])
+  word_indices.set_shape([None, config.beam_width])
+
+  # Pick out the probs, beam_ids, and states according to the chosen predictions
+  total_probs_flat = tf.reshape(
+      total_probs, [batch_size, -1], name="total_probs_flat")
+  next_beam_probs = batch_gather(total_probs_flat, word_indices)
+  next_word_ids = tf.mod(word_indices, config.vocab_size)
+  next_beam_ids = tf.div(word_indices, config.vocab_size)
+
+  # Append new ids to current predictions
+  next_finished = tf.logical_or(
+      batch_gather(beam_state.finished, next_beam_ids),
+      tf.equal(next_word_ids, config.eos_token))
+
+  # Calculate the length of the next predictions.
+  # 1. Finished beams remain unchanged
+  # 2. Beams that are now finished (EOS predicted) remain unchanged
+  # 3. Beams that are not yet finished have their length increased by 1
+  lengths_to_add = tf.to_int32(tf.not_equal(next_word_ids, config.eos_token))
+  lengths_to_add = (1 - tf.to_int32(next_finished)) * lengths_to_add
+  next_prediction_len = batch_gather(beam_state.lengths, next_beam_ids)
+  next_prediction_len += lengths_to_add
+
+  next_state = BeamSearchState(
+      log_probs=next_beam_probs,
+      lengths=next_prediction_len,
+      finished=next_finished)
+
+  output = BeamSearchStepOutput(
+      scores=next_beam_scores,
+      predicted_ids=next_word_ids,
+      beam_parent_ids=next_beam_ids)
+
+  return output, next_state
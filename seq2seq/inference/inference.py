@@ -39,8 +39,11 @@ def create_inference_graph(model, input_pipeline, batch_size=32):
 
   # TODO: This doesn't really belong here.
   # How to get rid of this?
+  # Batched beam search keeps the beams of every example apart and
+  # can use the requested batch size.
   if hasattr(model, "use_beam_search"):
-    if model.use_beam_search:
+    if model.use_beam_search and \
+        not getattr(model, "use_batched_beam_search", False):
       tf.logging.info("Setting batch size to 1 for beam search.")
       batch_size = 1
 
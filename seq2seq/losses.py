@@ -44,3 +44,59 @@ def cross_entropy_sequence_loss(logits, targets, sequence_length):
     losses = losses * tf.transpose(tf.to_float(loss_mask), [1, 0])
 
     return losses
+
+
+def copy_gen_sequence_loss(logits, attention_scores, p_gens,
+                           extend_source_ids, targets, sequence_length,
+                           epsilon=1e-10):
+  """Calculates the per-example pointer-generator loss for a sequence and
+    masks out all losses passed the sequence length.
+
+  Only the probability of the target tokens is computed, the dense
+  distribution over the extended vocabulary is never built. The probability
+  of a target is `p_gen * softmax(logits)[target]` plus `(1 - p_gen)` times
+  the attention of all source positions that hold the target.
+
+  Args:
+    logits: Vocabulary logits of shape `[T, B, vocab_size]`
+    attention_scores: Attention distributions of shape `[T, B, source_len]`
+    p_gens: Generation probabilities of shape `[T, B, 1]`
+    extend_source_ids: Extended vocabulary ids of the source words,
+      an integer tensor of shape `[B, source_len]`
+    targets: Extended vocabulary ids of the targets of shape `[T, B]`.
+      Targets `>= vocab_size` can only be copied from the source.
+    sequence_length: An int32 tensor of shape `[B]` corresponding
+      to the length of each input
+    epsilon: Added to the target probabilities to avoid `log(0)`
+
+  Returns:
+    A tensor of shape [T, B] that contains the loss per example, per time step.
+  """
+  with tf.name_scope("copy_gen_sequence_loss"):
+    targets = tf.to_int32(targets)
+    vocab_size = tf.shape(logits)[2]
+    p_gens = tf.squeeze(p_gens, [2])
+
+    # Probability of generating the target, 0 for out of vocabulary targets
+    in_vocab = tf.less(targets, vocab_size)
+    vocab_targets = tf.where(in_vocab, targets, tf.zeros_like(targets))
+    vocab_probs = tf.exp(-tf.nn.sparse_softmax_cross_entropy_with_logits(
+        logits=logits, labels=vocab_targets))
+    vocab_probs *= tf.to_float(in_vocab)
+
+    # Probability of copying the target: attention summed over all source
+    # positions that hold the target
+    copy_mask = tf.equal(
+        tf.expand_dims(tf.to_int32(extend_source_ids), 0),
+        tf.expand_dims(targets, 2))
+    copy_probs = tf.reduce_sum(attention_scores * tf.to_float(copy_mask), 2)
+
+    probs = p_gens * vocab_probs + (1. - p_gens) * copy_probs
+    losses = -tf.log(probs + epsilon)
+
+    # Mask out the losses we don't care about
+    loss_mask = tf.sequence_mask(
+        tf.to_int32(sequence_length), tf.to_int32(tf.shape(targets)[0]))
+    losses = losses * tf.transpose(tf.to_float(loss_mask), [1, 0])
+
+    return losses
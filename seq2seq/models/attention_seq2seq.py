@@ -67,7 +67,10 @@ class AttentionSeq2Seq(BasicSeq2Seq):
     reverse_scores_lengths = None
     if self.params["source.reverse"]:
       reverse_scores_lengths = features["source_len"]
-      if self.use_beam_search:
+      if self.use_batched_beam_search:
+        reverse_scores_lengths = self._maybe_tile_for_beam_search(
+            reverse_scores_lengths)
+      elif self.use_beam_search:
         reverse_scores_lengths = tf.tile(
             input=reverse_scores_lengths,
             multiples=[self.params["inference.beam_search.beam_width"]])
@@ -76,8 +79,11 @@ class AttentionSeq2Seq(BasicSeq2Seq):
         params=self.params["decoder.params"],
         mode=self.mode,
         vocab_size=self.target_vocab_info.total_size,
-        attention_values=encoder_output.attention_values,
-        attention_values_length=encoder_output.attention_values_length,
-        attention_keys=encoder_output.outputs,
+        attention_values=self._maybe_tile_for_beam_search(
+            encoder_output.attention_values),
+        attention_values_length=self._maybe_tile_for_beam_search(
+            encoder_output.attention_values_length),
+        attention_keys=self._maybe_tile_for_beam_search(
+            encoder_output.outputs),
         attention_fn=attention_layer,
         reverse_scores_lengths=reverse_scores_lengths)
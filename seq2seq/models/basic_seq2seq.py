@@ -95,8 +95,7 @@ class BasicSeq2Seq(Seq2SeqModel):
   def _decode_infer(self, decoder, bridge, _encoder_output, features, labels):
     """Runs decoding in inference mode"""
     batch_size = self.batch_size(features, labels)
-    if self.use_beam_search:
-      batch_size = self.params["inference.beam_search.beam_width"]
+    batch_size = self._beam_decode_batch_size(batch_size)
     target_start_id = self.target_vocab_info.special_vocab.SEQUENCE_START
     helper_infer = tf_decode_helper.GreedyEmbeddingHelper(
         embedding=self.target_embedding,
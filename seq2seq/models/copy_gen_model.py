@@ -40,7 +40,7 @@ class CopyGenSeq2Seq(AttentionSeq2Seq):
     self._vocab_instance = vocab_instance
     super(CopyGenSeq2Seq, self).__init__(params, mode, name) #final self._params will be the params override the default_params
     if vocab_instance is None:
-      self._vocab_instance = vocab.Vocab(self.params["vocab_source"])
+      self._vocab_instance = vocab.load_vocab(self.params["vocab_source"])
 
   @staticmethod
   def default_params():
@@ -50,6 +50,8 @@ class CopyGenSeq2Seq(AttentionSeq2Seq):
     params.update({
         "pointer_gen": True,
         "coverage": True,
+        "final_dist.while_loop": False, # build the final distribution step by step, only kept for parity tests
+        "loss.mode": "dense", # dense: softmax over the final distribution, gather: only the target probabilities
         "embedding.share": True,
         "attention.class": "AttentionLayerBahdanau",
         "attention.params": {}, # Arbitrary attention layer parameters
@@ -182,7 +184,10 @@ class CopyGenSeq2Seq(AttentionSeq2Seq):
     reverse_scores_lengths = None
     if self.params["source.reverse"]:
       reverse_scores_lengths = features["source_len"]
-      if self.use_beam_search:
+      if self.use_batched_beam_search:
+        reverse_scores_lengths = self._maybe_tile_for_beam_search(
+            reverse_scores_lengths)
+      elif self.use_beam_search:
         reverse_scores_lengths = tf.tile(
             input=reverse_scores_lengths,
             multiples=[self.params["inference.beam_search.beam_width"]])
@@ -191,9 +196,12 @@ class CopyGenSeq2Seq(AttentionSeq2Seq):
         params=self.params["decoder.params"],
         mode=self.mode,
         vocab_size=self.target_vocab_info.total_size,
-        attention_values=encoder_output.attention_values,
-        attention_values_length=encoder_output.attention_values_length,
-        attention_keys=encoder_output.outputs,
+        attention_values=self._maybe_tile_for_beam_search(
+            encoder_output.attention_values),
+        attention_values_length=self._maybe_tile_for_beam_search(
+            encoder_output.attention_values_length),
+        attention_keys=self._maybe_tile_for_beam_search(
+            encoder_output.outputs),
         attention_fn=attention_layer,
         reverse_scores_lengths=reverse_scores_lengths)
 
@@ -244,8 +252,7 @@ class CopyGenSeq2Seq(AttentionSeq2Seq):
   def _decode_infer(self, decoder, bridge, _encoder_output, features, labels):
     """Runs decoding in inference mode"""
     batch_size = self.batch_size(features, labels)
-    if self.use_beam_search:
-      batch_size = self.params["inference.beam_search.beam_width"]
+    batch_size = self._beam_decode_batch_size(batch_size)
 
     target_start_id = self.target_vocab_info.special_vocab.SEQUENCE_START
     helper_infer = tf_decode_helper.CopyGenGreedyEmbeddingHelper(
@@ -256,9 +263,61 @@ class CopyGenSeq2Seq(AttentionSeq2Seq):
     decoder_initial_state = bridge()
     return decoder(decoder_initial_state, helper_infer)
 
-  def _calc_final_dist(self, decoder_output, features):
+  def _calc_final_dist(self, decoder_output, features, while_loop=None):
     """Calculate the final distribution, for the pointer-generator model
 
+    Args:
+      decoder_output: The decoder output. `logits` are the vocabulary distributions of shape [T, B, vsize],
+        `attention_scores` the attention distributions of shape [T, B, attn_len] and `pgens` the
+        generation probabilities of shape [T, B, 1].
+      features: The features dict, must contain `source_ids`, `extend_source_ids` and `source_oov_nums`.
+      while_loop: If True, build the distributions one timestep at a time in a `tf.while_loop`.
+        Defaults to the `final_dist.while_loop` param.
+
+    Returns:
+      A tuple (final_dists, attn_projected_dists) of shape [T, B, extended_vsize].
+    """
+    if while_loop is None:
+      while_loop = self.params["final_dist.while_loop"]
+    if while_loop:
+      final_dists, attn_projected_dists = self._calc_final_dist_loop(decoder_output, features)
+      return final_dists.stack(), attn_projected_dists.stack()
+
+    vocab_dists = decoder_output.logits
+    attn_dists = decoder_output.attention_scores
+    p_gens = decoder_output.pgens
+
+    source_vocab_total_size = self.source_vocab_info.total_size
+
+    max_t = tf.shape(vocab_dists)[0]
+    batch_size = vocab_dists.get_shape().as_list()[1] or tf.shape(vocab_dists)[1]
+    batch_source_max_oovs = tf.to_int32(tf.reduce_max(features["source_oov_nums"]))
+    extended_vsize = source_vocab_total_size + batch_source_max_oovs
+
+    with tf.variable_scope('final_distribution'):
+      vocab_dists, attn_dists = p_gens * vocab_dists, (1 - p_gens) * attn_dists
+      extra_zeros = tf.zeros(tf.stack([max_t, batch_size, batch_source_max_oovs]))
+      vocab_dists_extended = tf.concat(axis=2, values=[vocab_dists, extra_zeros]) #[T, b, origin_total_vocab_size + extend_vocab_size]
+
+      # (t, b, extend id) of every attention score, built once for all timesteps
+      attn_len = tf.shape(features["source_ids"])[1]
+      time_nums = tf.tile(tf.reshape(tf.range(max_t), [-1, 1, 1]), [1, batch_size, attn_len])
+      batch_nums = tf.tile(tf.reshape(tf.range(batch_size), [1, -1, 1]), [max_t, 1, attn_len])
+      extend_ids = tf.tile(tf.expand_dims(tf.to_int32(features["extend_source_ids"]), 0), [max_t, 1, 1])
+      indices = tf.stack((time_nums, batch_nums, extend_ids), axis=3)
+
+      #the same word id 's properbility is summed, see _calc_final_dist_loop
+      attn_projected_dists = tf.scatter_nd(indices, attn_dists, tf.stack([max_t, batch_size, extended_vsize]))
+      final_dists = attn_projected_dists + vocab_dists_extended
+
+      #avoid nan
+      final_dists += sys.float_info.epsilon
+
+    return final_dists, attn_projected_dists
+
+  def _calc_final_dist_loop(self, decoder_output, features):
+    """Calculate the final distribution one timestep at a time, for the pointer-generator model
+
     Args:
       vocab_dists: The vocabulary distributions. List length max_dec_steps of (batch_size, vsize) arrays. The words are in the order they appear in the vocabulary file.
       attn_dists: The attention distributions. List length max_dec_steps of (batch_size, attn_len) arrays
@@ -275,7 +334,7 @@ class CopyGenSeq2Seq(AttentionSeq2Seq):
 
     max_t = tf.shape(vocab_dists)[0]
     batch_size = vocab_dists.get_shape().as_list()[1] or tf.shape(vocab_dists)[1]
-    batch_source_max_oovs = tf.reduce_max(features["source_oov_nums"])
+    batch_source_max_oovs = tf.to_int32(tf.reduce_max(features["source_oov_nums"]))
     extended_vsize = source_vocab_total_size + batch_source_max_oovs
     # tf.assert_equal(tf.shape(vocab_dists)[0], tf.shape(attn_dists)[0])
     # tf.assert_equal(tf.shape(vocab_dists)[0], tf.shape(p_gens)[0])
@@ -361,43 +420,45 @@ class CopyGenSeq2Seq(AttentionSeq2Seq):
       predicted_tokens = target_id_to_vocab.lookup(
           tf.to_int64(predictions["predicted_ids"]))
 
-      batch_size = predicted_ids.get_shape().as_list()[0] or tf.shape(predicted_ids)[0]
-
-      with tf.variable_scope('copy_token_ids'):
-        def should_continue(now_s, max_s, *args, **kwargs):
-          return tf.less(now_s, max_s)
-
-        def body(now_s, batch_size, copy_predicted_tokens, predicted_ids, predicted_tokens, source_oov_list):
-          row_tokens = tf.reshape( predicted_tokens[now_s, :], [-1])
-          row_ids = tf.reshape( predicted_ids[now_s, :], [-1])
-          source_oovs = tf.reshape( source_oov_list[now_s, :], [-1])
-          copy_row_ids = row_ids - self._target_origin_vocab_size
-          def fn(x):
-            row_id, token = x
-            return tf.cond(tf.greater_equal(row_id, 0), lambda : source_oovs[row_id], lambda : token)
-          copy_row_tokens = tf.map_fn(fn, (copy_row_ids, row_tokens), dtype=(tf.string))
-          # copy_indices = tf.cast( tf.where(tf.greater_equal(copy_row_ids, 0)), tf.int32 )
-          # copy_ids = tf.reshape( tf.gather(copy_row_ids,  copy_indices), [-1])
-          # copy_tokens = tf.reshape( tf.gather(source_oovs, copy_ids), [-1])
-          # copy_tokens_placement = tf.scatter_nd(copy_indices, copy_tokens, tf.shape(row_tokens))
-          # new_row_tokens = tf.where(tf.greater_equal(copy_row_ids, 0), copy_tokens_placement, row_tokens)
-          copy_predicted_tokens = copy_predicted_tokens.write(now_s, copy_row_tokens)
-          return now_s + 1, batch_size, copy_predicted_tokens, predicted_ids, predicted_tokens, source_oov_list
-
-        now_s = tf.constant(0)
-        copy_predicted_tokens = tf.TensorArray(tf.string, size=batch_size, dynamic_size=True)
-        _, _, copy_predicted_tokens, _, _, _ = tf.while_loop(
-          should_continue,
-          body,
-          loop_vars=[now_s, batch_size, copy_predicted_tokens, predicted_ids, predicted_tokens, source_oov_list]
-        )
-        copy_predicted_tokens = copy_predicted_tokens.stack()
-
       # Raw predicted tokens
-      predictions["predicted_tokens"] = copy_predicted_tokens
+      predictions["predicted_tokens"] = self._restore_copy_tokens(
+          predicted_ids, predicted_tokens, source_oov_list)
 
     return predictions
 
+  def _restore_copy_tokens(self, predicted_ids, predicted_tokens, source_oov_list):
+    """Replaces the tokens of copied ids by the source oov words.
+
+    Ids from `vocab_size` on point into the oov list of their own example,
+    so the oov lists are flattened and every copy id is offset by the start
+    of its example's row. The whole batch is restored with a single gather.
+
+    Args:
+      predicted_ids: int tensor of shape `[B, T]` or `[B, T, beam_width]`.
+      predicted_tokens: The in-vocabulary tokens of `predicted_ids`.
+      source_oov_list: string tensor of shape `[B, N]`, padded with "".
+
+    Returns:
+      A string tensor with the shape of `predicted_tokens`.
+    """
+    with tf.variable_scope('copy_token_ids'):
+      predicted_ids = tf.to_int32(predicted_ids)
+      copy_ids = predicted_ids - self._target_origin_vocab_size
+      num_oovs = tf.shape(source_oov_list)[1]
+      batch_size = tf.shape(source_oov_list)[0]
+
+      # The extra trailing entry keeps the gather valid when no example
+      # of the batch has oov words; it is never selected for real copies.
+      flat_oovs = tf.concat(
+          [tf.reshape(source_oov_list, [-1]), ["UNK"]], 0)
+      offsets = tf.range(batch_size) * num_oovs
+      offsets = tf.reshape(
+          offsets, [-1] + [1] * (predicted_ids.get_shape().ndims - 1))
+      oov_ids = tf.clip_by_value(copy_ids, 0, tf.maximum(num_oovs - 1, 0))
+      copy_tokens = tf.gather(flat_oovs, oov_ids + offsets)
+
+      return tf.where(tf.greater_equal(copy_ids, 0), copy_tokens, predicted_tokens)
+
   def compute_loss(self, decoder_output, _features, labels):
     """Computes the loss for this model.
 
@@ -406,11 +467,12 @@ class CopyGenSeq2Seq(AttentionSeq2Seq):
     """
     #pylint: disable=R0201
     # Calculate loss per example-timestep of shape [B, T]
+    if self.params["loss.mode"] == "gather":
+      return self._compute_gather_loss(decoder_output, _features, labels)
+    if self.params["loss.mode"] != "dense":
+      raise ValueError("Unknown loss.mode: {}".format(self.params["loss.mode"]))
 
-
-    final_dists, attn_projected_dists = self._calc_final_dist(decoder_output, _features)
-    final_dists = final_dists.stack() # T * B * D
-    attn_projected_dists = attn_projected_dists.stack()
+    final_dists, attn_projected_dists = self._calc_final_dist(decoder_output, _features) # T * B * D
 
     targets = tf.transpose(labels["extend_target_ids"][:, 1:], [1, 0]) # T * B
 
@@ -444,6 +506,36 @@ class CopyGenSeq2Seq(AttentionSeq2Seq):
 
     return losses, loss
 
+  def _compute_gather_loss(self, decoder_output, _features, labels):
+    """Computes the pointer-generator loss from the probabilities of the
+    target ids only, without building the [T, B, vocab + max_oov] final
+    distribution. See `seq2seq.losses.copy_gen_sequence_loss`.
+    """
+    targets = tf.transpose(labels["extend_target_ids"][:, 1:], [1, 0]) # T * B
+
+    debug_info = {}
+    debug_info["source_tokens"] = _features["source_tokens"]
+    debug_info["source_len"] = _features["source_len"]
+    debug_info["target_tokens"] = labels["target_tokens"]
+    debug_info["vocab_dists"] = decoder_output.logits
+    debug_info["attn_dists"] = decoder_output.attention_scores
+    debug_info["p_gens"] = decoder_output.pgens
+    graph_utils.add_dict_to_collection(debug_info, "debug_info")
+
+    losses = seq2seq_losses.copy_gen_sequence_loss(
+        logits=decoder_output.logits,
+        attention_scores=decoder_output.attention_scores,
+        p_gens=decoder_output.pgens,
+        extend_source_ids=_features["extend_source_ids"],
+        targets=targets,
+        sequence_length=labels["target_len"] - 1) #T * B
+
+    # Calculate the average log perplexity
+    loss = tf.reduce_sum(losses) / tf.to_float(
+        tf.reduce_sum(labels["target_len"] - 1))
+
+    return losses, loss
+
   def _build(self, features, labels, params):
     # Pre-process features and labels
     features, labels = self._preprocess(features, labels)
@@ -70,7 +70,10 @@ class NewAttentionSeq2Seq(BasicSeq2Seq):
     reverse_scores_lengths = None
     if self.params["source.reverse"]:
       reverse_scores_lengths = features["source_len"]
-      if self.use_beam_search:
+      if self.use_batched_beam_search:
+        reverse_scores_lengths = self._maybe_tile_for_beam_search(
+            reverse_scores_lengths)
+      elif self.use_beam_search:
         reverse_scores_lengths = tf.tile(
             input=reverse_scores_lengths,
             multiples=[self.params["inference.beam_search.beam_width"]])
@@ -98,8 +101,7 @@ class NewAttentionSeq2Seq(BasicSeq2Seq):
   def _decode_infer(self, decoder, bridge, _encoder_output, features, labels):
     """Runs decoding in inference mode"""
     batch_size = self.batch_size(features, labels)
-    if self.use_beam_search:
-      batch_size = self.params["inference.beam_search.beam_width"]
+    batch_size = self._beam_decode_batch_size(batch_size)
     target_start_id = self.target_vocab_info.special_vocab.SEQUENCE_START
     helper_infer = tf_decode_helper.GreedyEmbeddingHelper(
         embedding=self.target_embedding,
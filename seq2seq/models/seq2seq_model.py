@@ -28,6 +28,7 @@ from seq2seq.contrib.seq2seq.decoder import _transpose_batch_time
 from seq2seq.data import vocab
 from seq2seq.graph_utils import templatemethod
 from seq2seq.decoders.beam_search_decoder import BeamSearchDecoder
+from seq2seq.decoders.beam_search_decoder import BatchBeamSearchDecoder
 from seq2seq.inference import beam_search
 from seq2seq.models.model_base import ModelBase, _flatten_dict
 
@@ -72,6 +73,7 @@ class Seq2SeqModel(ModelBase):
         "inference.beam_search.beam_width": 0,
         "inference.beam_search.length_penalty_weight": 0.0,
         "inference.beam_search.choose_successors_fn": "choose_top_k",
+        "inference.beam_search.batched": False,
         "optimizer.clip_embed_gradients": 0.1,
         "vocab_source": "",
         "vocab_target": "",
@@ -227,6 +229,8 @@ class Seq2SeqModel(ModelBase):
         choose_successors_fn=getattr(
             beam_search,
             self.params["inference.beam_search.choose_successors_fn"]))
+    if self.use_batched_beam_search:
+      return BatchBeamSearchDecoder(decoder=decoder, config=config)
     return BeamSearchDecoder(decoder=decoder, config=config)
 
   @property
@@ -235,6 +239,32 @@ class Seq2SeqModel(ModelBase):
     """
     return self.params["inference.beam_search.beam_width"] > 1
 
+  @property
+  def use_batched_beam_search(self):
+    """Returns true iff the model performs beam search over a whole batch
+    instead of a single example.
+    """
+    return self.use_beam_search and \
+      self.params.get("inference.beam_search.batched", False)
+
+  def _beam_decode_batch_size(self, batch_size):
+    """Returns the number of rows the decoder runs on during inference,
+    given the number of examples in the batch."""
+    beam_width = self.params["inference.beam_search.beam_width"]
+    if self.use_batched_beam_search:
+      return batch_size * beam_width
+    if self.use_beam_search:
+      return beam_width
+    return batch_size
+
+  def _maybe_tile_for_beam_search(self, tensor):
+    """Repeats every example of `tensor` `beam_width` times for batched beam
+    search. Plain beam search (batch size 1) relies on broadcasting instead."""
+    if not self.use_batched_beam_search:
+      return tensor
+    return tf.contrib.seq2seq.tile_batch(
+        tensor, multiplier=self.params["inference.beam_search.beam_width"])
+
   def _preprocess(self, features, labels):
     """Model-specific preprocessing for features and labels:
 
@@ -246,9 +276,14 @@ class Seq2SeqModel(ModelBase):
     source_vocab_to_id, source_id_to_vocab, source_word_to_count, _ = \
       vocab.create_vocabulary_lookup_table(self.source_vocab_info.path)
 
-    # Create vocabulary look for target
-    target_vocab_to_id, target_id_to_vocab, target_word_to_count, _ = \
-      vocab.create_vocabulary_lookup_table(self.target_vocab_info.path)
+    # Create vocabulary look for target, sharing the source tables if the
+    # vocabularies are the same
+    if self.target_vocab_info.path == self.source_vocab_info.path:
+      target_vocab_to_id, target_id_to_vocab, target_word_to_count = \
+        source_vocab_to_id, source_id_to_vocab, source_word_to_count
+    else:
+      target_vocab_to_id, target_id_to_vocab, target_word_to_count, _ = \
+        vocab.create_vocabulary_lookup_table(self.target_vocab_info.path)
 
     # Add vocab tables to graph colection so that we can access them in
     # other places.
@@ -263,13 +298,17 @@ class Seq2SeqModel(ModelBase):
 
     # Slice source to max_len
     if self.params["source.max_seq_len"] is not None:
-      features["source_tokens"] = features["source_tokens"][:, :self.params[
-          "source.max_seq_len"]]
+      for key in ["source_tokens", "source_ids"]:
+        if key in features:
+          features[key] = features[key][:, :self.params["source.max_seq_len"]]
       features["source_len"] = tf.minimum(features["source_len"],
                                           self.params["source.max_seq_len"])
 
-    # Look up the source ids in the vocabulary
-    features["source_ids"] = source_vocab_to_id.lookup(features["source_tokens"])
+    # Look up the source ids in the vocabulary, unless the input pipeline
+    # already provides them
+    if "source_ids" not in features:
+      features["source_ids"] = source_vocab_to_id.lookup(
+          features["source_tokens"])
 
     # Maybe reverse the source
     if self.params["source.reverse"] is True:
@@ -290,13 +329,16 @@ class Seq2SeqModel(ModelBase):
 
     # Slices targets to max length
     if self.params["target.max_seq_len"] is not None:
-      labels["target_tokens"] = labels["target_tokens"][:, :self.params[
-          "target.max_seq_len"]]
+      for key in ["target_tokens", "target_ids"]:
+        if key in labels:
+          labels[key] = labels[key][:, :self.params["target.max_seq_len"]]
       labels["target_len"] = tf.minimum(labels["target_len"],
                                         self.params["target.max_seq_len"])
 
-    # Look up the target ids in the vocabulary
-    labels["target_ids"] = target_vocab_to_id.lookup(labels["target_tokens"])
+    # Look up the target ids in the vocabulary, unless the input pipeline
+    # already provides them
+    if "target_ids" not in labels:
+      labels["target_ids"] = target_vocab_to_id.lookup(labels["target_tokens"])
 
     labels["target_len"] = tf.to_int32(labels["target_len"])
     tf.summary.histogram("target_len", tf.to_float(labels["target_len"]))
@@ -308,8 +350,9 @@ class Seq2SeqModel(ModelBase):
     total_tokens = tf.assign_add(token_counter_var, num_tokens)
     tf.summary.scalar("num_tokens", total_tokens)
 
+    source_key = "source_tokens" if "source_tokens" in features else "source_ids"
     with tf.control_dependencies([total_tokens]):
-      features["source_tokens"] = tf.identity(features["source_tokens"])
+      features[source_key] = tf.identity(features[source_key])
 
     # Add to graph collection for later use
     graph_utils.add_dict_to_collection(features, "features")
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the pos/ner annotation cache.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+
+import tensorflow as tf
+
+from seq2seq.features.annotation_cache import AnnotationCache, annotation_key, model_signature
+
+
+class AnnotationCacheTest(tf.test.TestCase):
+  """Tests the LRU and the sqlite store."""
+
+  def setUp(self):
+    super(AnnotationCacheTest, self).setUp()
+    self.tmp_dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmp_dir, "annotations.db")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+    super(AnnotationCacheTest, self).tearDown()
+
+  def test_key(self):
+    words = ["我", "爱", "北京"]
+    self.assertEqual(annotation_key("pos", words), annotation_key("pos", list(words)))
+    self.assertEqual(annotation_key("pos", words),
+                     annotation_key("pos", [_.encode("utf-8") for _ in words]))
+    self.assertNotEqual(annotation_key("pos", words), annotation_key("ner", words))
+    self.assertNotEqual(annotation_key("pos", ["a b"]), annotation_key("pos", ["a", "b"]))
+    self.assertNotEqual(annotation_key("ner", words, ["r", "v", "ns"]),
+                        annotation_key("ner", words, ["r", "v", "n"]))
+
+  def test_get_or_compute(self):
+    cache = AnnotationCache()
+    calls = []
+    def compute():
+      calls.append(1)
+      return ["r", "v"]
+    first = cache.get_or_compute("k", compute)
+    first.append("SEQUENCE_END")
+    second = cache.get_or_compute("k", compute)
+    self.assertEqual(second, ["r", "v"])
+    self.assertEqual(len(calls), 1)
+    self.assertEqual(cache.stats()["misses"], 1)
+    self.assertEqual(cache.stats()["memory_hits"], 1)
+
+  def test_lru_eviction(self):
+    cache = AnnotationCache(max_memory_items=2)
+    cache.put("a", ["1"])
+    cache.put("b", ["2"])
+    cache.get("a")
+    cache.put("c", ["3"])
+    self.assertEqual(cache.get("a"), ["1"])
+    self.assertIsNone(cache.get("b"))
+    self.assertEqual(cache.get("c"), ["3"])
+
+  def test_persistent(self):
+    cache = AnnotationCache(self.path, commit_every=100)
+    cache.put("a", ["ns", "n"])
+    cache.flush()
+    reopened = AnnotationCache(self.path)
+    self.assertEqual(reopened.get("a"), ["ns", "n"])
+    self.assertEqual(reopened.get("a"), ["ns", "n"])
+    self.assertIsNone(reopened.get("b"))
+    self.assertEqual(reopened.stats()["disk_hits"], 1)
+    self.assertEqual(reopened.stats()["memory_hits"], 1)
+    self.assertEqual(reopened.stats()["misses"], 1)
+
+  def test_buffered_puts_do_not_lock(self):
+    first = AnnotationCache(self.path, commit_every=100)
+    first.put("a", ["n"])
+    self.assertEqual(first.get("a"), ["n"])
+    # A second worker writes while the first one has unwritten puts
+    second = AnnotationCache(self.path, commit_every=1)
+    second.put("b", ["v"])
+    first.flush()
+    reopened = AnnotationCache(self.path)
+    self.assertEqual(reopened.get("a"), ["n"])
+    self.assertEqual(reopened.get("b"), ["v"])
+
+  def test_model_signature(self):
+    model_path = os.path.join(self.tmp_dir, "pos.model")
+    with open(model_path, "w") as file:
+      file.write("model")
+    self.assertEqual(model_signature(model_path)[0], model_path)
+    self.assertEqual(len(model_signature(model_path)), 3)
+    missing = os.path.join(self.tmp_dir, "missing.model")
+    self.assertEqual(model_signature(missing), [missing])
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -79,6 +79,30 @@ class AttentionLayerTest(tf.test.TestCase):
     scores_sum = np.sum(scores_, axis=1)
     np.testing.assert_array_almost_equal(scores_sum, np.ones([self.batch_size]))
 
+  def _test_prepared_memory(self):
+    """Tests that keys prepared once give the same results as raw keys"""
+    inputs = tf.constant(
+        np.random.randn(self.batch_size, self.seq_len, self.input_dim),
+        dtype=tf.float32)
+    inputs_length = tf.constant(np.arange(self.batch_size) + 1)
+    state = tf.constant(
+        np.random.randn(self.batch_size, self.state_dim), dtype=tf.float32)
+    attention_fn = self._create_layer()
+    memory = attention_fn.prepare_memory(
+        keys=inputs, values_length=inputs_length)
+    scores, context = attention_fn(
+        query=state, keys=memory, values=inputs, values_length=inputs_length)
+    raw_scores, raw_context = attention_fn(
+        query=state, keys=inputs, values=inputs, values_length=inputs_length)
+
+    with self.test_session() as sess:
+      sess.run(tf.global_variables_initializer())
+      scores_, context_, raw_scores_, raw_context_ = sess.run(
+          [scores, context, raw_scores, raw_context])
+
+    np.testing.assert_array_almost_equal(scores_, raw_scores_)
+    np.testing.assert_array_almost_equal(context_, raw_context_)
+
 
 class AttentionLayerDotTest(AttentionLayerTest):
   """Tests the AttentionLayerDot class"""
@@ -91,6 +115,9 @@ class AttentionLayerDotTest(AttentionLayerTest):
   def test_layer(self):
     self._test_layer()
 
+  def test_prepared_memory(self):
+    self._test_prepared_memory()
+
 
 class AttentionLayerBahdanauTest(AttentionLayerTest):
   """Tests the AttentionLayerBahdanau class"""
@@ -103,6 +130,9 @@ class AttentionLayerBahdanauTest(AttentionLayerTest):
   def test_layer(self):
     self._test_layer()
 
+  def test_prepared_memory(self):
+    self._test_prepared_memory()
+
 
 if __name__ == "__main__":
   tf.test.main()
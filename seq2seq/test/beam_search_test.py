@@ -41,6 +41,24 @@ class TestGatherTree(tf.test.TestCase):
 
     np.testing.assert_array_equal(expected_result, res_)
 
+  def test_gather_tree_batch(self):
+    predicted_ids = np.array([[1, 2, 3], [4, 5, 6], [7, 8, 9]])
+    parent_ids = np.array([[0, 0, 0], [0, 1, 1], [2, 1, 2]])
+    expected_result = np.array([[2, 2, 2], [6, 5, 6], [7, 8, 9]])
+
+    # The second batch entry is the first one with reversed beams
+    batch_predicted_ids = np.stack([predicted_ids, predicted_ids[:, ::-1]], 1)
+    batch_parent_ids = np.stack([parent_ids, 2 - parent_ids[:, ::-1]], 1)
+
+    res = beam_search.gather_tree(
+        tf.convert_to_tensor(batch_predicted_ids),
+        tf.convert_to_tensor(batch_parent_ids))
+    with self.test_session() as sess:
+      res_ = sess.run(res)
+
+    np.testing.assert_array_equal(expected_result, res_[:, 0])
+    np.testing.assert_array_equal(expected_result[:, ::-1], res_[:, 1])
+
 
 class TestLengthNorm(tf.test.TestCase):
   """Tests the length normalization score"""
@@ -177,6 +195,86 @@ class TestBeamStep(tf.test.TestCase):
     np.testing.assert_array_equal(next_state_.log_probs, expected_log_probs)
 
 
+class TestBatchBeamStep(tf.test.TestCase):
+  """Tests a single step of batched beam search. Every batch entry must
+  behave exactly like a separate call to `beam_search_step`.
+  """
+
+  def setUp(self):
+    super(TestBatchBeamStep, self).setUp()
+    config = beam_search.BeamSearchConfig(
+        beam_width=3,
+        vocab_size=5,
+        eos_token=0,
+        length_penalty_weight=0.6,
+        choose_successors_fn=beam_search.choose_top_k)
+    self.config = config
+
+  def test_step_matches_single(self):
+    batch_size = 2
+    log_probs_ = np.random.randn(batch_size, self.config.beam_width)
+    lengths_ = np.array([[2, 1, 2], [2, 2, 2]], dtype=np.int32)
+    finished_ = np.array([[False, True, False], [False, False, False]])
+    logits_ = np.random.randn(batch_size, self.config.beam_width,
+                              self.config.vocab_size)
+
+    batch_state = beam_search.BeamSearchState(
+        log_probs=tf.constant(log_probs_, dtype=tf.float32),
+        lengths=tf.constant(lengths_),
+        finished=tf.constant(finished_))
+    batch_outputs, batch_next_state = beam_search.batch_beam_search_step(
+        time_=2,
+        logits=tf.constant(logits_, dtype=tf.float32),
+        beam_state=batch_state,
+        config=self.config)
+
+    single_results = []
+    for i in range(batch_size):
+      state = beam_search.BeamSearchState(
+          log_probs=tf.constant(log_probs_[i], dtype=tf.float32),
+          lengths=tf.constant(lengths_[i]),
+          finished=tf.constant(finished_[i]))
+      single_results.append(beam_search.beam_search_step(
+          time_=2,
+          logits=tf.constant(logits_[i], dtype=tf.float32),
+          beam_state=state,
+          config=self.config))
+
+    with self.test_session() as sess:
+      batch_outputs_, batch_next_state_, single_results_ = sess.run(
+          [batch_outputs, batch_next_state, single_results])
+
+    for i, (outputs_, next_state_) in enumerate(single_results_):
+      np.testing.assert_array_equal(batch_outputs_.predicted_ids[i],
+                                    outputs_.predicted_ids)
+      np.testing.assert_array_equal(batch_outputs_.beam_parent_ids[i],
+                                    outputs_.beam_parent_ids)
+      np.testing.assert_array_equal(batch_next_state_.lengths[i],
+                                    next_state_.lengths)
+      np.testing.assert_array_equal(batch_next_state_.finished[i],
+                                    next_state_.finished)
+      np.testing.assert_array_almost_equal(batch_next_state_.log_probs[i],
+                                           next_state_.log_probs)
+
+  def test_first_step_uses_first_beam(self):
+    batch_size = 2
+    beam_state = beam_search.create_initial_batch_beam_state(
+        self.config, batch_size)
+    logits = tf.random_normal(
+        [batch_size, self.config.beam_width, self.config.vocab_size])
+    outputs, _ = beam_search.batch_beam_search_step(
+        time_=0, logits=logits, beam_state=beam_state, config=self.config)
+
+    with self.test_session() as sess:
+      outputs_ = sess.run(outputs)
+
+    np.testing.assert_array_equal(outputs_.beam_parent_ids,
+                                  np.zeros([batch_size, self.config.beam_width]))
+    for i in range(batch_size):
+      self.assertEqual(len(set(outputs_.predicted_ids[i])),
+                       self.config.beam_width)
+
+
 class TestEosMasking(tf.test.TestCase):
   """Tests EOS masking used in beam search
   """
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for splitting files into byte ranges.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import os
+import shutil
+import tempfile
+
+import tensorflow as tf
+
+from seq2seq.data import byte_ranges
+
+
+class ByteRangesTest(tf.test.TestCase):
+  """Tests that the ranges of a file read all of its lines."""
+
+  def setUp(self):
+    super(ByteRangesTest, self).setUp()
+    self.tmp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+    super(ByteRangesTest, self).tearDown()
+
+  def _write(self, name, text):
+    path = os.path.join(self.tmp_dir, name)
+    with io.open(path, "w", encoding="utf-8", newline="") as file:
+      file.write(text)
+    return path
+
+  def test_ranges_cover_lines(self):
+    text = "".join("北京 w{}\n".format("x" * (_ % 5)) for _ in range(50))
+    path = self._write("text", text)
+    for range_bytes in [1, 7, 100, 1 << 20]:
+      ranges = byte_ranges.split_into_ranges([path], range_bytes)
+      self.assertEqual(
+          "".join(byte_ranges.read_range(*_) for _ in ranges), text)
+
+  def test_range_boundaries(self):
+    lines = ["ab\n", "北京\n", "\n", "last"]
+    path = self._write("lines", "".join(lines))
+    size = os.path.getsize(path)
+    # Every split, including ones inside a line, a utf-8 character or on a
+    # newline, reads every line exactly once
+    for split in range(1, size):
+      first = list(byte_ranges.iter_range_lines(path, 0, split))
+      second = list(byte_ranges.iter_range_lines(path, split, size))
+      self.assertEqual(first + second, lines)
+    # A split on a newline keeps the line in the first range, a line
+    # starting at the split belongs to the second one
+    self.assertEqual(list(byte_ranges.iter_range_lines(path, 0, 2)), ["ab\n"])
+    self.assertEqual(list(byte_ranges.iter_range_lines(path, 0, 3)), ["ab\n"])
+    self.assertEqual(list(byte_ranges.iter_range_lines(path, 3, 4)),
+                     ["北京\n"])
+
+  def test_split_into_ranges(self):
+    first = self._write("b", "a\nbc\n")
+    second = self._write("a", "")
+    self.assertEqual(byte_ranges.split_into_ranges([first, second], 2),
+                     [(first, 0, 2), (first, 2, 4), (first, 4, 5)])
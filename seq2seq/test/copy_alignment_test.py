@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the copy alignment features.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import random
+
+import tensorflow as tf
+
+from seq2seq.features.copy_alignment import CopyAligner, first_positions
+
+UNK = 1
+OOV_START = 100
+
+
+def _reference(source_tokens, source_ids, target_tokens, target_ids, unique):
+  """The per-token scans used before the alignment dict."""
+  oov_list, extend_source_ids = [], []
+  for token, source_id in zip(source_tokens, source_ids):
+    if source_id != UNK:
+      extend_source_ids.append(source_id)
+    elif unique and token in oov_list:
+      extend_source_ids.append(oov_list.index(token) + OOV_START)
+    else:
+      extend_source_ids.append(len(oov_list) + OOV_START)
+      oov_list.append(token)
+  extend_target_ids, aliment = [], []
+  for token, target_id in zip(target_tokens, target_ids):
+    position = source_tokens.index(token) if token in source_tokens else -1
+    aliment.append(position)
+    if target_id == UNK and position >= 0:
+      extend_target_ids.append(extend_source_ids[position])
+    else:
+      extend_target_ids.append(target_id)
+  return extend_source_ids, oov_list, extend_target_ids, aliment
+
+
+class CopyAlignerTest(tf.test.TestCase):
+  """Tests CopyAligner."""
+
+  def test_align(self):
+    source_tokens = ["我", "爱", "北京", "天安门", "北京"]
+    source_ids = [10, UNK, UNK, 11, UNK]
+    target_tokens = ["北京", "爱", "上海", "我"]
+    target_ids = [UNK, UNK, UNK, 10]
+
+    alignment = CopyAligner(OOV_START, UNK).align(
+        source_tokens, source_ids, target_tokens, target_ids)
+    self.assertEqual(alignment.extend_source_ids, [10, 100, 101, 11, 102])
+    self.assertEqual(alignment.source_oov_list, ["爱", "北京", "北京"])
+    self.assertEqual(alignment.extend_target_ids, [101, 100, UNK, 10])
+    self.assertEqual(alignment.aliment, [2, 1, -1, 0])
+
+    alignment = CopyAligner(OOV_START, UNK, unique=True).align(
+        source_tokens, source_ids, target_tokens, target_ids)
+    self.assertEqual(alignment.extend_source_ids, [10, 100, 101, 11, 101])
+    self.assertEqual(alignment.source_oov_list, ["爱", "北京"])
+
+  def test_source_only(self):
+    alignment = CopyAligner(OOV_START, UNK).align(["a", "b"], [UNK, 5])
+    self.assertEqual(alignment.extend_source_ids, [100, 5])
+    self.assertIsNone(alignment.extend_target_ids)
+    self.assertIsNone(alignment.aliment)
+
+  def test_first_positions(self):
+    self.assertEqual(first_positions(["a", "b", "a"]), {"a": 0, "b": 1})
+
+  def test_batch_matches_reference(self):
+    rng = random.Random(3)
+    words = ["w{}".format(_) for _ in range(20)]
+    for unique in [False, True]:
+      examples = []
+      for _ in range(50):
+        source_tokens = [rng.choice(words) for _ in range(rng.randint(1, 30))]
+        target_tokens = [rng.choice(words) for _ in range(rng.randint(1, 30))]
+        ids = {w: (UNK if rng.random() < 0.4 else 10 + i) for i, w in enumerate(words)}
+        examples.append((source_tokens, [ids[_] for _ in source_tokens],
+                         target_tokens, [ids[_] for _ in target_tokens]))
+      alignments = CopyAligner(OOV_START, UNK, unique=unique).align_batch(
+          *[list(_) for _ in zip(*examples)])
+      for example, alignment in zip(examples, alignments):
+        self.assertEqual(tuple(alignment), _reference(*(example + (unique,))))
+
+
+if __name__ == "__main__":
+  tf.test.main()
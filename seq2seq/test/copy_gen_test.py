@@ -17,6 +17,7 @@ from seq2seq.training import utils as training_utils
 from seq2seq.test import utils as test_utils
 from seq2seq.models import BasicSeq2Seq, AttentionSeq2Seq, CopyGenSeq2Seq
 from seq2seq.data.vocab import Vocab
+from seq2seq.decoders.copy_gen_decoder import CopyGenDecoderOutput
 
 def t(file_path, default_value=None):
   x = create_vocabulary_lookup_table(file_path)
@@ -149,6 +150,153 @@ def test_copy_gen_model(record_path, vocab_path=None):
 
   return model, fetches_
 
+class CopyGenFinalDistTest(tf.test.TestCase):
+  """Tests the final distribution of the pointer-generator model.
+  """
+
+  def setUp(self):
+    super(CopyGenFinalDistTest, self).setUp()
+    tf.logging.set_verbosity(tf.logging.INFO)
+    self.max_t = 5
+    self.batch_size = 3
+    self.attn_len = 7
+    self.vocab_list = [str(_) for _ in range(10)]
+    self.vocab_file = test_utils.create_temporary_vocab_file(self.vocab_list)
+
+  def tearDown(self):
+    self.vocab_file.close()
+
+  def _create_model(self):
+    params_ = CopyGenSeq2Seq.default_params().copy()
+    params_.update(TEST_PARAMS)
+    params_.update({
+        "vocab_source": self.vocab_file.name,
+        "vocab_target": self.vocab_file.name,
+    })
+    return CopyGenSeq2Seq(params=params_, mode=tf.contrib.learn.ModeKeys.TRAIN)
+
+  def _create_inputs(self, vocab_size):
+    source_oov_nums = np.array([0, 2, 1], dtype=np.int64)
+    extend_source_ids = np.random.randint(
+        0, vocab_size, [self.batch_size, self.attn_len])
+    # Repeated and copied (out of vocabulary) source words
+    extend_source_ids[0, 1] = extend_source_ids[0, 3]
+    extend_source_ids[1, 2] = vocab_size + 1
+    extend_source_ids[1, 4] = vocab_size
+    extend_source_ids[1, 5] = vocab_size
+    extend_source_ids[2, 0] = vocab_size
+
+    attention_scores = np.random.rand(self.max_t, self.batch_size,
+                                      self.attn_len)
+    attention_scores /= np.sum(attention_scores, axis=2, keepdims=True)
+    decoder_output = CopyGenDecoderOutput(
+        logits=tf.constant(
+            np.random.rand(self.max_t, self.batch_size, vocab_size),
+            dtype=tf.float32),
+        predicted_ids=None,
+        cell_output=None,
+        attention_scores=tf.constant(attention_scores, dtype=tf.float32),
+        attention_context=None,
+        pgens=tf.constant(
+            np.random.rand(self.max_t, self.batch_size, 1), dtype=tf.float32))
+    features = {
+        "source_ids": tf.constant(
+            np.minimum(extend_source_ids, 3), dtype=tf.int64),
+        "extend_source_ids": tf.constant(extend_source_ids, dtype=tf.int64),
+        "source_oov_nums": tf.constant(source_oov_nums),
+        "source_len": tf.constant([self.attn_len] * self.batch_size),
+    }
+    return decoder_output, features
+
+  def test_final_dist_parity(self):
+    model = self._create_model()
+    vocab_size = model.source_vocab_info.total_size
+    decoder_output, features = self._create_inputs(vocab_size)
+
+    final_dists, attn_projected_dists = model._calc_final_dist(
+        decoder_output, features, while_loop=False)
+    loop_final_dists, loop_attn_projected_dists = model._calc_final_dist(
+        decoder_output, features, while_loop=True)
+
+    with self.test_session() as sess:
+      final_dists_, attn_projected_dists_, loop_final_dists_, \
+        loop_attn_projected_dists_ = sess.run(
+            [final_dists, attn_projected_dists, loop_final_dists,
+             loop_attn_projected_dists])
+
+    np.testing.assert_array_equal(
+        final_dists_.shape, [self.max_t, self.batch_size, vocab_size + 2])
+    np.testing.assert_array_almost_equal(final_dists_, loop_final_dists_)
+    np.testing.assert_array_almost_equal(attn_projected_dists_,
+                                         loop_attn_projected_dists_)
+
+
+class CopyGenRestoreTokensTest(tf.test.TestCase):
+  """Tests mapping copied ids back to the source oov words.
+  """
+
+  def setUp(self):
+    super(CopyGenRestoreTokensTest, self).setUp()
+    self.vocab_size = 10
+    self.vocab_file = test_utils.create_temporary_vocab_file(
+        [str(_) for _ in range(self.vocab_size)])
+    self.source_oov_list = np.array(
+        [["", ""], ["a", "b"], ["c", ""]], dtype=object)
+
+  def tearDown(self):
+    self.vocab_file.close()
+
+  def _create_model(self):
+    params_ = CopyGenSeq2Seq.default_params().copy()
+    params_.update(TEST_PARAMS)
+    params_.update({
+        "vocab_source": self.vocab_file.name,
+        "vocab_target": self.vocab_file.name,
+    })
+    model = CopyGenSeq2Seq(
+        params=params_, mode=tf.contrib.learn.ModeKeys.INFER)
+    model._target_origin_vocab_size = self.vocab_size
+    return model
+
+  def _restore_reference(self, predicted_ids):
+    tokens = np.empty(predicted_ids.shape, dtype=object)
+    for index, id_ in np.ndenumerate(predicted_ids):
+      if id_ >= self.vocab_size:
+        tokens[index] = self.source_oov_list[index[0], id_ - self.vocab_size]
+      else:
+        tokens[index] = str(id_)
+    return tokens
+
+  def _test_restore(self, predicted_ids):
+    model = self._create_model()
+    predicted_tokens = tf.as_string(predicted_ids)
+    restored = model._restore_copy_tokens(
+        tf.constant(predicted_ids), predicted_tokens,
+        tf.constant(self.source_oov_list, dtype=tf.string))
+    with self.test_session() as sess:
+      restored_ = sess.run(restored)
+    expected = self._restore_reference(predicted_ids)
+    self.assertEqual(restored_.shape, predicted_ids.shape)
+    self.assertEqual([_.decode("utf-8") for _ in restored_.flat],
+                     list(expected.flat))
+
+  def test_restore_greedy(self):
+    predicted_ids = np.array(
+        [[1, 2, 3], [10, 4, 11], [10, 5, 6]], dtype=np.int32)
+    self._test_restore(predicted_ids)
+
+  def test_restore_beam(self):
+    predicted_ids = np.array(
+        [[[1, 2], [3, 4]], [[11, 10], [4, 11]], [[5, 10], [10, 6]]],
+        dtype=np.int32)
+    self._test_restore(predicted_ids)
+
+  def test_restore_without_oovs(self):
+    self.source_oov_list = np.zeros([3, 0], dtype=object)
+    predicted_ids = np.array([[1, 2], [3, 4], [5, 6]], dtype=np.int32)
+    self._test_restore(predicted_ids)
+
+
 if __name__ == "__main__":
 
   vocab_path = "/home/bigdata/active_project/test_seq2seq_py2/yard_seq2seq/q2q_sim_95/data/vocab/shared.vocab.txt"
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the streaming corpus statistics.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from seq2seq.data import corpus_stats
+from seq2seq.test import utils as test_utils
+
+
+class HistogramTest(tf.test.TestCase):
+  """Tests the fixed-bin histogram."""
+
+  def test_percentiles(self):
+    values = np.arange(1, 101)
+    histogram = corpus_stats.Histogram(max_value=90)
+    histogram.add(values[:50])
+    other = corpus_stats.Histogram(max_value=90)
+    other.add(values[50:])
+    histogram.merge(other)
+    self.assertEqual(histogram.num, 100)
+    self.assertAlmostEqual(histogram.mean(), 50.5)
+    self.assertEqual(histogram.percentile(50), 50)
+    self.assertEqual(histogram.percentile(90), 90)
+    self.assertEqual(histogram.percentile(99), 100)
+    self.assertEqual(histogram.to_dict()["overflow"], 10)
+    self.assertEqual(len(histogram.to_dict()["counts"]), 91)
+
+
+class HyperLogLogTest(tf.test.TestCase):
+  """Tests the unique count estimates."""
+
+  def test_estimate(self):
+    for num in [0, 10, 1000, 100000]:
+      sketch = corpus_stats.HyperLogLog()
+      sketch.add(["w{}".format(_) for _ in range(num)])
+      sketch.add(["w{}".format(_) for _ in range(num // 2)])
+      self.assertLessEqual(abs(sketch.estimate() - num), 0.03 * num)
+
+  def test_merge(self):
+    first, second = corpus_stats.HyperLogLog(), corpus_stats.HyperLogLog()
+    first.add(["w{}".format(_) for _ in range(5000)])
+    second.add(["w{}".format(_) for _ in range(2500, 10000)])
+    first.merge(second)
+    self.assertLessEqual(abs(first.estimate() - 10000), 300)
+
+
+class CorpusStatsTest(tf.test.TestCase):
+  """Tests the statistics of parallel text files."""
+
+  def setUp(self):
+    super(CorpusStatsTest, self).setUp()
+    self.tmp_dir = tempfile.mkdtemp()
+    rng = random.Random(0)
+    words = ["w{}".format(_) for _ in range(30)] + ["北京"]
+    self.examples = []
+    self.paths = []
+    for i in range(2):
+      path = os.path.join(self.tmp_dir, "data{}".format(i))
+      with io.open(path, "w", encoding="utf-8") as file:
+        for _ in range(200):
+          source = [rng.choice(words) for _ in range(rng.randint(1, 20))]
+          target = [rng.choice(words) for _ in range(rng.randint(1, 10))]
+          self.examples.append((source, target))
+          file.write("{}\t{}\n".format(" ".join(source), " ".join(target)))
+        file.write("no target\n")
+      self.paths.append(path)
+    self.vocab_file = test_utils.create_temporary_vocab_file(words[:15])
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+    super(CorpusStatsTest, self).tearDown()
+
+  def test_stats(self):
+    for num_workers in [1, 2]:
+      stats = corpus_stats.compute_corpus_stats(
+          self.paths,
+          vocab_path=self.vocab_file.name,
+          num_workers=num_workers,
+          range_bytes=256,
+          max_length=15)
+      result = json.loads(json.dumps(stats.to_dict(with_oov=True)))
+
+      source_lengths = [len(s) for s, _ in self.examples]
+      target_lengths = [len(t) for _, t in self.examples]
+      overlaps = [sum(1 for _ in s if _ in t) for s, t in self.examples]
+      in_vocab = set("w{}".format(_) for _ in range(15))
+      source_oov = sum(1 for s, _ in self.examples for w in s
+                       if w not in in_vocab)
+
+      self.assertEqual(result["num_examples"], 400)
+      self.assertEqual(result["num_skipped_lines"], 2)
+      self.assertEqual(result["source_length"]["max"], max(source_lengths))
+      self.assertAlmostEqual(result["source_length"]["mean"],
+                             np.mean(source_lengths))
+      self.assertEqual(result["source_length"]["overflow"],
+                       sum(1 for _ in source_lengths if _ > 15))
+      self.assertEqual(result["target_length"]["percentiles"]["50"],
+                       int(np.percentile(target_lengths, 50,
+                                         interpolation="lower")))
+      self.assertAlmostEqual(result["overlap"]["mean"], np.mean(overlaps))
+      self.assertAlmostEqual(result["source_oov_rate"],
+                             source_oov / sum(source_lengths))
+      self.assertEqual(result["approx_vocab_size"], 31)
+
+
+if __name__ == "__main__":
+  tf.test.main()
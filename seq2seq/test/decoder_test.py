@@ -43,11 +43,12 @@ class DecoderTests(object):
     self.vocab_size = 100
     self.max_decode_length = 20
 
-  def create_decoder(self, helper, mode):
+  def create_decoder(self, helper, mode, beam_width=1):
     """Creates the decoder module.
 
     This must be implemented by child classes and instantiate the appropriate
-    decoder to be tested.
+    decoder to be tested. For batched beam search, decoders that attend over
+    a memory must repeat every memory entry `beam_width` times.
     """
     raise NotImplementedError
 
@@ -178,6 +179,54 @@ class DecoderTests(object):
 
     return decoder_output
 
+  def test_with_batch_beam_search(self):
+    config = beam_search.BeamSearchConfig(
+        beam_width=10,
+        vocab_size=self.vocab_size,
+        eos_token=self.vocab_size - 2,
+        length_penalty_weight=0.6,
+        choose_successors_fn=beam_search.choose_top_k)
+
+    embeddings = tf.get_variable("W_embed", [self.vocab_size, self.input_depth])
+
+    helper = decode_helper.GreedyEmbeddingHelper(
+        embedding=embeddings,
+        start_tokens=[0] * (self.batch_size * config.beam_width),
+        end_token=-1)
+    decoder_fn = self.create_decoder(
+        helper=helper, mode=tf.contrib.learn.ModeKeys.INFER,
+        beam_width=config.beam_width)
+    decoder_fn = beam_search_decoder.BatchBeamSearchDecoder(
+        decoder=decoder_fn, config=config)
+
+    initial_state = decoder_fn.cell.zero_state(
+        self.batch_size, dtype=tf.float32)
+    decoder_output, _ = decoder_fn(initial_state, helper)
+
+    #pylint: disable=E1101
+    with self.test_session() as sess:
+      sess.run(tf.global_variables_initializer())
+      decoder_output_ = sess.run(decoder_output)
+
+    np.testing.assert_array_equal(
+        decoder_output_.predicted_ids.shape,
+        [self.max_decode_length, self.batch_size, config.beam_width])
+    np.testing.assert_array_equal(
+        decoder_output_.beam_search_output.beam_parent_ids.shape,
+        [self.max_decode_length, self.batch_size, config.beam_width])
+    np.testing.assert_array_equal(
+        decoder_output_.beam_search_output.scores.shape,
+        [self.max_decode_length, self.batch_size, config.beam_width])
+    np.testing.assert_array_equal(
+        decoder_output_.beam_search_output.original_outputs.predicted_ids.shape,
+        [self.max_decode_length, self.batch_size, config.beam_width])
+    np.testing.assert_array_equal(
+        decoder_output_.beam_search_output.original_outputs.logits.shape,
+        [self.max_decode_length, self.batch_size, config.beam_width,
+         self.vocab_size])
+
+    return decoder_output
+
 
 class BasicDecoderTest(tf.test.TestCase, DecoderTests):
   """Tests the `BasicDecoder` class.
@@ -188,7 +237,7 @@ class BasicDecoderTest(tf.test.TestCase, DecoderTests):
     tf.logging.set_verbosity(tf.logging.INFO)
     DecoderTests.__init__(self)
 
-  def create_decoder(self, helper, mode):
+  def create_decoder(self, helper, mode, beam_width=1):
     params = BasicDecoder.default_params()
     params["max_decode_length"] = self.max_decode_length
     decoder = BasicDecoder(params=params, mode=mode, vocab_size=self.vocab_size)
@@ -207,7 +256,7 @@ class AttentionDecoderTest(tf.test.TestCase, DecoderTests):
     self.attention_dim = 64
     self.input_seq_len = 10
 
-  def create_decoder(self, helper, mode):
+  def create_decoder(self, helper, mode, beam_width=1):
     attention_fn = AttentionLayerDot(
         params={"num_units": self.attention_dim},
         mode=tf.contrib.learn.ModeKeys.TRAIN)
@@ -217,6 +266,13 @@ class AttentionDecoderTest(tf.test.TestCase, DecoderTests):
     attention_keys = tf.convert_to_tensor(
         np.random.randn(self.batch_size, self.input_seq_len, 32),
         dtype=tf.float32)
+    attention_values_length = np.arange(self.batch_size) + 1
+    if beam_width > 1:
+      attention_keys, attention_values, attention_values_length = \
+        tf.contrib.seq2seq.tile_batch(
+            (attention_keys, attention_values,
+             tf.convert_to_tensor(attention_values_length)),
+            multiplier=beam_width)
     params = AttentionDecoder.default_params()
     params["max_decode_length"] = self.max_decode_length
     return AttentionDecoder(
@@ -225,7 +281,7 @@ class AttentionDecoderTest(tf.test.TestCase, DecoderTests):
         vocab_size=self.vocab_size,
         attention_keys=attention_keys,
         attention_values=attention_values,
-        attention_values_length=np.arange(self.batch_size) + 1,
+        attention_values_length=attention_values_length,
         attention_fn=attention_fn)
 
   def test_attention_scores(self):
@@ -250,7 +306,7 @@ class AttentionDecoderBahdanauTest(tf.test.TestCase, DecoderTests):
     self.attention_dim = 64
     self.input_seq_len = 10
 
-  def create_decoder(self, helper, mode):
+  def create_decoder(self, helper, mode, beam_width=1):
     attention_fn = AttentionLayerBahdanau(
         params={"num_units": self.attention_dim},
         mode=tf.contrib.learn.ModeKeys.TRAIN)
@@ -260,6 +316,13 @@ class AttentionDecoderBahdanauTest(tf.test.TestCase, DecoderTests):
     attention_keys = tf.convert_to_tensor(
         np.random.randn(self.batch_size, self.input_seq_len, 32),
         dtype=tf.float32)
+    attention_values_length = np.arange(self.batch_size) + 1
+    if beam_width > 1:
+      attention_keys, attention_values, attention_values_length = \
+        tf.contrib.seq2seq.tile_batch(
+            (attention_keys, attention_values,
+             tf.convert_to_tensor(attention_values_length)),
+            multiplier=beam_width)
     params = AttentionDecoder.default_params()
     params["max_decode_length"] = self.max_decode_length
     return AttentionDecoder(
@@ -268,7 +331,7 @@ class AttentionDecoderBahdanauTest(tf.test.TestCase, DecoderTests):
         vocab_size=self.vocab_size,
         attention_keys=attention_keys,
         attention_values=attention_values,
-        attention_values_length=np.arange(self.batch_size) + 1,
+        attention_values_length=attention_values_length,
         attention_fn=attention_fn)
 
   def test_attention_scores(self):
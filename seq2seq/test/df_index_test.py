@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the document frequency index.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import math
+import os
+import random
+import shutil
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from seq2seq.features.df_index import DocumentFrequencyIndex
+
+
+def _reference_tfidf(documents, tokens):
+  """tf-idf by scanning all documents."""
+  unique_words = set(_ for _ in tokens if _)
+  values = []
+  for token in tokens:
+    if not token:
+      values.append(0.)
+      continue
+    tf_value = tokens.count(token) / len(unique_words)
+    df = sum(1 for doc in documents if token in doc)
+    values.append(tf_value * math.log(len(documents) / (1. + df)))
+  return values
+
+
+class DocumentFrequencyIndexTest(tf.test.TestCase):
+  """Tests building, saving and querying the index."""
+
+  def setUp(self):
+    super(DocumentFrequencyIndexTest, self).setUp()
+    self.tmp_dir = tempfile.mkdtemp()
+    rng = random.Random(0)
+    words = ["w{}".format(_) for _ in range(40)] + ["北京"]
+    self.documents = []
+    with io.open(os.path.join(self.tmp_dir, "corpus"), "w",
+                 encoding="utf-8") as file:
+      for _ in range(300):
+        tokens = [rng.choice(words) for _ in range(rng.randint(1, 10))]
+        self.documents.append(set(tokens))
+        file.write(" ".join(tokens) + "\n\n")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+    super(DocumentFrequencyIndexTest, self).tearDown()
+
+  def test_build_save_load(self):
+    index = DocumentFrequencyIndex.build(os.path.join(self.tmp_dir, "corpus"))
+    prefix = os.path.join(self.tmp_dir, "index")
+    self.assertFalse(DocumentFrequencyIndex.exists(prefix))
+    index.save(prefix)
+    self.assertTrue(DocumentFrequencyIndex.exists(prefix))
+    loaded = DocumentFrequencyIndex.load(prefix)
+
+    self.assertEqual(loaded.num_docs, 300)
+    for word in ["w0", "w39", "北京", "xxx"]:
+      expected = sum(1 for doc in self.documents if word in doc)
+      self.assertEqual(index.df(word), expected)
+      self.assertEqual(loaded.df(word), expected)
+    np.testing.assert_array_equal(
+        loaded.doc_counts(["北京", "xxx"]), [index.df("北京"), 0])
+
+  def test_tfidf_batch(self):
+    index = DocumentFrequencyIndex.build(os.path.join(self.tmp_dir, "corpus"))
+    sentences = [["w1", "北京", "w1", "new"], [], ["w2", " ", "w1"]]
+    values = index.tfidf_batch(sentences)
+    self.assertEqual([len(_) for _ in values], [4, 0, 3])
+    for tokens, sentence_values in zip(sentences, values):
+      tokens = [_.strip() for _ in tokens]
+      np.testing.assert_allclose(sentence_values,
+                                 _reference_tfidf(self.documents, tokens))
+    self.assertEqual(index.tfidf_batch([]), [])
+
+
+if __name__ == "__main__":
+  tf.test.main()
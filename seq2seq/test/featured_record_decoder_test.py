@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for FeaturedTFExampleDecoder.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from seq2seq.data import input_pipeline
+from seq2seq.data.featuredRecordDecoder import FeaturedTFExampleDecoder
+from seq2seq.features import global_vars
+
+SOURCE_TOKENS = ["北京", "a b", "SEQUENCE_END"]
+TARGET_TOKENS = ["SEQUENCE_START", "x", "SEQUENCE_END"]
+
+
+def _make_example(format_version, source_tokens=SOURCE_TOKENS):
+  """An example with all featured keys, the source has a token containing
+  the delimiter."""
+  string_features = {
+      "source_tokens": source_tokens,
+      "source_oov_list": ["a b"],
+      "source_ners": ["O", "O", "SEQUENCE_END"],
+      "source_postags": ["ns", "n", "SEQUENCE_END"],
+      "target_tokens": TARGET_TOKENS,
+      "target_ners": ["SEQUENCE_START", "O", "SEQUENCE_END"],
+  }
+  example = tf.train.Example()
+  for key, tokens in string_features.items():
+    if format_version == global_vars.LEGACY_FORMAT_VERSION:
+      values = [" ".join(tokens).encode("utf-8")]
+    else:
+      values = [_.encode("utf-8") for _ in tokens]
+    example.features.feature[key].bytes_list.value.extend(values)
+  for key in ["source_ids", "extend_source_ids", "source_ner_ids",
+              "source_pos_ids", "target_ids", "extend_target_ids",
+              "target_ner_ids"]:
+    example.features.feature[key].int64_list.value.extend(
+        range(4, 4 + len(source_tokens)))
+  example.features.feature["source_oov_nums"].int64_list.value.append(1)
+  example.features.feature["source_tfidfs"].float_list.value.extend(
+      [0.5] * len(source_tokens))
+  if format_version != global_vars.LEGACY_FORMAT_VERSION:
+    example.features.feature[global_vars.FORMAT_VERSION_KEY].int64_list.value.append(
+        format_version)
+  return example.SerializeToString()
+
+
+class FeaturedTFExampleDecoderTest(tf.test.TestCase):
+  """Tests decoding legacy and token list examples."""
+
+  def _decode(self, serialized, format_version=None):
+    decoder = FeaturedTFExampleDecoder(
+        global_vars.source_keys_to_features,
+        global_vars.target_keys_to_features,
+        format_version=format_version)
+    items = decoder.list_items()
+    tensors = decoder.decode(tf.constant(serialized), items)
+    with self.test_session() as sess:
+      return dict(zip(items, sess.run(tensors)))
+
+  def test_token_list(self):
+    for format_version in [None, global_vars.TOKEN_LIST_FORMAT_VERSION]:
+      outputs = self._decode(
+          _make_example(global_vars.TOKEN_LIST_FORMAT_VERSION), format_version)
+      self.assertEqual(
+          [_.decode("utf-8") for _ in outputs["source_tokens"]], SOURCE_TOKENS)
+      self.assertEqual(outputs["source_len"], 3)
+      self.assertEqual(outputs["source_oov_list"].tolist(), [b"a b"])
+      self.assertEqual(
+          [_.decode("utf-8") for _ in outputs["target_tokens"]], TARGET_TOKENS)
+
+  def test_legacy(self):
+    for format_version in [None, global_vars.LEGACY_FORMAT_VERSION]:
+      outputs = self._decode(
+          _make_example(global_vars.LEGACY_FORMAT_VERSION), format_version)
+      self.assertEqual(
+          [_.decode("utf-8") for _ in outputs["source_tokens"]],
+          ["北京", "a", "b", "SEQUENCE_END"])
+      self.assertEqual(outputs["source_len"], 4)
+      self.assertEqual(
+          [_.decode("utf-8") for _ in outputs["target_tokens"]], TARGET_TOKENS)
+
+  def _decode_batch(self, serialized, format_version=None):
+    decoder = FeaturedTFExampleDecoder(
+        global_vars.source_keys_to_features,
+        global_vars.target_keys_to_features,
+        format_version=format_version)
+    batch = decoder.decode_batch(tf.constant(serialized))
+    self.assertEqual(set(batch.keys()), set(decoder.list_items()))
+    with self.test_session() as sess:
+      return sess.run(batch)
+
+  def test_decode_batch(self):
+    for format_version in [None, global_vars.TOKEN_LIST_FORMAT_VERSION]:
+      batch = self._decode_batch([
+          _make_example(global_vars.TOKEN_LIST_FORMAT_VERSION),
+          _make_example(global_vars.TOKEN_LIST_FORMAT_VERSION, ["c"])
+      ], format_version)
+      np.testing.assert_array_equal(batch["source_len"], [3, 1])
+      np.testing.assert_array_equal(batch["target_len"], [3, 3])
+      self.assertEqual(batch["source_tokens"].tolist(),
+                       [[_.encode("utf-8") for _ in SOURCE_TOKENS],
+                        [b"c", b"", b""]])
+      np.testing.assert_array_equal(batch["source_ids"], [[4, 5, 6], [4, 0, 0]])
+      np.testing.assert_array_equal(batch["source_oov_nums"], [1, 1])
+      np.testing.assert_allclose(batch["source_tfidfs"],
+                                 [[0.5, 0.5, 0.5], [0.5, 0., 0.]])
+
+  def test_decode_batch_legacy(self):
+    batch = self._decode_batch([
+        _make_example(global_vars.LEGACY_FORMAT_VERSION),
+        _make_example(global_vars.LEGACY_FORMAT_VERSION, ["c"])
+    ])
+    np.testing.assert_array_equal(batch["source_len"], [4, 1])
+    self.assertEqual(batch["source_tokens"][1].tolist(), [b"c", b"", b"", b""])
+
+  def test_decode_batch_mixed_versions(self):
+    batch = self._decode_batch([
+        _make_example(global_vars.TOKEN_LIST_FORMAT_VERSION, ["c"]),
+        _make_example(global_vars.LEGACY_FORMAT_VERSION),
+        _make_example(global_vars.TOKEN_LIST_FORMAT_VERSION)
+    ])
+    np.testing.assert_array_equal(batch["source_len"], [1, 4, 3])
+    self.assertEqual(batch["source_tokens"].tolist(), [
+        [b"c", b"", b"", b""],
+        [_.encode("utf-8") for _ in ["北京", "a", "b", "SEQUENCE_END"]],
+        [_.encode("utf-8") for _ in SOURCE_TOKENS] + [b""]
+    ])
+    np.testing.assert_array_equal(batch["target_len"], [3, 3, 3])
+
+  def test_batched_pipeline(self):
+    record_file = tempfile.NamedTemporaryFile()
+    writer = tf.python_io.TFRecordWriter(record_file.name)
+    for source_tokens in [["a"], ["a", "b"], ["a", "b", "c"]]:
+      writer.write(_make_example(global_vars.TOKEN_LIST_FORMAT_VERSION,
+                                 source_tokens))
+    writer.close()
+
+    pipeline = input_pipeline.FeaturedTFRecordInputPipeline(
+        params={
+            "files": [record_file.name],
+            "num_epochs": 1,
+            "shuffle": False,
+            "input_pipeline": "dataset",
+            "parse_batches": True
+        },
+        mode=tf.contrib.learn.ModeKeys.TRAIN)
+    batch = pipeline.make_batched_dataset(2).make_one_shot_iterator().get_next()
+    with self.test_session() as sess:
+      first, second = sess.run(batch), sess.run(batch)
+    np.testing.assert_array_equal(first["source_len"], [1, 2])
+    np.testing.assert_array_equal(second["source_len"], [3])
+    record_file.close()
+
+  def test_parse_batches_requires_dataset(self):
+    with self.assertRaises(ValueError):
+      input_pipeline.FeaturedTFRecordInputPipeline(
+          params={"parse_batches": True},
+          mode=tf.contrib.learn.ModeKeys.TRAIN)
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the line fingerprints.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from seq2seq.data import fingerprint
+
+
+class FingerprintTest(tf.test.TestCase):
+  """Tests dedup and overlap checks of split files."""
+
+  def setUp(self):
+    super(FingerprintTest, self).setUp()
+    self.tmp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+    super(FingerprintTest, self).tearDown()
+
+  def _write(self, name, lines):
+    path = os.path.join(self.tmp_dir, name)
+    with io.open(path, "w", encoding="utf-8") as file:
+      file.write("".join(_ + "\n" for _ in lines))
+    return path
+
+  def test_normalize(self):
+    self.assertEqual(fingerprint.normalize_line("我 爱 北京 SEQUENCE_END"), "我爱北京")
+    self.assertEqual(
+        fingerprint.normalize_line("a b\tc  d"),
+        fingerprint.normalize_line("ab\tcd"))
+    self.assertNotEqual(
+        fingerprint.fingerprint_lines(["ab\tc"]).line_fingerprints[0],
+        fingerprint.fingerprint_lines(["a\tbc"]).line_fingerprints[0])
+
+  def test_ranges_match_lines(self):
+    lines = ["q{} w{}\tt{}".format(_, _ % 7, _) for _ in range(100)] + [""]
+    path = self._write("train", lines)
+    for num_workers in [1, 2]:
+      files = fingerprint.fingerprint_files(
+          [path], num_workers=num_workers, range_bytes=64)
+      expected = fingerprint.fingerprint_lines(lines)
+      np.testing.assert_array_equal(files[0].line_fingerprints,
+                                    expected.line_fingerprints)
+      np.testing.assert_array_equal(files[0].field_line_ids,
+                                    expected.field_line_ids)
+      self.assertEqual(files[0].non_empty.sum(), 100)
+
+  def test_overlap_and_dedup(self):
+    train = self._write("train", ["a b\tx", "c\ty", "a b\tx", "d\tz", "e\tw"])
+    test = self._write("test", ["c", "z SEQUENCE_END"])
+    train_files, test_files = [[_] for _ in fingerprint.fingerprint_files(
+        [train, test], num_workers=1)]
+    exclude = fingerprint.unique_fingerprints(test_files, fields=True)
+    overlapping = fingerprint.overlapping_lines(train_files[0], exclude, True)
+    np.testing.assert_array_equal(overlapping, [False, True, False, True, False])
+    self.assertEqual(
+        fingerprint.read_lines(train, overlapping, limit=1), ["c\ty"])
+
+    duplicated, = fingerprint.duplicated_lines(train_files)
+    np.testing.assert_array_equal(duplicated, [False, False, True, False, False])
+
+    keep = ~overlapping & ~duplicated
+    save_path = train + ".new"
+    self.assertEqual(
+        fingerprint.write_lines([train], [save_path], [keep], num_workers=1),
+        [2])
+    with io.open(save_path, encoding="utf-8") as file:
+      self.assertEqual(file.read(), "a b\tx\ne\tw\n")
+
+
+if __name__ == "__main__":
+  tf.test.main()
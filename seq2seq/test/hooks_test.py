@@ -30,7 +30,10 @@ from tensorflow.python.training import monitored_session  # pylint: disable=E061
 from tensorflow import gfile
 
 from seq2seq import graph_utils
+from seq2seq.data import input_pipeline
+from seq2seq.test import utils as test_utils
 from seq2seq.training import hooks
+from seq2seq.training import utils as training_utils
 
 
 class TestPrintModelAnalysisHook(tf.test.TestCase):
@@ -150,5 +153,126 @@ class TestMetadataCaptureHook(tf.test.TestCase):
           set(gfile.ListDirectory(self.model_dir)),
           set(["run_meta", "tfprof_log", "timeline.json"]))
 
+
+class TestInputPositionHook(tf.test.TestCase):
+  """Tests resuming the input with the `InputPositionHook`"""
+
+  def setUp(self):
+    super(TestInputPositionHook, self).setUp()
+    self.model_dir = tempfile.mkdtemp()
+    self.sources = ["line{}".format(_) for _ in range(20)]
+    self.file_source, _ = test_utils.create_temp_parallel_data(
+        sources=self.sources, targets=self.sources)
+
+  def tearDown(self):
+    super(TestInputPositionHook, self).tearDown()
+    shutil.rmtree(self.model_dir)
+
+  def _read_lines(self, num_steps, save_steps=1):
+    """Reads `num_steps` lines in a new graph and session, saving the model
+    and the input position every `save_steps` steps."""
+    with tf.Graph().as_default():
+      global_step = tf.contrib.framework.get_or_create_global_step()
+      pipeline = input_pipeline.ParallelTextInputPipeline(
+          params={
+              "source_files": [self.file_source.name],
+              "num_epochs": 1,
+              "shuffle": True,
+              "shuffle_buffer_size": 8,
+              "seed": 3,
+              "input_pipeline": "dataset"
+          },
+          mode=tf.contrib.learn.ModeKeys.TRAIN)
+      batch = training_utils.create_dataset_batch(
+          pipeline, batch_size=1, allow_smaller_final_batch=True,
+          save_position=True)
+      step = tf.assign_add(global_step, 1)
+      hook = hooks.InputPositionHook(
+          params={}, model_dir=self.model_dir,
+          run_config=tf.contrib.learn.RunConfig())
+      saver_hook = tf.train.CheckpointSaverHook(
+          self.model_dir, save_steps=save_steps,
+          listeners=[hook.saver_listener()])
+      lines = []
+      with tf.train.MonitoredTrainingSession(
+          checkpoint_dir=self.model_dir,
+          save_checkpoint_secs=None,
+          save_summaries_steps=None,
+          save_summaries_secs=None,
+          hooks=[hook, saver_hook]) as sess:
+        for _ in range(num_steps):
+          tokens, _ = sess.run([batch["source_tokens"], step])
+          lines.append(tokens[0][0].decode("utf-8"))
+    return lines
+
+  def test_resume(self):
+    first = self._read_lines(7)
+    second = self._read_lines(13)
+    self.assertEqual(sorted(first + second), sorted(self.sources))
+
+  def test_resume_model_step(self):
+    # Positions are saved at steps 5, 10 and 12, the model resumes at 5
+    first = self._read_lines(12, save_steps=5)
+    tf.train.update_checkpoint_state(
+        self.model_dir, os.path.join(self.model_dir, "model.ckpt-5"))
+    second = self._read_lines(15)
+    self.assertEqual(sorted(first[:5] + second), sorted(self.sources))
+
+  def test_requires_iterators(self):
+    hook = hooks.InputPositionHook(
+        params={}, model_dir=self.model_dir,
+        run_config=tf.contrib.learn.RunConfig())
+    with self.assertRaises(ValueError):
+      hook.begin()
+
+
+class TestInputStallHook(tf.test.TestCase):
+  """Tests the `InputStallHook`"""
+
+  def setUp(self):
+    super(TestInputStallHook, self).setUp()
+    self.model_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    super(TestInputStallHook, self).tearDown()
+    shutil.rmtree(self.model_dir)
+
+  def test_union_micros(self):
+    #pylint: disable=W0212
+    self.assertEqual(hooks._union_micros([(0, 10), (5, 20), (30, 40)]), 30)
+    self.assertEqual(hooks._union_micros([]), 0)
+
+  def test_samples_queues(self):
+    global_step = tf.contrib.framework.get_or_create_global_step()
+    batch = tf.train.batch(
+        [tf.constant([1, 2, 3])], batch_size=4, capacity=20,
+        name="batch_queue")
+    computation = tf.reduce_sum(batch)
+
+    hook = hooks.InputStallHook(
+        params={"sample_every_n_steps": 1, "every_n_steps": 2},
+        model_dir=self.model_dir, run_config=tf.contrib.learn.RunConfig())
+    hook.begin()
+    #pylint: disable=W0212
+    self.assertEqual(list(hook._queue_capacities.values()), [20])
+    self.assertIn("batch_queue", hook._input_ops)
+
+    with self.test_session() as sess:
+      sess.run(tf.global_variables_initializer())
+      coord = tf.train.Coordinator()
+      threads = tf.train.start_queue_runners(sess, coord)
+      mon_sess = monitored_session._HookedSession(sess, [hook])
+      sess.run(tf.assign(global_step, 0))
+      mon_sess.run(computation)
+      self.assertEqual(len(hook._samples), 1)
+      mon_sess.run(computation)
+      self.assertEqual(hook._samples, [])
+      coord.request_stop()
+      coord.join(threads)
+
+    summary_dir = os.path.join(self.model_dir, "input_stats", "train_worker_0")
+    self.assertTrue(gfile.ListDirectory(summary_dir))
+
+
 if __name__ == "__main__":
   tf.test.main()
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Unit tests for pre-tokenized id shards.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import shutil
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from seq2seq.data import id_shards, input_pipeline
+from seq2seq.data.vocab import Vocab
+from seq2seq.test import utils as test_utils
+from seq2seq.training import utils as training_utils
+
+
+class IdShardsTest(tf.test.TestCase):
+  """Tests converting text to id shards and reading them."""
+
+  def setUp(self):
+    super(IdShardsTest, self).setUp()
+    tf.logging.set_verbosity(tf.logging.INFO)
+    self.output_dir = tempfile.mkdtemp()
+    self.vocab_file = test_utils.create_temporary_vocab_file(
+        ["Hello", "World", "Bye"])
+    self.vocab = Vocab(self.vocab_file.name)
+    self.source_file, self.target_file = test_utils.create_temp_parallel_data(
+        sources=["Hello World", "Hello unknown World", "Bye"],
+        targets=["Bye", "Hello", "Bye Bye World"])
+    self.prefixes = id_shards.convert_parallel_text(
+        source_file=self.source_file.name,
+        vocab_instance=self.vocab,
+        output_prefix=self.output_dir + "/train",
+        target_file=self.target_file.name,
+        examples_per_shard=2)
+
+  def tearDown(self):
+    super(IdShardsTest, self).tearDown()
+    shutil.rmtree(self.output_dir)
+    self.vocab_file.close()
+
+  def _ids(self, tokens):
+    return [self.vocab.word2id(_) for _ in tokens]
+
+  def test_convert(self):
+    self.assertEqual(len(self.prefixes), 2)
+    self.assertEqual(
+        id_shards.find_shards([self.output_dir + "/train-*"]), self.prefixes)
+
+    shard = id_shards.IdShard(self.prefixes[0])
+    self.assertEqual(len(shard), 2)
+    self.assertTrue(shard.has_targets)
+    np.testing.assert_array_equal(
+        shard.source(1),
+        self._ids(["Hello", "UNK", "World", "SEQUENCE_END"]))
+    np.testing.assert_array_equal(
+        shard.target(0),
+        self._ids(["SEQUENCE_START", "Bye", "SEQUENCE_END"]))
+
+  def test_sort_by_length(self):
+    prefix = self.output_dir + "/sorted"
+    id_shards.write_id_shard(
+        prefix, [[1, 2, 3], [1], [1, 2]], [[4], [5], [6]],
+        sort_by_length=True)
+    shard = id_shards.IdShard(prefix)
+    self.assertEqual([len(shard.source(_)) for _ in range(3)], [1, 2, 3])
+    self.assertEqual([shard.target(_).tolist() for _ in range(3)],
+                     [[5], [6], [4]])
+
+  def test_iterate_examples(self):
+    examples = list(
+        id_shards.iterate_examples(self.prefixes, shuffle=True, num_epochs=2))
+    self.assertEqual(len(examples), 6)
+    self.assertEqual(
+        sorted(len(source) for source, _ in examples), [2, 2, 3, 3, 4, 4])
+
+  def test_iterate_blocks(self):
+    prefix = self.output_dir + "/blocks"
+    sources = [[1, 2, 3], [1], [1, 2], [4, 5, 6, 7], [8]]
+    targets = [[4], [5, 6], [6], [7], [8, 9]]
+    id_shards.write_id_shard(prefix, sources, targets)
+    blocks = list(id_shards.iterate_blocks([prefix], block_size=2,
+                                           num_epochs=1))
+    self.assertEqual([len(_[1]) for _ in blocks], [2, 2, 1])
+    source_ids, source_len, target_ids, target_len = blocks[1]
+    np.testing.assert_array_equal(source_ids, [[1, 2, 0, 0], [4, 5, 6, 7]])
+    np.testing.assert_array_equal(source_len, [2, 4])
+    np.testing.assert_array_equal(target_ids, [[6], [7]])
+    np.testing.assert_array_equal(target_len, [1, 1])
+
+    blocks = list(id_shards.iterate_blocks([prefix], block_size=2,
+                                           shuffle=True, num_epochs=2))
+    examples = [
+        ids[:length].tolist()
+        for block in blocks for ids, length in zip(block[0], block[1])
+    ]
+    self.assertEqual(sorted(examples), sorted(sources * 2))
+
+  def test_pipeline(self):
+    pipeline = input_pipeline.IdShardInputPipeline(
+        params={
+            "files": [self.output_dir + "/train-*"],
+            "shuffle": False,
+            "num_epochs": 1,
+            "keep_tokens": True,
+            "vocab_source": self.vocab_file.name,
+            "vocab_target": self.vocab_file.name,
+        },
+        mode=tf.contrib.learn.ModeKeys.TRAIN)
+    self.assertEqual(pipeline.feature_keys,
+                     set(["source_ids", "source_len", "source_tokens"]))
+
+    batch = training_utils.create_dataset_batch(
+        pipeline, batch_size=1, allow_smaller_final_batch=True)
+    with self.test_session() as sess:
+      sess.run(tf.tables_initializer())
+      batch_ = sess.run(batch)
+
+    self.assertEqual(batch_["source_len"][0], 3)
+    self.assertEqual(batch_["target_len"][0], 3)
+    np.testing.assert_array_equal(
+        batch_["source_ids"][0],
+        self._ids(["Hello", "World", "SEQUENCE_END"]))
+    np.testing.assert_array_equal(
+        np.char.decode(batch_["target_tokens"][0].astype("S"), "utf-8"),
+        ["SEQUENCE_START", "Bye", "SEQUENCE_END"])
+
+    # The vocabulary is not stored in the graph
+    graph_def = tf.get_default_graph().as_graph_def()
+    self.assertLess(
+        max([len(_.attr["value"].tensor.string_val)
+             for _ in graph_def.node if _.op == "Const"] + [0]), 2)
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Unit tests for the input pipeline benchmark.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import tensorflow as tf
+
+from seq2seq.data import input_pipeline
+from seq2seq.test import utils as test_utils
+from seq2seq.training import input_benchmark
+
+
+class InputBenchmarkTest(tf.test.TestCase):
+  """Tests running the stages of a parallel text pipeline."""
+
+  def setUp(self):
+    super(InputBenchmarkTest, self).setUp()
+    tf.logging.set_verbosity(tf.logging.INFO)
+    sources = ["a b c", "a", "b b b b b b"] * 400
+    self.file_source, self.file_target = test_utils.create_temp_parallel_data(
+        sources=sources, targets=sources)
+    self.vocab_file = test_utils.create_temporary_vocab_file(["a", "b", "c"])
+
+  def _pipeline(self, engine):
+    return input_pipeline.ParallelTextInputPipeline(
+        params={
+            "source_files": [self.file_source.name],
+            "target_files": [self.file_target.name],
+            "num_epochs": 1,
+            "shuffle": False,
+            "input_pipeline": engine
+        },
+        mode=tf.contrib.learn.ModeKeys.TRAIN)
+
+  def test_dataset_stages(self):
+    results = input_benchmark.benchmark(
+        self._pipeline("dataset"),
+        num_examples=1000,
+        batch_size=8,
+        vocab_source=self.vocab_file.name,
+        vocab_target=self.vocab_file.name)
+    self.assertEqual([_.stage for _ in results], input_benchmark.STAGES)
+    for result in results:
+      # The first session run is not counted
+      self.assertGreater(result.examples, 0)
+      self.assertLessEqual(result.examples, 1200)
+    read, decode, lookup, batch = results
+    self.assertEqual(read.tokens, 0)
+    self.assertEqual(decode.padding_ratio, 0.0)
+    self.assertEqual(lookup.padding_ratio, 0.0)
+    self.assertGreater(batch.padding_ratio, 0.0)
+    self.assertLess(batch.padding_ratio, 1.0)
+    self.assertIn("+us/example", input_benchmark.format_results(results))
+
+  def test_queue_stages(self):
+    results = input_benchmark.benchmark(
+        self._pipeline("queue"), num_examples=100, batch_size=8)
+    self.assertEqual([_.stage for _ in results], ["decode", "batch"])
+
+  def test_unknown_stage(self):
+    with self.assertRaises(ValueError):
+      input_benchmark.run_stage("parse", self._pipeline("dataset"), 10)
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -157,5 +157,116 @@ class ParallelTextInputPipelineTest(tf.test.TestCase):
         ["SEQUENCE_START", "Bye", "泣", "SEQUENCE_END"])
 
 
+class DatasetInputPipelineTest(tf.test.TestCase):
+  """
+  Tests the tf.data engine of the input pipelines.
+  """
+
+  def setUp(self):
+    super(DatasetInputPipelineTest, self).setUp()
+    tf.logging.set_verbosity(tf.logging.INFO)
+
+  def _read_examples(self, pipeline, num_examples):
+    example = pipeline.make_dataset().make_one_shot_iterator().get_next()
+    with self.test_session() as sess:
+      return [sess.run(example) for _ in range(num_examples)]
+
+  def _assert_tokens(self, tokens, expected):
+    np.testing.assert_array_equal(
+        np.char.decode(tokens.astype("S"), "utf-8"), expected)
+
+  def test_parallel_text(self):
+    file_source, file_target = test_utils.create_temp_parallel_data(
+        sources=["Hello World . 笑", "a b"], targets=["Bye 泣", "c"])
+
+    pipeline = input_pipeline.ParallelTextInputPipeline(
+        params={
+            "source_files": [file_source.name],
+            "target_files": [file_target.name],
+            "num_epochs": 1,
+            "shuffle": False,
+            "input_pipeline": "dataset"
+        },
+        mode=tf.contrib.learn.ModeKeys.TRAIN)
+
+    first, second = self._read_examples(pipeline, 2)
+
+    self.assertEqual(first["source_len"], 5)
+    self.assertEqual(first["target_len"], 4)
+    self._assert_tokens(first["source_tokens"],
+                        ["Hello", "World", ".", "笑", "SEQUENCE_END"])
+    self._assert_tokens(first["target_tokens"],
+                        ["SEQUENCE_START", "Bye", "泣", "SEQUENCE_END"])
+    self._assert_tokens(second["source_tokens"], ["a", "b", "SEQUENCE_END"])
+    self._assert_tokens(second["target_tokens"],
+                        ["SEQUENCE_START", "c", "SEQUENCE_END"])
+
+  def test_parallel_text_without_targets(self):
+    file_source, _ = test_utils.create_temp_parallel_data(
+        sources=["Hello World"], targets=["Bye"])
+
+    pipeline = input_pipeline.ParallelTextInputPipeline(
+        params={
+            "source_files": [file_source.name],
+            "shuffle": False,
+            "input_pipeline": "dataset"
+        },
+        mode=tf.contrib.learn.ModeKeys.INFER)
+
+    example, = self._read_examples(pipeline, 1)
+    self.assertEqual(set(example.keys()), set(["source_tokens", "source_len"]))
+    self.assertEqual(example["source_len"], 3)
+
+  def test_tfrecords(self):
+    tfrecords_file = test_utils.create_temp_tfrecords(
+        sources=["Hello World . 笑"], targets=["Bye 泣"])
+
+    pipeline = input_pipeline.TFRecordInputPipeline(
+        params={
+            "files": [tfrecords_file.name],
+            "num_epochs": 5,
+            "shuffle": True,
+            "input_pipeline": "dataset"
+        },
+        mode=tf.contrib.learn.ModeKeys.TRAIN)
+
+    example, = self._read_examples(pipeline, 1)
+    self.assertEqual(example["source_len"], 5)
+    self.assertEqual(example["target_len"], 4)
+    self._assert_tokens(example["source_tokens"],
+                        ["Hello", "World", ".", "笑", "SEQUENCE_END"])
+
+  def test_seeded_order(self):
+    sources = ["line{}".format(_) for _ in range(20)]
+    file_source, _ = test_utils.create_temp_parallel_data(
+        sources=sources, targets=sources)
+
+    def read_lines():
+      with tf.Graph().as_default():
+        pipeline = input_pipeline.ParallelTextInputPipeline(
+            params={
+                "source_files": [file_source.name],
+                "num_epochs": 2,
+                "shuffle": True,
+                "shuffle_buffer_size": 8,
+                "seed": 7,
+                "input_pipeline": "dataset"
+            },
+            mode=tf.contrib.learn.ModeKeys.TRAIN)
+        examples = self._read_examples(pipeline, 40)
+      return [_["source_tokens"][0].decode("utf-8") for _ in examples]
+
+    lines = read_lines()
+    self.assertEqual(lines, read_lines())
+    self.assertEqual(sorted(lines), sorted(sources * 2))
+    self.assertNotEqual(lines[:20], lines[20:])
+
+  def test_unknown_engine(self):
+    with self.assertRaises(ValueError):
+      input_pipeline.ParallelTextInputPipeline(
+          params={"input_pipeline": "unknown"},
+          mode=tf.contrib.learn.ModeKeys.TRAIN)
+
+
 if __name__ == "__main__":
   tf.test.main()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Unit tests for the corpus length index.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import itertools
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from seq2seq.data import length_index
+from seq2seq.test import utils as test_utils
+
+
+class LengthIndexTest(tf.test.TestCase):
+  """Tests building and caching the length histogram."""
+
+  def setUp(self):
+    super(LengthIndexTest, self).setUp()
+    self.source_file, self.target_file = test_utils.create_temp_parallel_data(
+        sources=["a b c", "a", "a b  c d"], targets=["x", "x y", "x"])
+
+  def tearDown(self):
+    super(LengthIndexTest, self).tearDown()
+    index_path = self.source_file.name + length_index.LENGTH_INDEX_SUFFIX
+    if os.path.exists(index_path):
+      os.remove(index_path)
+
+  def test_scan_lengths(self):
+    histogram = length_index.scan_lengths(self.source_file.name,
+                                          self.target_file.name)
+    # Source lengths include SEQUENCE_END, targets SEQUENCE_START as well
+    self.assertEqual(histogram.shape, (6, 5))
+    self.assertEqual(histogram.sum(), 3)
+    self.assertEqual(histogram[4, 3], 1)
+    self.assertEqual(histogram[2, 4], 1)
+    self.assertEqual(histogram[5, 3], 1)
+
+  def test_count_tokens(self):
+    # Like tf.string_split, every character of the delimiter splits
+    self.assertEqual(length_index._count_tokens("a b,c,, d\n", " ,"), 4)
+    self.assertEqual(length_index._count_tokens("a.b\n", "."), 2)
+    self.assertEqual(length_index._count_tokens("北京\n", ""), 6)
+
+  def test_cached_index(self):
+    histogram = length_index.load_length_index([self.source_file.name],
+                                               [self.target_file.name])
+    self.assertTrue(
+        os.path.exists(self.source_file.name +
+                       length_index.LENGTH_INDEX_SUFFIX))
+    cached = length_index.load_length_index([self.source_file.name],
+                                            [self.target_file.name])
+    np.testing.assert_array_equal(histogram, cached)
+
+  def test_auto_bucket_boundaries_patterns(self):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+      files = {}
+      for name, lines in [("source.0", ["a b c", "a"]), ("source.1", ["a b c d e f"]),
+                          ("target.0", ["x", "x y"]), ("target.1", ["x y z"])]:
+        files[name] = os.path.join(tmp_dir, name)
+        with io.open(files[name], "w", encoding="utf-8") as file:
+          file.write("".join(_ + "\n" for _ in lines))
+      boundaries, padding_ratio = length_index.auto_bucket_boundaries(
+          {"source_files": [os.path.join(tmp_dir, "source.*")],
+           "target_files": [os.path.join(tmp_dir, "target.*")]},
+          num_buckets=2)
+
+      # Every matched file is indexed on its own
+      for name in ["source.0", "source.1"]:
+        self.assertTrue(os.path.exists(
+            files[name] + length_index.LENGTH_INDEX_SUFFIX))
+      histogram = length_index.load_length_index(
+          [files["source.0"], files["source.1"]],
+          [files["target.0"], files["target.1"]])
+      self.assertEqual(histogram.sum(), 3)
+      self.assertEqual(boundaries, length_index.choose_bucket_boundaries(
+          length_index.bucket_length_counts(histogram), 2))
+      self.assertEqual(padding_ratio, length_index.expected_padding_ratio(
+          histogram, boundaries))
+    finally:
+      shutil.rmtree(tmp_dir)
+
+  def test_merge_histograms(self):
+    merged = length_index.merge_histograms(
+        [np.ones([2, 3], dtype=np.int64), np.ones([3, 1], dtype=np.int64)])
+    np.testing.assert_array_equal(merged, [[2, 1, 1], [2, 1, 1], [1, 0, 0]])
+
+
+class BucketBoundariesTest(tf.test.TestCase):
+  """Tests choosing bucket boundaries."""
+
+  def _padding(self, length_counts, boundaries):
+    """Brute force padding to the longest length of each bucket."""
+    lengths = np.flatnonzero(length_counts)
+    buckets = np.searchsorted(boundaries, lengths, side="right")
+    return sum(length_counts[length] *
+               (lengths[buckets == bucket].max() - length)
+               for length, bucket in zip(lengths, buckets))
+
+  def test_optimal_boundaries(self):
+    length_counts = np.random.RandomState(42).randint(0, 5, size=20)
+    for num_buckets in [2, 3, 4]:
+      boundaries = length_index.choose_bucket_boundaries(
+          length_counts, num_buckets)
+      self.assertEqual(len(boundaries), num_buckets - 1)
+      best = min(
+          self._padding(length_counts, list(_))
+          for _ in itertools.combinations(range(1, 21), num_buckets - 1))
+      self.assertEqual(self._padding(length_counts, boundaries), best)
+
+  def test_few_lengths(self):
+    length_counts = np.array([0, 0, 3, 0, 1])
+    self.assertEqual(
+        length_index.choose_bucket_boundaries(length_counts, 5), [3])
+    self.assertEqual(
+        length_index.choose_bucket_boundaries(length_counts, 1), [])
+
+  def test_expected_padding_ratio(self):
+    histogram = np.zeros([21, 9], dtype=np.int64)
+    histogram[5, 3] = 10
+    histogram[20, 8] = 10
+    self.assertAlmostEqual(
+        length_index.expected_padding_ratio(histogram, []), 1. - 36. / 56.)
+    self.assertAlmostEqual(
+        length_index.expected_padding_ratio(histogram, [6]), 0.)
+
+  def test_bucket_by_max(self):
+    histogram = np.zeros([6, 9], dtype=np.int64)
+    histogram[5, 3] = 2
+    histogram[2, 8] = 1
+    counts = length_index.bucket_length_counts(histogram, by="max")
+    self.assertEqual(counts[5], 2)
+    self.assertEqual(counts[8], 1)
+
+
+if __name__ == "__main__":
+  tf.test.main()
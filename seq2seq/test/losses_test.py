@@ -61,5 +61,64 @@ class CrossEntropySequenceLossTest(tf.test.TestCase):
     np.testing.assert_array_equal(losses_[3:, 2], np.zeros_like(losses_[3:, 2]))
 
 
+class CopyGenSequenceLossTest(tf.test.TestCase):
+  """
+  Test for `seq2seq.losses.copy_gen_sequence_loss`.
+  """
+
+  def setUp(self):
+    super(CopyGenSequenceLossTest, self).setUp()
+    tf.logging.set_verbosity(tf.logging.INFO)
+    self.batch_size = 4
+    self.sequence_length = 10
+    self.source_length = 6
+    self.vocab_size = 50
+    self.max_oovs = 3
+
+  def test_op(self):
+    logits = np.random.randn(self.sequence_length, self.batch_size,
+                             self.vocab_size).astype(np.float32)
+    attention_scores = np.random.rand(self.sequence_length, self.batch_size,
+                                      self.source_length).astype(np.float32)
+    attention_scores /= np.sum(attention_scores, axis=2, keepdims=True)
+    p_gens = np.random.rand(self.sequence_length, self.batch_size,
+                            1).astype(np.float32)
+    extend_source_ids = np.random.randint(
+        0, self.vocab_size + self.max_oovs,
+        [self.batch_size, self.source_length])
+    targets = np.random.randint(0, self.vocab_size + self.max_oovs,
+                                [self.sequence_length, self.batch_size])
+    # Make sure that some targets can be copied
+    targets[0] = extend_source_ids[:, 0]
+    sequence_length = np.array([1, 2, 3, 4])
+
+    losses = seq2seq_losses.copy_gen_sequence_loss(
+        logits=logits,
+        attention_scores=attention_scores,
+        p_gens=p_gens,
+        extend_source_ids=extend_source_ids,
+        targets=targets,
+        sequence_length=sequence_length)
+
+    with self.test_session() as sess:
+      losses_ = sess.run(losses)
+
+    # Dense reference over the extended vocabulary
+    vocab_probs = np.exp(logits - np.max(logits, axis=2, keepdims=True))
+    vocab_probs /= np.sum(vocab_probs, axis=2, keepdims=True)
+    expected = np.zeros_like(losses_)
+    for t in range(self.sequence_length):
+      for b in range(self.batch_size):
+        if t >= sequence_length[b]:
+          continue
+        dist = np.zeros(self.vocab_size + self.max_oovs)
+        dist[:self.vocab_size] = p_gens[t, b, 0] * vocab_probs[t, b]
+        np.add.at(dist, extend_source_ids[b],
+                  (1. - p_gens[t, b, 0]) * attention_scores[t, b])
+        expected[t, b] = -np.log(dist[targets[t, b]] + 1e-10)
+
+    np.testing.assert_array_almost_equal(losses_, expected, decimal=4)
+
+
 if __name__ == "__main__":
   tf.test.main()
@@ -186,6 +186,27 @@ class EncoderDecoderTests(tf.test.TestCase):
         predictions_["beam_search_output.original_outputs.logits"].shape,
         [1, pred_len, beam_width, vocab_size])
 
+  def test_infer_batch_beam_search(self):
+    beam_width = 10
+    model, fetches_ = self._test_pipeline(
+        mode=tf.contrib.learn.ModeKeys.INFER,
+        params={"inference.beam_search.beam_width": beam_width,
+                "inference.beam_search.batched": True})
+    predictions_, = fetches_
+    pred_len = predictions_["predicted_ids"].shape[1]
+
+    np.testing.assert_array_equal(predictions_["predicted_ids"].shape,
+                                  [self.batch_size, pred_len, beam_width])
+    np.testing.assert_array_equal(
+        predictions_["beam_search_output.beam_parent_ids"].shape,
+        [self.batch_size, pred_len, beam_width])
+    np.testing.assert_array_equal(
+        predictions_["beam_search_output.scores"].shape,
+        [self.batch_size, pred_len, beam_width])
+    np.testing.assert_array_equal(
+        predictions_["predicted_tokens"].shape,
+        [self.batch_size, pred_len, beam_width])
+
 
 class TestBasicSeq2Seq(EncoderDecoderTests):
   """Tests the seq2seq.models.BasicSeq2Seq model.
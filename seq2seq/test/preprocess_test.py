@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for writing features with a pool of worker processes.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import os
+import re
+import shutil
+import tempfile
+
+import tensorflow as tf
+
+from seq2seq.data import record_shards
+from seq2seq.features import preprocess
+
+
+class _LinePreprocess(preprocess.Preprocess):
+  """Writes every line as an example, without vocabularies or LTP models."""
+
+  def __init__(self, **kwargs):
+    self._init_kwargs = kwargs
+
+  def get_example(self, line):
+    source, target = line.strip().split("\t")
+    example = tf.train.Example()
+    example.features.feature["line"].bytes_list.value.append(
+        line.strip().encode("utf-8"))
+    example.features.feature["source_ids"].int64_list.value.extend(
+        range(len(source.split(" "))))
+    example.features.feature["target_ids"].int64_list.value.extend(
+        range(len(target.split(" "))))
+    return example
+
+
+class GetFeaturesTest(tf.test.TestCase):
+  """Tests that the worker pool writes the same examples as one process."""
+
+  def setUp(self):
+    super(GetFeaturesTest, self).setUp()
+    self.tmp_dir = tempfile.mkdtemp()
+    self.data_dir = os.path.join(self.tmp_dir, "data")
+    os.makedirs(self.data_dir)
+    self.lines = []
+    for i in range(2):
+      with io.open(os.path.join(self.data_dir, "part{}".format(i)), "w",
+                   encoding="utf-8") as file:
+        for j in range(23):
+          line = "{} 北京{}\t{}".format("s" * (j % 4 + 1), j, "t " * (j % 3) + "t")
+          self.lines.append(line)
+          file.write(line + "\n")
+    # The workers are forked and build the Preprocess of the module
+    self._preprocess_class = preprocess.Preprocess
+    self._preload_models = preprocess.NLP.preload_models
+    preprocess.Preprocess = _LinePreprocess
+    preprocess.NLP.preload_models = lambda names: None
+
+  def tearDown(self):
+    preprocess.Preprocess = self._preprocess_class
+    preprocess.NLP.preload_models = self._preload_models
+    shutil.rmtree(self.tmp_dir)
+    super(GetFeaturesTest, self).tearDown()
+
+  def _get_features(self, name, **kwargs):
+    save_path = os.path.join(self.tmp_dir, "out", name)
+    _LinePreprocess().get_features(
+        self.data_dir, save_path, "train", tfrecord_out_nums=5, **kwargs)
+    manifest = record_shards.read_manifest(
+        record_shards.manifest_path(save_path))
+    lines = []
+    for shard in manifest["shards"]:
+      records = list(tf.python_io.tf_record_iterator(shard["path"]))
+      self.assertEqual(len(records), shard["num_examples"])
+      for record in records:
+        example = tf.train.Example.FromString(record)
+        lines.append(
+            example.features.feature["line"].bytes_list.value[0].decode("utf-8"))
+    return manifest, lines
+
+  def test_parallel_matches_single(self):
+    single, single_lines = self._get_features("single", num_workers=1)
+    # Chunks of 50 bytes end inside lines and on newlines
+    parallel, parallel_lines = self._get_features(
+        "parallel", num_workers=3, chunk_bytes=50)
+
+    self.assertEqual(single_lines, self.lines)
+    self.assertEqual(parallel_lines, self.lines)
+    self.assertEqual(single["num_examples"], len(self.lines))
+    self.assertEqual(parallel["num_examples"], len(self.lines))
+
+    self.assertEqual(
+        [os.path.basename(_["path"]) for _ in single["shards"]],
+        ["single.{}".format(_) for _ in range(len(single["shards"]))])
+    names = [os.path.basename(_["path"]) for _ in parallel["shards"]]
+    self.assertEqual(names, sorted(names))
+    for name in names:
+      self.assertRegexpMatches(name, r"^parallel\.\d{5}-\d+$")
+    for manifest in [single, parallel]:
+      for shard in manifest["shards"]:
+        self.assertLessEqual(shard["num_examples"], 5)
+        self.assertEqual(shard["lengths"]["source_ids"]["min"], 2)
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the sharded record writer and its manifest.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+
+import tensorflow as tf
+
+from seq2seq.data import input_pipeline
+from seq2seq.data import record_shards
+
+
+def _make_example(length):
+  example = tf.train.Example()
+  example.features.feature["source_ids"].int64_list.value.extend(range(length))
+  example.features.feature["target_ids"].int64_list.value.extend([1] * 2)
+  return example
+
+
+class ShardedRecordWriterTest(tf.test.TestCase):
+  """Tests writing shards, compression and reading the manifest."""
+
+  def setUp(self):
+    super(ShardedRecordWriterTest, self).setUp()
+    self.tmp_dir = tempfile.mkdtemp()
+    self.save_path = os.path.join(self.tmp_dir, "train")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+    super(ShardedRecordWriterTest, self).tearDown()
+
+  def _write(self, compression):
+    writer = record_shards.ShardedRecordWriter(
+        self.save_path, 3, compression=compression, length_keys=["source_ids"],
+        queue_size=2)
+    for length in range(1, 8):
+      writer.write(_make_example(length))
+    writer.close()
+    return record_shards.write_manifest(self.save_path, writer.shards,
+                                        compression)
+
+  def test_shards(self):
+    for compression in [None, "GZIP", "ZLIB"]:
+      manifest = record_shards.read_manifest(self._write(compression))
+      self.assertEqual(manifest["num_examples"], 7)
+      self.assertEqual(manifest["compression"], compression or "")
+      self.assertEqual(
+          [os.path.basename(_["path"]) for _ in manifest["shards"]],
+          ["train.0", "train.1", "train.2"])
+      self.assertEqual([_["num_examples"] for _ in manifest["shards"]],
+                       [3, 3, 1])
+      self.assertEqual(manifest["shards"][1]["lengths"],
+                       {"source_ids": {"min": 4, "max": 6, "mean": 5.0}})
+
+      options = record_shards.record_options(compression)
+      records = [
+          tf.train.Example.FromString(_)
+          for _ in tf.python_io.tf_record_iterator(
+              manifest["shards"][2]["path"], options=options)
+      ]
+      self.assertEqual(len(records), 1)
+      self.assertEqual(
+          len(records[0].features.feature["source_ids"].int64_list.value), 7)
+
+  def test_unknown_compression(self):
+    with self.assertRaises(ValueError):
+      record_shards.ShardedRecordWriter(self.save_path, 3, compression="LZ4")
+
+  def test_pipeline_reads_manifest(self):
+    manifest_path = self._write("GZIP")
+    pipeline = input_pipeline.FeaturedTFRecordInputPipeline(
+        params={
+            "manifest": manifest_path,
+            "num_epochs": 1,
+            "shuffle": False,
+            "input_pipeline": "dataset"
+        },
+        mode=tf.contrib.learn.ModeKeys.TRAIN)
+    self.assertEqual(pipeline.num_samples, 7)
+    self.assertEqual(pipeline._compression_type(), "GZIP")
+    records = pipeline.make_record_dataset().make_one_shot_iterator().get_next()
+    num_records = 0
+    with self.test_session() as sess:
+      try:
+        while True:
+          sess.run(records)
+          num_records += 1
+      except tf.errors.OutOfRangeError:
+        pass
+    self.assertEqual(num_records, 7)
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -109,7 +109,7 @@ class TestTrainOptions(tf.test.TestCase):
 class TestInputFn(tf.test.TestCase):
   """Tests create_input_fn"""
 
-  def _test_with_args(self, **kwargs):
+  def _test_with_args(self, engine="queue", **kwargs):
     """Helper function to test create_input_fn with keyword arguments"""
     sources_file, targets_file = test_utils.create_temp_parallel_data(
         sources=["Hello World ."], targets=["Goodbye ."])
@@ -117,7 +117,8 @@ class TestInputFn(tf.test.TestCase):
     pipeline = input_pipeline.ParallelTextInputPipeline(
         params={
             "source_files": [sources_file.name],
-            "target_files": [targets_file.name]
+            "target_files": [targets_file.name],
+            "input_pipeline": engine
         },
         mode=tf.contrib.learn.ModeKeys.TRAIN)
     input_fn = training_utils.create_input_fn(pipeline=pipeline, **kwargs)
@@ -137,6 +138,48 @@ class TestInputFn(tf.test.TestCase):
   def test_wit_buckets(self):
     self._test_with_args(batch_size=10, bucket_boundaries=[0, 5, 10])
 
+  def test_dataset_without_buckets(self):
+    self._test_with_args(engine="dataset", batch_size=10)
+
+  def test_dataset_with_buckets(self):
+    self._test_with_args(
+        engine="dataset", batch_size=10, bucket_boundaries=[0, 5, 10])
+
+  def test_max_tokens_per_batch(self):
+    self._test_with_args(
+        batch_size=10, bucket_boundaries=[5, 10], max_tokens_per_batch=40)
+
+  def test_dataset_max_tokens_per_batch(self):
+    self._test_with_args(
+        engine="dataset",
+        batch_size=10,
+        bucket_boundaries=[5, 10],
+        max_tokens_per_batch=40)
+
+  def test_dataset_max_tokens_per_batch_max_length(self):
+    self._test_with_args(
+        engine="dataset",
+        batch_size=10,
+        bucket_boundaries=[2],
+        max_tokens_per_batch=40,
+        max_length=10)
+
+  def test_max_tokens_per_batch_requires_buckets(self):
+    with self.assertRaises(ValueError):
+      training_utils.create_input_fn(
+          pipeline=None, batch_size=10, max_tokens_per_batch=40)
+
+  def test_bucket_batch_sizes(self):
+    self.assertEqual(
+        training_utils.bucket_batch_sizes([5, 10, 50], 100), [10, 5, 1, 1])
+    self.assertEqual(
+        training_utils.bucket_batch_sizes([5, 10], 100, num_sequences=1),
+        [20, 10, 10])
+    # The last bucket holds sequences up to the maximum length
+    self.assertEqual(
+        training_utils.bucket_batch_sizes([5, 10, 50], 100, max_length=25),
+        [10, 5, 2, 2])
+
 
 class TestLRDecay(tf.test.TestCase):
   """Tests learning rate decay function.
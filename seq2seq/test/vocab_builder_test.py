@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the parallel vocabulary builder.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections
+import io
+import os
+import random
+import shutil
+import tempfile
+
+import tensorflow as tf
+
+from seq2seq.data import vocab
+from seq2seq.data import vocab_builder
+
+
+class VocabBuilderTest(tf.test.TestCase):
+  """Tests counting with workers and sketches."""
+
+  def setUp(self):
+    super(VocabBuilderTest, self).setUp()
+    self.tmp_dir = tempfile.mkdtemp()
+    rng = random.Random(0)
+    words = ["w{}".format(_) for _ in range(50)] + ["北京", "a1", "。榜样", "。"]
+    self.counts = collections.Counter()
+    self.paths = []
+    for i in range(2):
+      path = os.path.join(self.tmp_dir, "text{}".format(i))
+      with io.open(path, "w", encoding="utf-8") as file:
+        for _ in range(300):
+          tokens = [rng.choice(words) for _ in range(rng.randint(1, 8))]
+          self.counts.update(tokens)
+          file.write(" ".join(tokens) + "\n")
+      self.paths.append(path)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+    super(VocabBuilderTest, self).tearDown()
+
+  def test_count_tokens(self):
+    for num_workers in [1, 3]:
+      counts = vocab_builder.count_tokens(
+          self.paths, num_workers=num_workers, range_bytes=100)
+      self.assertEqual(counts, dict(self.counts))
+
+  def test_filter(self):
+    pattern = vocab_builder.char_filter_pattern(True, True, "。")
+    counts = vocab_builder.count_tokens(
+        self.paths, filter_pattern=pattern, num_workers=1)
+    self.assertNotIn("a1", counts)
+    self.assertNotIn("w0", counts)
+    self.assertNotIn("。榜样", counts)
+    self.assertEqual(counts["。"], self.counts["。"])
+    self.assertEqual(counts["北京"], self.counts["北京"])
+
+  def test_sketch(self):
+    counts = vocab_builder.count_tokens(
+        self.paths, num_workers=2, range_bytes=100, sketch_width=1 << 12,
+        max_candidates=10)
+    self.assertEqual(len(counts), 10)
+    for word, count in counts.items():
+      self.assertGreaterEqual(count, self.counts[word])
+
+  def test_build_vocab(self):
+    save_path = os.path.join(self.tmp_dir, "vocab")
+    word_with_counts = vocab_builder.build_vocab(
+        self.paths, save_path, min_frequency=1, max_vocab_size=20,
+        num_workers=1)
+    self.assertEqual(len(word_with_counts), 20)
+    vocab_instance = vocab.Vocab(save_path)
+    num_special = len(vocab.get_special_vocab())
+    self.assertEqual(vocab_instance.size(), num_special + 20)
+    word, count = word_with_counts[0]
+    self.assertEqual(vocab_instance.word2id(word), num_special)
+    self.assertEqual(count, self.counts.most_common(1)[0][1])
+
+
+if __name__ == "__main__":
+  tf.test.main()
@@ -21,6 +21,10 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import os
+import shutil
+import tempfile
+
 import tensorflow as tf
 import numpy as np
 
@@ -117,6 +121,170 @@ class CreateVocabularyLookupTableTest(tf.test.TestCase):
       counts = sess.run(counts)
       np.testing.assert_array_equal(counts, [100, 200, 300, -1, -1])
 
+  def test_vocabulary_not_in_graph(self):
+    vocab_list = ["word{}".format(_) for _ in range(10000)]
+    vocab_file = test_utils.create_temporary_vocab_file(vocab_list)
+
+    vocab_to_id_table, _, _, _ = vocab.create_vocabulary_lookup_table(
+        vocab_file.name)
+
+    graph_def = tf.get_default_graph().as_graph_def()
+    self.assertLess(graph_def.ByteSize(), 10000)
+
+    with self.test_session() as sess:
+      sess.run(tf.tables_initializer())
+      ids = sess.run(vocab_to_id_table.lookup(
+          tf.convert_to_tensor(["word0", "word9999", "xxx"])))
+      unk = vocab.get_special_vocab().UNK
+      num_special = len(vocab.get_special_vocab())
+      np.testing.assert_array_equal(ids, [num_special, num_special + 9999, unk])
+
+      # The tables are initialized from a file kept next to the vocabulary
+      assets = sess.run(tf.get_collection(tf.GraphKeys.ASSET_FILEPATHS))
+      self.assertEqual(len(assets), 1)
+      table_file = assets[0].decode("utf-8")
+      self.assertTrue(table_file.startswith(vocab_file.name))
+      self.assertTrue(table_file.endswith(vocab.LOOKUP_TABLE_SUFFIX))
+      self.assertTrue(os.path.exists(table_file))
+
+  def test_tensor_vocab(self):
+    vocab_list = ["Hello", ".", "笑"]
+    vocab_file = test_utils.create_temporary_vocab_file(vocab_list, [1, 2, 3])
+    vocab_instance = vocab.load_vocab(vocab_file.name, use_cache=False)
+
+    vocab_to_id_table, id_to_vocab_table, word_to_count_table, vocab_size = \
+      vocab.create_tensor_vocab(vocab_instance)
+    self.assertEqual(vocab_size, vocab_instance.size())
+
+    with self.test_session() as sess:
+      sess.run(tf.tables_initializer())
+      words = tf.convert_to_tensor(["Hello", "笑", "xxx"])
+      ids, counts = sess.run([vocab_to_id_table.lookup(words),
+                              word_to_count_table.lookup(words)])
+      np.testing.assert_array_equal(
+          ids, [vocab_instance.word2id(_) for _ in ["Hello", "笑", "xxx"]])
+      np.testing.assert_array_equal(counts, [1, 3, -1])
+      words = sess.run(id_to_vocab_table.lookup(tf.constant(ids)))
+      self.assertEqual([_.decode("utf-8") for _ in words], ["Hello", "笑", "UNK"])
+
+
+  def test_table_file_reused(self):
+    # Without special words, a "word\tcount" vocab file is the table file
+    vocab_file = test_utils.create_temporary_vocab_file(["a", "b"], [3, 2])
+    vocab_instance = vocab.load_vocab(
+        vocab_file.name, special_word_ins=None, use_cache=False)
+    vocab_to_id_table, _, _, _ = vocab.create_tensor_vocab(vocab_instance)
+
+    with self.test_session() as sess:
+      sess.run(tf.tables_initializer())
+      ids = sess.run(vocab_to_id_table.lookup(tf.convert_to_tensor(["b", "a"])))
+      np.testing.assert_array_equal(ids, [1, 0])
+      assets = sess.run(tf.get_collection(tf.GraphKeys.ASSET_FILEPATHS))
+      self.assertEqual([_.decode("utf-8") for _ in assets], [vocab_file.name])
+
+  def test_table_file_read_only(self):
+    vocab_dir = tempfile.mkdtemp(dir=self.get_temp_dir())
+    vocab_path = os.path.join(vocab_dir, "vocab.txt")
+    with open(vocab_path, "wb") as file:
+      file.write("Hello\n笑\n".encode("utf-8"))
+
+    # Writing next to the vocabulary fails like on a read-only mount
+    write_once = vocab._write_once
+    def _read_only_write_once(path, content):
+      if path.startswith(vocab_dir):
+        raise tf.errors.PermissionDeniedError(None, None, "Read-only")
+      write_once(path, content)
+    vocab._write_once = _read_only_write_once
+    try:
+      vocab_to_id_table, _, _, _ = vocab.create_vocabulary_lookup_table(
+          vocab_path)
+    finally:
+      vocab._write_once = write_once
+      shutil.rmtree(vocab_dir)
+
+    with self.test_session() as sess:
+      sess.run(tf.tables_initializer())
+      ids = sess.run(vocab_to_id_table.lookup(tf.convert_to_tensor(["笑"])))
+      np.testing.assert_array_equal(ids, [len(vocab.get_special_vocab()) + 1])
+      assets = sess.run(tf.get_collection(tf.GraphKeys.ASSET_FILEPATHS))
+      table_file = assets[0].decode("utf-8")
+      self.assertTrue(table_file.startswith(tempfile.gettempdir()))
+      self.assertFalse(table_file.startswith(vocab_dir))
+      self.assertTrue(os.path.exists(table_file))
+
+
+class CompactVocabTest(tf.test.TestCase):
+  """Tests CompactVocab and its snapshot."""
+
+  def setUp(self):
+    super(CompactVocabTest, self).setUp()
+    self.tmp_dir = tempfile.mkdtemp()
+    self.vocab_path = os.path.join(self.tmp_dir, "vocab.txt")
+    self._write_vocab(["Hello", ".", "笑"], [100, 200, 300])
+
+  def tearDown(self):
+    shutil.rmtree(self.tmp_dir)
+    super(CompactVocabTest, self).tearDown()
+
+  def _write_vocab(self, words, counts):
+    with open(self.vocab_path, "wb") as file:
+      for word, count in zip(words, counts):
+        file.write("{}\t{}\n".format(word, count).encode("utf-8"))
+
+  def test_same_as_vocab(self):
+    expected = vocab.Vocab(self.vocab_path)
+    compact = vocab.load_vocab(self.vocab_path, use_cache=False)
+    self.assertEqual(compact.size(), expected.size())
+    self.assertEqual(compact.words(), expected.words())
+    self.assertEqual(compact.counts(), expected.counts())
+    self.assertEqual(compact.special_vocab, expected.special_vocab)
+    for word in expected.words() + ["xxx"]:
+      self.assertEqual(compact.word2id(word), expected.word2id(word))
+      self.assertEqual(compact.word2id(word.encode("utf-8")),
+                       expected.word2id(word))
+    with self.assertRaises(ValueError):
+      compact.id2word(compact.size())
+
+  def test_batch(self):
+    expected = vocab.Vocab(self.vocab_path)
+    compact = vocab.load_vocab(self.vocab_path, use_cache=False)
+    unk = compact.special_vocab.UNK
+    pad = compact.special_vocab.PAD
+    hello, laugh = compact.word2id("Hello"), compact.word2id("笑")
+    words = expected.words() + ["xxx", "笑".encode("utf-8")]
+    np.testing.assert_array_equal(
+        compact.encode_batch(words),
+        [expected.word2id(w) for w in expected.words()] + [unk, laugh])
+    np.testing.assert_array_equal(
+        compact.encode_batch([["Hello", "xxx"], ["笑"], []]),
+        [[hello, unk], [laugh, pad], [pad, pad]])
+
+    ids = np.arange(expected.size()).reshape([-1, 1])
+    self.assertEqual(compact.decode_batch(ids),
+                     [[expected.id2word(i)] for i in range(expected.size())])
+    self.assertEqual(
+        compact.decode_batch(np.array([[hello, unk], [laugh, pad]])),
+        [["Hello", "UNK"], ["笑", "PAD"]])
+    self.assertEqual(compact.decode_batch(hello), "Hello")
+    with self.assertRaises(ValueError):
+      compact.decode_batch([hello, compact.size()])
+
+  def test_snapshot(self):
+    snapshot_path = self.vocab_path + vocab.VOCAB_SNAPSHOT_SUFFIX
+    first = vocab.load_vocab(self.vocab_path)
+    self.assertTrue(os.path.exists(snapshot_path))
+    second = vocab.load_vocab(self.vocab_path)
+    self.assertEqual(second.words(), first.words())
+    self.assertEqual(second.counts(), first.counts())
+
+    # Changing the vocab file invalidates the snapshot
+    self._write_vocab(["Hello", ".", "笑", "泣"], [100, 200, 300, 400])
+    stat = os.stat(self.vocab_path)
+    os.utime(self.vocab_path, (stat.st_atime, stat.st_mtime + 10))
+    third = vocab.load_vocab(self.vocab_path)
+    self.assertEqual(third.size(), first.size() + 1)
+    self.assertNotEqual(third.word2id("泣"), third.special_vocab.UNK)
+
 
 if __name__ == "__main__":
   tf.test.main()
@@ -23,6 +23,7 @@ from __future__ import unicode_literals
 import abc
 import os
 import pickle
+import time
 
 import numpy as np
 import six
@@ -37,6 +38,7 @@ from tensorflow import gfile
 
 from seq2seq.configurable import Configurable, abstractstaticmethod
 from seq2seq import graph_utils, global_vars
+from seq2seq.training import utils as training_utils
 
 FLAGS = tf.flags.FLAGS
 
@@ -322,6 +324,309 @@ class VariableRestoreHook(TrainingHook):
     tf.logging.info("Successfully restored all variables")
 
 
+class _InputPositionListener(tf.train.CheckpointSaverListener):
+  """Saves the input position of an `InputPositionHook` whenever a
+  `tf.train.CheckpointSaverHook` saves the model."""
+
+  def __init__(self, hook):
+    self._hook = hook
+
+  def after_save(self, session, global_step_value):
+    self._hook.save(session, global_step_value)
+
+
+class InputPositionHook(TrainingHook):
+  """Saves the position of the training input next to the model checkpoints
+  and resumes from it when the worker restarts, so a restart neither replays
+  nor skips examples.
+
+  The position is the state of the dataset iterators created with
+  `save_position=True` (see `training.utils.create_input_fn`): the files of
+  the current epoch, the read offset of every open file, the shuffle buffers
+  and their random state. Open files are restored by seeking, the files
+  already read are not read again. Every worker saves its own position to
+  `input_position_<task_type>_<task_id>-<step>` in the model directory and
+  restores the one of the global step the model was restored at. If that one
+  is missing, the latest earlier position is restored and the examples read
+  since then are read again. The hook also initializes the iterators.
+
+  To save the position together with the model, pass `saver_listener()` to
+  the `tf.train.CheckpointSaverHook` of the chief. Otherwise the position is
+  saved on its own timer.
+
+  Params:
+    every_n_secs: Save the position every N seconds, without a listener.
+    every_n_steps: Save the position every N steps, without a listener. If
+      neither is set, the position is saved as often as the model
+      checkpoints.
+    max_to_keep: The number of recent positions to keep. Defaults to the
+      number of model checkpoints kept.
+  """
+
+  def __init__(self, params, model_dir, run_config):
+    super(InputPositionHook, self).__init__(params, model_dir, run_config)
+    every_n_secs = self.params["every_n_secs"]
+    every_n_steps = self.params["every_n_steps"]
+    if every_n_secs is None and every_n_steps is None:
+      every_n_secs = run_config.save_checkpoints_secs
+      every_n_steps = run_config.save_checkpoints_steps
+      if every_n_secs is None and every_n_steps is None:
+        every_n_secs = 600
+    self._timer = SecondOrStepTimer(
+        every_secs=every_n_secs, every_steps=every_n_steps)
+    name = "input_position_{}_{}".format(run_config.task_type or "worker",
+                                         run_config.task_id or 0)
+    self._save_path = os.path.join(self.model_dir, name)
+    self._latest_filename = "checkpoint_" + name
+    self._listener = None
+    self._saver = None
+    self._initializer = None
+    self._global_step = None
+    self._last_step = None
+
+  @staticmethod
+  def default_params():
+    return {"every_n_secs": None, "every_n_steps": None, "max_to_keep": None}
+
+  def saver_listener(self):
+    """Returns a `tf.train.CheckpointSaverListener` that saves the position
+    every time the model is saved. The hook then no longer saves on its own.
+    """
+    if self._listener is None:
+      self._listener = _InputPositionListener(self)
+    return self._listener
+
+  def begin(self):
+    iterators = tf.get_collection(training_utils.INPUT_ITERATORS)
+    if not iterators:
+      raise ValueError("No input iterators to save, create the input_fn "
+                       "with save_position=True")
+    max_to_keep = self.params["max_to_keep"]
+    if max_to_keep is None:
+      max_to_keep = self._run_config.keep_checkpoint_max
+    self._initializer = tf.group(*[_.initializer for _ in iterators])
+    self._saver = tf.train.Saver(
+        [tf.contrib.data.make_saveable_from_iterator(_) for _ in iterators],
+        max_to_keep=max_to_keep)
+    self._global_step = tf.train.get_global_step()
+
+  def after_create_session(self, session, coord):
+    session.run(self._initializer)
+    step = session.run(self._global_step)
+    path = self._restore_path(step)
+    if path is not None:
+      self._saver.restore(session, path)
+      tf.logging.info("Resumed the input of step %d from %s", step, path)
+
+  def _restore_path(self, step):
+    """The position saved at `step`, or else the latest one before it."""
+    path = "{}-{}".format(self._save_path, step)
+    if tf.train.checkpoint_exists(path):
+      return path
+    state = tf.train.get_checkpoint_state(self.model_dir,
+                                          self._latest_filename)
+    if state is None:
+      return None
+    earlier = [
+        _ for _ in state.all_model_checkpoint_paths
+        if int(_.rsplit("-", 1)[1]) < step and tf.train.checkpoint_exists(_)
+    ]
+    if not earlier:
+      return None
+    path = max(earlier, key=lambda _: int(_.rsplit("-", 1)[1]))
+    tf.logging.warning(
+        "No input position for step %d, the examples read since %s are "
+        "read again", step, path)
+    return path
+
+  def before_run(self, _run_context):
+    if self._listener is None:
+      return tf.train.SessionRunArgs(self._global_step)
+
+  def after_run(self, run_context, run_values):
+    if self._listener is not None:
+      return
+    self._last_step = run_values.results
+    if self._timer.should_trigger_for_step(self._last_step):
+      self._timer.update_last_triggered_step(self._last_step)
+      self.save(run_context.session)
+
+  def end(self, session):
+    # With a listener the final model checkpoint saves the position
+    if self._listener is None and self._last_step is not None:
+      self.save(session)
+
+  def save(self, session, step=None):
+    """Saves the position at `step`, by default the current global step."""
+    if step is None:
+      step = session.run(self._global_step)
+    gfile.MakeDirs(self.model_dir)
+    self._saver.save(
+        session,
+        self._save_path,
+        global_step=step,
+        latest_filename=self._latest_filename,
+        write_meta_graph=False)
+
+
+# The ops a session run blocks on while it waits for input
+INPUT_OP_TYPES = set([
+    "QueueDequeue", "QueueDequeueV2", "QueueDequeueMany",
+    "QueueDequeueManyV2", "QueueDequeueUpTo", "QueueDequeueUpToV2",
+    "IteratorGetNext"
+])
+
+
+def _union_micros(intervals):
+  """The length of the union of (start, end) intervals."""
+  total = 0
+  end = None
+  for start, stop in sorted(intervals):
+    if end is None or start > end:
+      total += stop - start
+      end = stop
+    elif stop > end:
+      total += stop - end
+      end = stop
+  return total
+
+
+def blocked_micros(step_stats, op_names):
+  """The wall time in microseconds that the ops `op_names` of a traced
+  session run were executing, overlapping ops counted once."""
+  intervals = []
+  for device_stats in step_stats.dev_stats:
+    for node_stats in device_stats.node_stats:
+      if node_stats.node_name.split(":")[0] in op_names:
+        start = node_stats.all_start_micros
+        intervals.append((start, start + node_stats.all_end_rel_micros))
+  return _union_micros(intervals)
+
+
+class InputStallHook(TrainingHook):
+  """Measures how long training or evaluation waits for its input.
+
+  Every `sample_every_n_steps` steps the hook traces one session run and
+  reads the size of every queue that has a queue runner (the batching and
+  bucketing queues, the shuffle queues and the common queues of the
+  readers). The time the run spent in dequeue and `IteratorGetNext` ops is
+  the time it was blocked on input. Every `every_n_steps` steps the averages
+  of the samples are logged, e.g. "input-bound 63%", and written as
+  summaries to `<model_dir>/input_stats/<name>_<task_type>_<task_id>`, so
+  every worker gets its own run in TensorBoard. A queue that is nearly empty
+  while the run is input-bound needs more reader threads or capacity
+  upstream, a full queue means its consumers are the bottleneck.
+
+  The hook can be used in `hooks` and in `eval_hooks`.
+
+  Params:
+    sample_every_n_steps: Trace a run and read the queue sizes every N steps.
+    every_n_steps: Log and write the summaries every N steps.
+    name: The name of the summary run, e.g. "eval" for an eval hook.
+  """
+
+  def __init__(self, params, model_dir, run_config):
+    super(InputStallHook, self).__init__(params, model_dir, run_config)
+    self._summary_dir = os.path.join(
+        self.model_dir, "input_stats", "{}_{}_{}".format(
+            self.params["name"], run_config.task_type or "worker",
+            run_config.task_id or 0))
+    self._iter_count = 0
+    self._sample = False
+    self._start_time = None
+    self._global_step = None
+    self._input_ops = set()
+    self._queue_sizes = {}
+    self._queue_capacities = {}
+    self._samples = []
+    self._writer = None
+
+  @staticmethod
+  def default_params():
+    return {"sample_every_n_steps": 10, "every_n_steps": 100, "name": "train"}
+
+  def begin(self):
+    self._iter_count = 0
+    self._samples = []
+    self._global_step = tf.train.get_global_step()
+    graph = tf.get_default_graph()
+    self._input_ops = set(
+        op.name for op in graph.get_operations() if op.type in INPUT_OP_TYPES)
+    self._queue_sizes = {}
+    self._queue_capacities = {}
+    for runner in tf.get_collection(tf.GraphKeys.QUEUE_RUNNERS):
+      queue = runner.queue
+      name = queue.name.split(":")[0]
+      self._queue_sizes[name] = queue.size()
+      try:
+        self._queue_capacities[name] = queue.queue_ref.op.get_attr("capacity")
+      except ValueError:
+        self._queue_capacities[name] = -1
+    self._writer = tf.summary.FileWriterCache.get(self._summary_dir)
+
+  def before_run(self, _run_context):
+    self._sample = self._iter_count % self.params["sample_every_n_steps"] == 0
+    self._start_time = time.time()
+    if not self._sample:
+      return None
+    fetches = [self._queue_sizes]
+    if self._global_step is not None:
+      fetches.append(self._global_step)
+    return tf.train.SessionRunArgs(
+        fetches,
+        options=tf.RunOptions(trace_level=tf.RunOptions.SOFTWARE_TRACE))  #pylint: disable=E1101
+
+  def after_run(self, _run_context, run_values):
+    self._iter_count += 1
+    if not self._sample:
+      return
+    run_micros = 1e6 * (time.time() - self._start_time)
+    blocked = blocked_micros(run_values.run_metadata.step_stats,
+                             self._input_ops)
+    results = run_values.results
+    step = results[1] if len(results) > 1 else self._iter_count
+    self._samples.append((min(blocked, run_micros), run_micros, results[0]))
+    if len(self._samples) * self.params["sample_every_n_steps"] >= \
+        self.params["every_n_steps"]:
+      self._report(step)
+
+  def end(self, session):
+    if self._samples:
+      step = self._iter_count
+      if self._global_step is not None:
+        step = session.run(self._global_step)
+      self._report(step)
+
+  def _report(self, step):
+    blocked = np.mean([_[0] for _ in self._samples])
+    run_micros = np.mean([_[1] for _ in self._samples])
+    fraction = blocked / max(run_micros, 1.0)
+
+    summary = tf.Summary()
+    summary.value.add(tag="input/blocked_fraction", simple_value=fraction)
+    summary.value.add(tag="input/blocked_ms", simple_value=blocked / 1000.0)
+    summary.value.add(tag="input/run_ms", simple_value=run_micros / 1000.0)
+    queues = []
+    for name in sorted(self._queue_sizes):
+      size = np.mean([_[2][name] for _ in self._samples])
+      capacity = self._queue_capacities[name]
+      summary.value.add(tag="input/{}/size".format(name), simple_value=size)
+      if capacity > 0:
+        summary.value.add(
+            tag="input/{}/fraction_full".format(name),
+            simple_value=size / capacity)
+      queues.append("{} {:.0f}/{}".format(
+          name, size, capacity if capacity > 0 else "inf"))
+    self._writer.add_summary(summary, step)
+    self._writer.flush()
+
+    tf.logging.info(
+        "input-bound %.0f%% (blocked %.1f ms of %.1f ms per run) at step %d%s",
+        100.0 * fraction, blocked / 1000.0, run_micros / 1000.0, step,
+        ", queues: " + ", ".join(queues) if queues else "")
+    self._samples = []
+
+
 class DelayStartHook(TrainingHook, tf.train.GlobalStepWaiterHook):
   """Delays the start of the current worker process until global step
   K * task_id is reached. K is a parameter.
@@ -0,0 +1,251 @@
+# Copyright 2017 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Measures the throughput of an input pipeline without a model.
+
+Every stage runs the pipeline up to one more step in a new graph:
+
+  read    the undecoded records of `InputPipeline.make_record_dataset`
+  decode  the examples of `make_dataset`, or of the DataProvider
+  lookup  the examples with their tokens mapped to vocabulary ids
+  batch   the batches of `create_input_fn`, with the vocabulary lookup the
+          model does on batches
+
+Examples are reduced to their number of tokens in the graph and fetched many
+at a time, so the session overhead is negligible and the difference between
+the time per example of two consecutive stages is the cost of a step.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections
+import time
+
+import tensorflow as tf
+
+from seq2seq.data import vocab
+from seq2seq.training import utils as training_utils
+
+STAGES = ["read", "decode", "lookup", "batch"]
+
+# The number of examples fetched by one session run of the example stages
+_EXAMPLES_PER_RUN = 256
+
+
+class StageResult(
+    collections.namedtuple(
+        "StageResult",
+        ["stage", "examples", "tokens", "padded_tokens", "seconds"])):
+  """The number of examples and tokens a stage produced in `seconds`."""
+
+  @property
+  def examples_per_sec(self):
+    return self.examples / max(self.seconds, 1e-9)
+
+  @property
+  def tokens_per_sec(self):
+    return self.tokens / max(self.seconds, 1e-9)
+
+  @property
+  def padding_ratio(self):
+    if not self.padded_tokens:
+      return 0.0
+    return 1.0 - self.tokens / self.padded_tokens
+
+  @property
+  def usecs_per_example(self):
+    return 1e6 * self.seconds / max(self.examples, 1)
+
+
+def _token_counts(tensors):
+  """The number of tokens and of padded tokens of an example or a batch."""
+  tokens = tf.constant(0, dtype=tf.int64)
+  padded_tokens = tf.constant(0, dtype=tf.int64)
+  for name in ["source", "target"]:
+    if name + "_len" not in tensors:
+      continue
+    tokens += tf.to_int64(tf.reduce_sum(tensors[name + "_len"]))
+    for key in [name + "_ids", name + "_tokens"]:
+      if key in tensors:
+        padded_tokens += tf.to_int64(tf.size(tensors[key]))
+        break
+  return tokens, padded_tokens
+
+
+def _lookup(tensors, tables):
+  """Adds the ids of the tokens that have a vocabulary table."""
+  tensors = dict(tensors)
+  for name, table in tables.items():
+    if name + "_tokens" in tensors:
+      tensors[name + "_ids"] = table.lookup(tensors[name + "_tokens"])
+  return tensors
+
+
+def _lookup_tables(vocab_source, vocab_target):
+  tables = {}
+  for name, path in [("source", vocab_source), ("target", vocab_target)]:
+    if path:
+      tables[name] = vocab.create_vocabulary_lookup_table(path)[0]
+  return tables
+
+
+def _example_counts(tensors):
+  tokens, padded_tokens = _token_counts(tensors)
+  return tf.constant(1, dtype=tf.int64), tokens, padded_tokens
+
+
+def _sum_counts(counts):
+  return [tf.reduce_sum(_) for _ in counts]
+
+
+def _build_stage(stage, pipeline, tables, batch_size, bucket_boundaries,
+                 max_tokens_per_batch, max_length):
+  """Builds the counts of examples, tokens and padded tokens of one session
+  run of a stage, and the ops to run before the first one."""
+  if stage == "batch":
+    input_fn = training_utils.create_input_fn(
+        pipeline=pipeline,
+        batch_size=batch_size,
+        bucket_boundaries=bucket_boundaries,
+        allow_smaller_final_batch=True,
+        max_tokens_per_batch=max_tokens_per_batch,
+        max_length=max_length)
+    features, labels = input_fn()
+    batch = dict(features)
+    batch.update(labels or {})
+    batch = _lookup(batch, tables)
+    first_key = sorted(batch.keys())[0]
+    num_examples = tf.to_int64(tf.shape(batch[first_key])[0])
+    return [num_examples] + list(_token_counts(batch)), []
+
+  if stage == "read":
+    dataset = pipeline.make_record_dataset().map(
+        lambda *records: (tf.constant(1, dtype=tf.int64),
+                          tf.constant(0, dtype=tf.int64),
+                          tf.constant(0, dtype=tf.int64)))
+  elif pipeline.use_dataset:
+    dataset = pipeline.make_dataset().map(
+        lambda example: _example_counts(_lookup(example, tables)),
+        num_parallel_calls=pipeline.params["num_parallel_calls"])
+  else:
+    example = pipeline.read_from_data_provider(pipeline.make_data_provider())
+    counts = tf.train.batch(
+        list(_example_counts(_lookup(example, tables))),
+        batch_size=_EXAMPLES_PER_RUN,
+        allow_smaller_final_batch=True)
+    return _sum_counts(counts), []
+
+  # Lookup tables in the map functions require an initializable iterator
+  iterator = dataset.batch(_EXAMPLES_PER_RUN).make_initializable_iterator()
+  return _sum_counts(iterator.get_next()), [iterator.initializer]
+
+
+def _has_stage(stage, pipeline, vocab_source, vocab_target):
+  if stage == "read":
+    if not pipeline.use_dataset:
+      return False
+    try:
+      with tf.Graph().as_default():
+        pipeline.make_record_dataset()
+    except NotImplementedError:
+      return False
+    return True
+  if stage == "lookup":
+    return bool(vocab_source or vocab_target)
+  return True
+
+
+def run_stage(stage,
+              pipeline,
+              num_examples,
+              batch_size=32,
+              bucket_boundaries=None,
+              max_tokens_per_batch=None,
+              max_length=None,
+              vocab_source=None,
+              vocab_target=None):
+  """Reads about `num_examples` examples from one stage of a pipeline.
+
+  The first session run, which opens the files and fills the buffers, is
+  not timed. The batch stage and the lookup stage look up the tokens of
+  `vocab_source` and `vocab_target` if they are given.
+
+  Returns:
+    A `StageResult`.
+  """
+  if stage not in STAGES:
+    raise ValueError("Unknown stage {}, expected one of {}".format(
+        stage, STAGES))
+  with tf.Graph().as_default():
+    tables = {}
+    if stage in ["lookup", "batch"]:
+      tables = _lookup_tables(vocab_source, vocab_target)
+    counts, init_ops = _build_stage(stage, pipeline, tables, batch_size,
+                                    bucket_boundaries, max_tokens_per_batch,
+                                    max_length)
+    totals = [0, 0, 0]
+    with tf.train.MonitoredSession() as sess:
+      if init_ops:
+        sess.run(init_ops)
+      start = time.time()
+      try:
+        sess.run(counts)
+        start = time.time()
+        while totals[0] < num_examples:
+          totals = [a + b for a, b in zip(totals, sess.run(counts))]
+      except tf.errors.OutOfRangeError:
+        pass
+      seconds = time.time() - start
+  return StageResult(stage, totals[0], totals[1], totals[2], seconds)
+
+
+def benchmark(pipeline, num_examples, stages=None, **kwargs):
+  """Runs `run_stage` for every stage the pipeline supports.
+
+  Args:
+    pipeline: An `InputPipeline`.
+    num_examples: The number of examples read by every stage.
+    stages: The stages to run, defaults to all of `STAGES`. The lookup stage
+      needs a vocabulary, the read stage the dataset input_pipeline.
+    **kwargs: Passed to `run_stage`.
+
+  Returns:
+    A list of `StageResult`.
+  """
+  results = []
+  for stage in stages or STAGES:
+    if not _has_stage(stage, pipeline, kwargs.get("vocab_source"),
+                      kwargs.get("vocab_target")):
+      tf.logging.info("Skipping the %s stage", stage)
+      continue
+    results.append(run_stage(stage, pipeline, num_examples, **kwargs))
+  return results
+
+
+def format_results(results):
+  """Formats results as a table. The last column is the time per example
+  spent in a stage, i.e. the difference to the previous stage."""
+  lines = ["{:<8}{:>14}{:>14}{:>10}{:>12}{:>12}".format(
+      "stage", "examples/s", "tokens/s", "padding", "us/example",
+      "+us/example")]
+  previous = 0.0
+  for result in results:
+    lines.append("{:<8}{:>14.1f}{:>14.1f}{:>10.4f}{:>12.2f}{:>12.2f}".format(
+        result.stage, result.examples_per_sec, result.tokens_per_sec,
+        result.padding_ratio, result.usecs_per_example,
+        result.usecs_per_example - previous))
+    previous = result.usecs_per_example
+  return "\n".join(lines)
@@ -33,6 +33,9 @@ from tensorflow import gfile
 
 from seq2seq.contrib import rnn_cell
 
+# The dataset iterators whose state `hooks.InputPositionHook` saves
+INPUT_ITERATORS = "input_iterators"
+
 
 class TrainOptions(object):
   """A collection of options that are passed to the training script
@@ -231,10 +234,175 @@ def create_learning_rate_decay_fn(decay_type,
   return decay_fn
 
 
+def bucket_batch_sizes(bucket_boundaries, max_tokens_per_batch,
+                       num_sequences=2, max_length=None):
+  """Derives a batch size for each bucket such that the padded tokens of a
+  batch stay under a budget.
+
+  A bucket only contains sequences shorter than its boundary, so
+  `num_sequences` sequences padded to the boundary must fit into
+  `max_tokens_per_batch`. The last bucket has no upper bound and is sized
+  with `max_length`, the length the model truncates sequences to. Without
+  it the last bucket is sized with the last boundary, and only holds the
+  examples of exactly that length, see `create_input_fn`.
+
+  Args:
+    bucket_boundaries: int list, increasing non-negative numbers.
+    max_tokens_per_batch: The maximum number of padded tokens in a batch.
+    num_sequences: The number of sequences per example, 2 for source and
+      target.
+    max_length: The maximum length of a sequence after truncation.
+
+  Returns:
+    A list of `len(bucket_boundaries) + 1` batch sizes.
+  """
+  if not bucket_boundaries:
+    raise ValueError("max_tokens_per_batch requires bucket_boundaries")
+  if max_length is None:
+    lengths = list(bucket_boundaries) + [bucket_boundaries[-1]]
+  else:
+    lengths = [min(_, max_length) for _ in bucket_boundaries] + [max_length]
+  return [
+      max(1, max_tokens_per_batch // (num_sequences * max(1, length)))
+      for length in lengths
+  ]
+
+
+def _token_budget_length(features):
+  """The length that bounds the padded size of both source and target."""
+  if "target_len" in features:
+    return tf.maximum(features["source_len"], features["target_len"])
+  return features["source_len"]
+
+
+def _fits_token_budget(features, bucket_boundaries):
+  """Whether an example fits the size of the last bucket of a token budget
+  without a maximum length, see `bucket_batch_sizes`."""
+  return tf.less_equal(
+      _token_budget_length(features),
+      tf.constant(bucket_boundaries[-1], dtype=features["source_len"].dtype))
+
+
+def _padded_sequence(batch, name):
+  """The padded tokens or ids of the source or target, None if missing."""
+  for key in [name + "_tokens", name + "_ids"]:
+    if key in batch:
+      return batch[key]
+  return None
+
+
+def _add_batch_summaries(batch):
+  """Adds summaries of the number of real and padded tokens in a batch."""
+  source = _padded_sequence(batch, "source")
+  if "source_len" not in batch or source is None:
+    return
+  num_tokens = tf.reduce_sum(batch["source_len"])
+  num_padded_tokens = tf.size(source)
+  target = _padded_sequence(batch, "target")
+  if "target_len" in batch and target is not None:
+    num_tokens += tf.reduce_sum(batch["target_len"])
+    num_padded_tokens += tf.size(target)
+  num_tokens = tf.to_float(num_tokens)
+  num_padded_tokens = tf.to_float(num_padded_tokens)
+  tf.summary.scalar("batch_size", tf.shape(batch["source_len"])[0])
+  tf.summary.scalar("num_tokens", num_tokens)
+  tf.summary.scalar("num_padded_tokens", num_padded_tokens)
+  tf.summary.scalar("padding_ratio",
+                    1.0 - num_tokens / tf.maximum(num_padded_tokens, 1.0))
+
+
+def _dataset_bucket_id(length, bucket_boundaries):
+  """Returns the bucket of a length, using the same buckets as
+  `tf.contrib.training.bucket_by_sequence_length`."""
+  boundaries = tf.constant(bucket_boundaries, dtype=length.dtype)
+  return tf.reduce_sum(tf.to_int64(tf.greater_equal(length, boundaries)))
+
+
+def create_dataset_batch(pipeline,
+                         batch_size,
+                         bucket_boundaries=None,
+                         allow_smaller_final_batch=False,
+                         max_tokens_per_batch=None,
+                         max_length=None,
+                         save_position=False):
+  """Batches the examples of `pipeline.make_dataset()` and returns the
+  tensors of the next batch. This is the `tf.data` counterpart of the
+  batching queues used by `create_input_fn`. Pipelines that parse whole
+  batches provide them through `make_batched_dataset` instead.
+
+  If `save_position` is true the iterator is added to the `INPUT_ITERATORS`
+  collection and must be initialized by a `hooks.InputPositionHook`.
+  """
+  if pipeline.parses_batches:
+    dataset = pipeline.make_batched_dataset(batch_size)
+  else:
+    dataset = _batch_dataset(pipeline.make_dataset(), batch_size,
+                             bucket_boundaries, max_tokens_per_batch,
+                             max_length)
+
+  # Batches of a token budget have a different size in every bucket
+  fixed_batch_size = not allow_smaller_final_batch and not max_tokens_per_batch
+  if fixed_batch_size:
+    dataset = dataset.filter(
+        lambda batch: tf.equal(tf.shape(batch["source_len"])[0], batch_size))
+
+  dataset = dataset.prefetch(pipeline.params["prefetch_buffer_size"])
+  if save_position:
+    iterator = dataset.make_initializable_iterator()
+    tf.add_to_collection(INPUT_ITERATORS, iterator)
+  else:
+    iterator = dataset.make_one_shot_iterator()
+  batch = iterator.get_next()
+
+  if fixed_batch_size:
+    for tensor in batch.values():
+      tensor.set_shape([batch_size] + tensor.get_shape().as_list()[1:])
+
+  return pipeline.finish_batch(batch)
+
+
+def _batch_dataset(dataset, batch_size, bucket_boundaries,
+                   max_tokens_per_batch, max_length=None):
+  """Pads and batches a dataset of examples, bucketing them by length if
+  `bucket_boundaries` are given."""
+  padded_shapes = dataset.output_shapes
+
+  if max_tokens_per_batch:
+    batch_sizes = tf.constant(
+        bucket_batch_sizes(bucket_boundaries, max_tokens_per_batch,
+                           2 if "target_len" in padded_shapes else 1,
+                           max_length),
+        dtype=tf.int64)
+    if max_length is None:
+      dataset = dataset.filter(
+          lambda example: _fits_token_budget(example, bucket_boundaries))
+    bucket_length = _token_budget_length
+    window_size_func = lambda key: tf.gather(batch_sizes, key)
+  else:
+    bucket_length = lambda example: example["source_len"]
+    window_size_func = lambda _: tf.constant(batch_size, dtype=tf.int64)
+
+  if bucket_boundaries:
+    dataset = dataset.filter(lambda example: example["source_len"] >= 1)
+    dataset = dataset.apply(
+        tf.contrib.data.group_by_window(
+            key_func=lambda example: _dataset_bucket_id(
+                bucket_length(example), bucket_boundaries),
+            reduce_func=lambda key, window: window.padded_batch(
+                window_size_func(key), padded_shapes),
+            window_size_func=window_size_func))
+  else:
+    dataset = dataset.padded_batch(batch_size, padded_shapes)
+  return dataset
+
+
 def create_input_fn(pipeline,
                     batch_size,
                     bucket_boundaries=None,
                     allow_smaller_final_batch=False,
+                    max_tokens_per_batch=None,
+                    max_length=None,
+                    save_position=False,
                     scope=None):
   """Creates an input function that can be used with tf.learn estimators.
     Note that you must pass "factory funcitons" for both the data provider and
@@ -246,23 +414,73 @@ def create_input_fn(pipeline,
       reasonable number of batches in memory is created.
     bucket_boundaries: int list, increasing non-negative numbers.
       If None, no bucket is performed.
+    max_tokens_per_batch: If set, `batch_size` is ignored and every bucket
+      gets its own batch size so that the padded source and target tokens
+      of a batch stay under this budget, see `bucket_batch_sizes`. Examples
+      are bucketed by the longer of their source and target. Requires
+      `bucket_boundaries`.
+    max_length: The length the model truncates the source and target to,
+      which bounds the padded size of the last bucket of a token budget.
+      If None, examples longer than the last boundary are dropped instead.
+    save_position: If true, the state of the input (open files, read
+      offsets, shuffle buffers) can be saved and restored by a
+      `hooks.InputPositionHook`, which must then be used. Requires a
+      pipeline that `saves_position`.
 
   Returns:
     An input function that returns `(feature_batch, labels_batch)`
     tuples when called.
   """
+  if max_tokens_per_batch and not bucket_boundaries:
+    raise ValueError("max_tokens_per_batch requires bucket_boundaries")
+  if pipeline.use_dataset and pipeline.parses_batches and bucket_boundaries:
+    raise ValueError("Batches parsed by the input pipeline cannot be bucketed")
+  if save_position and not pipeline.saves_position:
+    raise ValueError("{} cannot save its position".format(
+        pipeline.__class__.__name__))
 
   def input_fn():
     """Creates features and labels.
     """
 
     with tf.variable_scope(scope or "input_fn"):
+      if pipeline.use_dataset:
+        batch = create_dataset_batch(
+            pipeline=pipeline,
+            batch_size=batch_size,
+            bucket_boundaries=bucket_boundaries,
+            allow_smaller_final_batch=allow_smaller_final_batch,
+            max_tokens_per_batch=max_tokens_per_batch,
+            max_length=max_length,
+            save_position=save_position)
+        _add_batch_summaries(batch)
+        return _split_features_and_labels(pipeline, batch)
+
       data_provider = pipeline.make_data_provider()
       features_and_labels = pipeline.read_from_data_provider(data_provider)
 
       # here batch get source_len, source_tokens, and(target_tokens, target_len), only pad source_tokens
       # because only source_tokens can variable len with None, fixed len in tf.paddingFIFOQueue is not padded
-      if bucket_boundaries:
+      if max_tokens_per_batch:
+        batch_sizes = bucket_batch_sizes(
+            bucket_boundaries, max_tokens_per_batch,
+            2 if "target_len" in features_and_labels else 1, max_length)
+        keep_input = features_and_labels["source_len"] >= 1
+        if max_length is None:
+          keep_input = tf.logical_and(
+              keep_input,
+              _fits_token_budget(features_and_labels, bucket_boundaries))
+        _, batch = tf.contrib.training.bucket_by_sequence_length(
+            input_length=_token_budget_length(features_and_labels),
+            bucket_boundaries=bucket_boundaries,
+            tensors=features_and_labels,
+            batch_size=batch_sizes,
+            keep_input=keep_input,
+            dynamic_pad=True,
+            capacity=5000 + 16 * max(batch_sizes),
+            allow_smaller_final_batch=allow_smaller_final_batch,
+            name="bucket_queue")
+      elif bucket_boundaries:
         _, batch = tf.contrib.training.bucket_by_sequence_length(
             input_length=features_and_labels["source_len"],
             bucket_boundaries=bucket_boundaries,
@@ -283,13 +501,18 @@ def create_input_fn(pipeline,
             allow_smaller_final_batch=allow_smaller_final_batch,
             name="batch_queue")
 
-      # Separate features and labels
-      features_batch = {k: batch[k] for k in pipeline.feature_keys}
-      if set(batch.keys()).intersection(pipeline.label_keys):
-        labels_batch = {k: batch[k] for k in pipeline.label_keys}
-      else:
-        labels_batch = None
-
-      return features_batch, labels_batch
+      _add_batch_summaries(batch)
+      return _split_features_and_labels(pipeline, batch)
 
   return input_fn
+
+
+def _split_features_and_labels(pipeline, batch):
+  """Separates a batch into features and labels. Labels are None if the
+  batch has none, e.g. during inference."""
+  features_batch = {k: batch[k] for k in pipeline.feature_keys}
+  if set(batch.keys()).intersection(pipeline.label_keys):
+    labels_batch = {k: batch[k] for k in pipeline.label_keys}
+  else:
+    labels_batch = None
+  return features_batch, labels_batch